@@ -0,0 +1,72 @@
+'''
+Micro-benchmark af create_dim_df ved mange forskellige id'er: den
+tidligere lambda med fallback-opslag pr. række (kvadratisk) sammenlignet
+med det vektoriserede map. Kontrollerer samtidig, at output er identisk.
+
+Kørsel:
+    python -m benchmarks.bench_create_dim_df [antal distinkte id'er ...]
+'''
+
+#######################################################################
+
+import random
+import sys
+import time
+from typing import Callable, List
+
+import pandas as pd
+
+from utils.create_dim_df import DICT_LOOKUP, create_dim_df
+
+#######################################################################
+
+def legacy_create_dim_df(
+    df: pd.DataFrame,
+    id_column_name: str,
+    label_column_name: str,
+    id_name: str = 'id',
+    label_name: str = 'label') -> pd.DataFrame:
+    '''Den oprindelige implementering med fallback-opslag pr. række.'''
+    dim_df = (
+        df[[id_column_name, label_column_name]]
+        .dropna(subset=[id_column_name])
+        .drop_duplicates(subset=[id_column_name])
+        .rename(columns={id_column_name: id_name, label_column_name: label_name}))
+    lookup_dict = DICT_LOOKUP.get(label_name)
+    if lookup_dict is not None:
+        dim_df[label_name] = dim_df[id_name].map(
+            lambda dim_id: lookup_dict.get(
+                dim_id,
+                dim_df.loc[dim_df[id_name] == dim_id, label_name].iloc[0]))
+    return dim_df
+
+def make_dim_source(distinct: int, seed: int = 42) -> pd.DataFrame:
+    '''
+    Danner et råt DataFrame med distinct forskellige id'er (to rækker
+    pr. id, enkelte NULL-id'er og id'er der rammer DICT_STATUS).
+    '''
+    rng = random.Random(seed)
+    ids: List[float] = [float(i) for i in range(1, distinct + 1)] * 2
+    ids += [None] * (distinct // 100)
+    rng.shuffle(ids)
+    labels = [None if dim_id is None else rng.choice([f'Label {int(dim_id)}', None]) for dim_id in ids]
+    return pd.DataFrame({'Status.Id': ids, 'Status': labels})
+
+def _time(func: Callable[[], pd.DataFrame]) -> float:
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+def run(sizes: List[int]) -> None:
+    print(f'{"ids":>8} {"før (s)":>10} {"efter (s)":>10} {"speed-up":>9}')
+    for n in sizes:
+        df = make_dim_source(n)
+        pd.testing.assert_frame_equal(
+            legacy_create_dim_df(df, 'Status.Id', 'Status', 'id', 'status'),
+            create_dim_df(df, 'Status.Id', 'Status', 'id', 'status'))
+        before = _time(lambda: legacy_create_dim_df(df, 'Status.Id', 'Status', 'id', 'status'))
+        after = _time(lambda: create_dim_df(df, 'Status.Id', 'Status', 'id', 'status'))
+        print(f'{n:>8} {before:>10.3f} {after:>10.4f} {before / after:>8.0f}x')
+
+if __name__ == '__main__':
+    run([int(arg) for arg in sys.argv[1:]] or [1_000, 5_000, 20_000])
@@ -0,0 +1,85 @@
+'''
+Benchmark af create_ticket_df: den tidligere implementering (cast til
+object kolonne for kolonne, .loc-maskering og where over hele frame)
+sammenlignet med den skemabaserede konvertering i én gennemgang.
+Måler tid og peak-hukommelse (tracemalloc) og kontrollerer, at
+værdierne er de samme.
+
+Kørsel:
+    python -m benchmarks.bench_create_ticket_df [antal rækker ...]
+'''
+
+#######################################################################
+
+import datetime
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable, List, Tuple
+
+import pandas as pd
+
+from benchmarks.synthetic import make_df
+from utils.create_ticket_df import TICKET_SCHEMA, create_ticket_df
+from utils.format_df import format_df
+
+#######################################################################
+
+def legacy_create_ticket_df(df: pd.DataFrame) -> pd.DataFrame:
+    '''Den oprindelige implementering (uden row_hash).'''
+    df = df.copy()
+    for col in ['CreatedDate', 'CloseDateTime', 'u_Opstart', 'u_Afslutning']:
+        df[col] = pd.to_datetime(df[col], errors='coerce')
+    df['open_days'] = (
+    df['CloseDateTime'].dt.normalize() - df['CreatedDate'].dt.normalize()).dt.days + 1
+    df['duration'] = (df['u_Afslutning'].dt.normalize() - df['u_Opstart'].dt.normalize()).dt.days + 1
+    df['queue_days'] = (df['u_Opstart'].dt.normalize() - df['CreatedDate'].dt.normalize()).dt.days
+    ticket_df = df.rename(columns={
+        source: name for name, (source, _) in TICKET_SCHEMA.items() if source is not None})
+    ticket_df = ticket_df[list(TICKET_SCHEMA)]
+    for col in ['agent_group_id', 'task_status_id', 'task_type_id', 'task_area_id', 'reason_for_rejection_id']:
+        ticket_df[col] = ticket_df[col].astype('object')
+        ticket_df.loc[ticket_df[col] == 0, col] = None
+        ticket_df.loc[ticket_df[col].isna(), col] = None
+    for col in ['open_days', 'queue_days', 'duration', 'created_date', 'closed_date', 'start_date', 'end_date']:
+        ticket_df[col] = ticket_df[col].astype('object')
+        ticket_df.loc[ticket_df[col].isna(), col] = None
+    return ticket_df.where(ticket_df.notna(), None)
+
+def _normalize(value: Any) -> Any:
+    '''Gør værdier fra de to implementeringer sammenlignelige.'''
+    if value is None or (isinstance(value, float) and value != value):
+        return None
+    if isinstance(value, pd.Timestamp):
+        return value.date()
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, datetime.date):
+        return value
+    return value
+
+def _measure(func: Callable[[pd.DataFrame], pd.DataFrame], df: pd.DataFrame) -> Tuple[float, float]:
+    '''Tid uden tracemalloc og peak-hukommelse med, i to separate kørsler.'''
+    start = time.perf_counter()
+    func(df)
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    func(df)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak / 1024 / 1024
+
+def run(sizes: List[int]) -> None:
+    print(f'{"rækker":>8} {"før (s)":>9} {"efter (s)":>10} {"før (MiB)":>10} {"efter (MiB)":>12}')
+    for n in sizes:
+        df = format_df(make_df(n))
+        before_df = legacy_create_ticket_df(df)
+        after_df = create_ticket_df(df)
+        for col in TICKET_SCHEMA:
+            assert [_normalize(v) for v in before_df[col]] == [_normalize(v) for v in after_df[col]], col
+        before_s, before_mb = _measure(legacy_create_ticket_df, df)
+        after_s, after_mb = _measure(create_ticket_df, df)
+        print(f'{n:>8} {before_s:>9.3f} {after_s:>10.3f} {before_mb:>10.1f} {after_mb:>12.1f}')
+
+if __name__ == '__main__':
+    run([int(arg) for arg in sys.argv[1:]] or [10_000, 50_000])
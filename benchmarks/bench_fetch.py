@@ -0,0 +1,76 @@
+'''
+Belastnings- og robusthedstest af hentestien mod den falske NSP-server
+(benchmarks/fake_nsp.py): sekventiel sidehentning (api_fetch_pages) og
+parallel backfill i tidsvinduer (api_fetch_windows), med valgfri
+latens, fejlrate, 429'ere og langsom streaming. Kontrollerer, at alle
+tickets hentes trods injicerede fejl, og udskriver rækker/s og svar pr.
+statuskode.
+
+Kørsel:
+    python -m benchmarks.bench_fetch [--rows 20000] [--page-size 1000]
+        [--workers 4] [--latency 0.05] [--error-rate 0.05]
+        [--throttle-rate 0.05] [--stream-rate 0] [--no-gzip]
+'''
+
+#######################################################################
+
+import argparse
+import time
+
+from benchmarks.fake_nsp import start_fake_nsp
+from benchmarks.synthetic import EPOCH
+from utils import nsp_client
+from utils.api_fetch import api_fetch_pages
+from utils.api_fetch_parallel import api_fetch_windows
+from utils.nsp_client import NspClient
+
+#######################################################################
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=20_000)
+    parser.add_argument('--page-size', type=int, default=1000)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--window-hours', type=int, default=24 * 14)
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--error-rate', type=float, default=0.05)
+    parser.add_argument('--throttle-rate', type=float, default=0.05)
+    parser.add_argument('--retry-after', type=float, default=0.1)
+    parser.add_argument('--stream-rate', type=int, default=0)
+    parser.add_argument('--no-gzip', action='store_true')
+    args = parser.parse_args()
+
+    server, nsp, url = start_fake_nsp(
+        rows=args.rows,
+        latency=args.latency,
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate,
+        retry_after=args.retry_after,
+        stream_rate=args.stream_rate,
+        use_gzip=not args.no_gzip)
+    nsp_client._client = NspClient(url=url, api_key='bench', retries=10, backoff=0.05, backoff_max=1.0)
+    timestamp = EPOCH.strftime('%Y-%m-%dT%H:%M:%SZ')
+    try:
+        print(f'{"metode":<22} {"rækker":>8} {"tid (s)":>9} {"rækker/s":>10}')
+
+        started = time.perf_counter()
+        rows = sum(len(df) for df in api_fetch_pages(timestamp, page_size=args.page_size))
+        elapsed = time.perf_counter() - started
+        assert rows == args.rows, (rows, args.rows)
+        print(f'{"api_fetch_pages":<22} {rows:>8} {elapsed:>9.2f} {rows / elapsed:>10.0f}')
+
+        started = time.perf_counter()
+        rows = sum(len(df) for df in api_fetch_windows(
+            timestamp, workers=args.workers, window_hours=args.window_hours))
+        elapsed = time.perf_counter() - started
+        assert rows == args.rows, (rows, args.rows)
+        label = f'api_fetch_windows x{args.workers}'
+        print(f'{label:<22} {rows:>8} {elapsed:>9.2f} {rows / elapsed:>10.0f}')
+    finally:
+        server.shutdown()
+        nsp_client._client.close()
+        nsp_client._client = None
+    print(f'Svar pr. statuskode: {dict(sorted(nsp.stats.items()))}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+'''
+Benchmark af datoparsing i format_df: den tidligere løkke med ét
+pd.to_datetime-kald pr. værdi sammenlignet med den vektoriserede
+parse_dates. Kontrollerer samtidig, at output er identisk.
+
+Kørsel:
+    python -m benchmarks.bench_format_df [antal rækker ...]
+'''
+
+#######################################################################
+
+import sys
+import time
+from typing import Callable, List
+
+import pandas as pd
+
+from benchmarks.synthetic import make_df
+from config import DATE_FORMAT, TIMEZONE
+from utils.format_df import DATE_COLS, parse_dates
+
+#######################################################################
+
+def legacy_format_dates(df: pd.DataFrame) -> pd.DataFrame:
+    '''Den oprindelige per-værdi-implementering fra format_df.'''
+    df = df.copy()
+    for col in DATE_COLS:
+        raw = df[col].astype('string').str.strip()
+        parsed_values = []
+        for value in raw:
+            if value is pd.NA or value == '':
+                parsed_values.append(pd.NaT)
+            else:
+                parsed_values.append(
+                    pd.to_datetime(value, errors='coerce', utc=True))
+        dt = pd.Series(parsed_values, index=df.index)
+        dt = dt.dt.tz_convert(TIMEZONE)
+        df[col] = dt.dt.strftime(DATE_FORMAT)
+    return df
+
+def vectorized_format_dates(df: pd.DataFrame) -> pd.DataFrame:
+    '''Datodelen af format_df med parse_dates.'''
+    df = df.copy()
+    for col in DATE_COLS:
+        df[col] = parse_dates(df[col]).dt.tz_convert(TIMEZONE).dt.strftime(DATE_FORMAT)
+    return df
+
+def _time(func: Callable[[pd.DataFrame], pd.DataFrame], df: pd.DataFrame) -> float:
+    start = time.perf_counter()
+    func(df)
+    return time.perf_counter() - start
+
+def run(sizes: List[int]) -> None:
+    print(f'{"rækker":>8} {"før (s)":>10} {"efter (s)":>10} {"speed-up":>9}')
+    for n in sizes:
+        df = make_df(n)
+        pd.testing.assert_frame_equal(legacy_format_dates(df), vectorized_format_dates(df))
+        before = _time(legacy_format_dates, df)
+        after = _time(vectorized_format_dates, df)
+        print(f'{n:>8} {before:>10.3f} {after:>10.3f} {before / after:>8.1f}x')
+
+if __name__ == '__main__':
+    run([int(arg) for arg in sys.argv[1:]] or [1_000, 10_000, 100_000])
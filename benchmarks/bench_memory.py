@@ -0,0 +1,114 @@
+'''
+Kontrol af hukommelsesloftet i den hukommelsesbegrænsede tilstand
+(BATCH_ROWS > 0). Kører én fuld ETL-cyklus (main.main) med backfill fra
+TIMESTAMP_FALLBACK mod den falske NSP-server (benchmarks/fake_nsp.py) og
+en tom SQLite-database for hver datasætstørrelse, i en separat proces pr.
+kørsel, og måler processens peak RSS. Den falske server kører i denne
+proces, så dens datasæt ikke tæller med.
+
+Kørslerne laves både uden (standard) og med BATCH_ROWS. Vokser peak RSS i
+den begrænsede tilstand mere end --tolerance fra mindste til største
+datasæt, eller overstiger den --max-rss-mb, afsluttes med exit-kode 1.
+
+Kørsel:
+    python -m benchmarks.bench_memory [--rows 10000 40000] [--batch-rows 500]
+        [--page-size 1000] [--workers 4] [--tolerance 0.15] [--max-rss-mb 0]
+'''
+
+#######################################################################
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from typing import Dict, List, Optional
+
+from benchmarks.fake_nsp import start_fake_nsp
+
+#######################################################################
+
+MIB = 1024 * 1024
+
+def _child() -> None:
+    '''Kører én cyklus med miljøet fra forælderen og udskriver rækker og peak RSS som JSON.'''
+    from main import main as run_cycle
+    from utils.get_engine import get_engine
+    from utils.metrics import peak_rss_bytes
+
+    result = run_cycle(get_engine())
+    print(json.dumps({'rows': result['rows'], 'peak_rss_bytes': peak_rss_bytes()}))
+
+def _measure(rows: int, batch_rows: int, page_size: int, workers: int, directory: str) -> Dict[str, int]:
+    '''Starter den falske server med rows tickets og måler én cyklus i en ny proces.'''
+    server, _, url = start_fake_nsp(rows=rows, use_gzip=False)
+    db_path = os.path.join(directory, f'memory_{rows}_{batch_rows}.db')
+    env = {
+        **os.environ,
+        'API_URL': url,
+        'API_KEY': 'bench',
+        'DB_URL': f'sqlite:///{db_path}',
+        'PAGE_SIZE': str(page_size),
+        'FETCH_WORKERS': str(workers),
+        'BATCH_ROWS': str(batch_rows),
+        'PAGE_STORE_DIR': '',
+        'PARQUET_DIR': '',
+        'METRICS_PORT': '0',
+        'METRICS_FILE': ''}
+    try:
+        completed = subprocess.run(
+            [sys.executable, '-m', 'benchmarks.bench_memory', '--child'],
+            env=env, capture_output=True, text=True, check=True)
+    except subprocess.CalledProcessError as exc:
+        sys.stderr.write(exc.stderr)
+        raise
+    finally:
+        server.shutdown()
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    if result['rows'] != rows:
+        raise RuntimeError(f'{result["rows"]} af {rows} tickets behandlet')
+    return result
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, nargs='+', default=[10_000, 40_000], help='datasætstørrelser')
+    parser.add_argument('--batch-rows', type=int, default=500, help='BATCH_ROWS i den begrænsede tilstand')
+    parser.add_argument('--page-size', type=int, default=1000)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--tolerance', type=float, default=0.15, help='tilladt relativ vækst i peak RSS')
+    parser.add_argument('--max-rss-mb', type=float, default=0, help='absolut loft i MiB (0 = intet)')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        _child()
+        return 0
+
+    sizes = sorted(args.rows)
+    peaks: Dict[str, List[float]] = {}
+    print(f'{"tilstand":<12} {"rækker":>8} {"peak RSS (MiB)":>15}')
+    with tempfile.TemporaryDirectory() as directory:
+        for mode, batch_rows in (('standard', 0), ('begrænset', args.batch_rows)):
+            peaks[mode] = []
+            for rows in sizes:
+                result = _measure(rows, batch_rows, args.page_size, args.workers, directory)
+                peak = result['peak_rss_bytes'] / MIB
+                peaks[mode].append(peak)
+                print(f'{mode:<12} {rows:>8} {peak:>15.1f}')
+
+    failures: List[str] = []
+    bounded = peaks['begrænset']
+    growth = bounded[-1] / bounded[0] - 1
+    print(f'\nVækst i peak RSS fra {sizes[0]} til {sizes[-1]} rækker: '
+          f'standard {peaks["standard"][-1] / peaks["standard"][0] - 1:+.0%}, begrænset {growth:+.0%}')
+    if len(sizes) > 1 and growth > args.tolerance:
+        failures.append(f'peak RSS voksede {growth:+.0%} (tilladt {args.tolerance:+.0%})')
+    if args.max_rss_mb and max(bounded) > args.max_rss_mb:
+        failures.append(f'peak RSS {max(bounded):.1f} MiB over loftet på {args.max_rss_mb:.1f} MiB')
+    for failure in failures:
+        print(f'FEJL: {failure}')
+    return 1 if failures else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
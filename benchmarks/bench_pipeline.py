@@ -0,0 +1,62 @@
+'''
+Benchmark af pipeline-tilstanden i main: sekventiel kørsel (hent, transformér,
+skriv én side ad gangen) sammenlignet med run_pipeline, hvor trinnene kører
+samtidigt. Transformationen er den rigtige (prepare_page), mens hentning og
+skrivning simuleres med faste ventetider pr. side i stedet for NSP og SQL.
+
+Kørsel:
+    python -m benchmarks.bench_pipeline [sider] [rækker pr. side] [hent (s)] [skriv (s)]
+'''
+
+#######################################################################
+
+import sys
+import time
+from typing import Any, Iterator, List
+
+import pandas as pd
+
+from benchmarks.synthetic import make_df
+from utils.prepare_page import prepare_page
+from utils.run_pipeline import run_pipeline
+
+#######################################################################
+
+def fake_pages(pages: int, rows: int, fetch_s: float) -> Iterator[pd.DataFrame]:
+    '''Yielder syntetiske sider med en simuleret netværksventetid.'''
+    for page in range(pages):
+        time.sleep(fetch_s)
+        yield make_df(rows, seed=page, start_id=page * rows + 1)
+
+def fake_write(frames: Any, write_s: float) -> None:
+    '''Simuleret SQL-skrivning.'''
+    time.sleep(write_s)
+
+def run(pages: int, rows: int, fetch_s: float, write_s: float) -> None:
+    start = time.perf_counter()
+    transform_s = 0.0
+    for item in enumerate(fake_pages(pages, rows, fetch_s), start=1):
+        started = time.perf_counter()
+        _, _, _, frames = prepare_page(item)
+        transform_s += time.perf_counter() - started
+        fake_write(frames, write_s)
+    sequential_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    prepared = run_pipeline(enumerate(fake_pages(pages, rows, fetch_s), start=1), [prepare_page], 2)
+    for _, _, _, frames in prepared:
+        fake_write(frames, write_s)
+    pipeline_s = time.perf_counter() - start
+
+    slowest = max(fetch_s, transform_s / pages, write_s) * pages
+    print(f'{pages} sider á {rows} rækker, hent {fetch_s}s, transformér {transform_s / pages:.3f}s, skriv {write_s}s pr. side')
+    print(f'sekventiel: {sequential_s:.2f} s')
+    print(f'pipeline:   {pipeline_s:.2f} s (langsomste trin alene: {slowest:.2f} s)')
+
+if __name__ == '__main__':
+    args: List[str] = sys.argv[1:]
+    run(
+        int(args[0]) if len(args) > 0 else 10,
+        int(args[1]) if len(args) > 1 else 1000,
+        float(args[2]) if len(args) > 2 else 0.3,
+        float(args[3]) if len(args) > 3 else 0.3)
@@ -0,0 +1,60 @@
+'''
+Benchmark af parameterforberedelsen til staging-indlæsningen: én dict
+pr. række via iterrows (den oprindelige skrivesti), df.to_dict('records')
+og den kolonnebaserede to_params. Måler kun Python-siden (ingen
+database) og kontrollerer, at alle tre giver de samme værdier.
+
+Kørsel:
+    python -m benchmarks.bench_to_params [antal rækker ...]
+'''
+
+#######################################################################
+
+import sys
+import time
+from typing import Any, Callable, Dict, List
+
+import pandas as pd
+
+from benchmarks.synthetic import make_df
+from utils.create_ticket_df import create_ticket_df
+from utils.format_df import format_df
+from utils.to_params import to_params
+
+#######################################################################
+
+def legacy_params(df: pd.DataFrame) -> List[Dict[str, Any]]:
+    '''Den oprindelige skrivesti: row.to_dict() pr. række i iterrows.'''
+    return [row.to_dict() for _, row in df.iterrows()]
+
+def records_params(df: pd.DataFrame) -> List[Dict[str, Any]]:
+    '''Den hidtidige staging-indlæsning: df.to_dict('records').'''
+    return df.to_dict('records')
+
+def _measure(func: Callable[[pd.DataFrame], Any], df: pd.DataFrame, repeat: int = 3) -> float:
+    '''Bedste tid over repeat kørsler.'''
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(df)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def run(sizes: List[int]) -> None:
+    print(f'{"rækker":>8} {"iterrows (s)":>13} {"records (s)":>12} {"to_params (s)":>14} {"faktor":>7}')
+    for n in sizes:
+        ticket_df = create_ticket_df(format_df(make_df(n)))
+        columns = list(ticket_df.columns)
+        expected = [tuple(row[c] for c in columns) for row in records_params(ticket_df)]
+        params = to_params(ticket_df)
+        assert params == expected
+        assert all(type(v).__module__ in ('builtins', 'datetime') for v in params[0])
+        legacy_s = _measure(legacy_params, ticket_df, repeat=1)
+        records_s = _measure(records_params, ticket_df)
+        params_s = _measure(to_params, ticket_df)
+        print(
+            f'{n:>8} {legacy_s:>13.3f} {records_s:>12.3f} {params_s:>14.3f} '
+            f'{legacy_s / params_s:>6.0f}x')
+
+if __name__ == '__main__':
+    run([int(arg) for arg in sys.argv[1:]] or [10_000, 50_000])
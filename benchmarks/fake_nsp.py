@@ -0,0 +1,390 @@
+'''
+Lokal stand-in for NSP-API'et til belastnings- og latenstest af
+hentestien uden netværk. Serverer et seedet syntetisk datasæt
+(benchmarks/synthetic.py) med samme request-kontrakt som api_fetch:
+entityType, columns, filters (logic + field/operator/value), sort
+(field + dir), page og pageSize. Svaret er {"Data": [...]}.
+
+Fejl og forsinkelser kan injiceres:
+    --latency / --jitter   ventetid før svar (sekunder)
+    --error-rate           andel af kald der svarer 503
+    --throttle-rate        andel af kald der svarer 429 med Retry-After
+    --retry-after          værdien af Retry-After (sekunder)
+    --stream-rate          max bytes/s for body (langsom streaming)
+    --api-key              kræv x-api-key
+
+gzip bruges, når klienten sender Accept-Encoding: gzip (kan slås fra
+med --no-gzip).
+
+Kørsel:
+    python -m benchmarks.fake_nsp [--port 8080] [--rows 50000] [...]
+    API_URL=http://localhost:8080/ python main.py
+'''
+
+#######################################################################
+
+import argparse
+import datetime
+import gzip
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from benchmarks.synthetic import make_records
+
+#######################################################################
+
+DATE_FIELDS = ('CreatedDate', 'CloseDateTime', 'u_Opstart', 'u_Afslutning', 'UpdatedDate')
+ALWAYS_COLUMNS = ('Id', 'EntityType')
+STREAM_CHUNK = 16 * 1024
+
+def _parse_date(value: Any) -> Optional[datetime.datetime]:
+    if not value:
+        return None
+    parsed = datetime.datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=datetime.timezone.utc)
+
+def _field_value(record: Dict[str, Any], field: str) -> Any:
+    '''Slår field op i record; 'X.GroupName' falder tilbage til label-feltet X.'''
+    if field in record:
+        return record[field]
+    base, _, attribute = field.rpartition('.')
+    if attribute in ('GroupName', 'Name', 'Label') and base in record:
+        return record[base]
+    return None
+
+def _compare(operator: str, value: Any, target: Any) -> bool:
+    if operator == 'eq':
+        return value == target
+    if operator == 'neq':
+        return value != target
+    if operator == 'in':
+        return value in target
+    if operator == 'isnull':
+        return value is None or value == ''
+    if operator == 'isnotnull':
+        return not (value is None or value == '')
+    if value is None or target is None:
+        return False
+    if operator == 'gte':
+        return value >= target
+    if operator == 'gt':
+        return value > target
+    if operator == 'lte':
+        return value <= target
+    if operator == 'lt':
+        return value < target
+    raise ValueError(f'Ukendt operator: {operator}')
+
+def build_filter(spec: Dict[str, Any]) -> Callable[[Dict[str, Any]], bool]:
+    '''
+    Beskrivelse:
+        Oversætter et NSP-filter (evt. indlejret med logic) til en
+        prædikatfunktion over rå ticket-dicts.
+
+    Flow:
+        1. Har spec 'filters', kombineres delfiltrene med logic
+           ('and' eller 'or').
+        2. Ellers sammenlignes field med value via operator. Datofelter
+           sammenlignes som tidspunkter, ikke som tekst.
+
+    Args:
+        spec:
+            Filter fra payload, fx {'logic': 'and', 'filters': [...]}.
+
+    Returns:
+        Callable[[Dict[str, Any]], bool]:
+            Prædikat der er True for rækker, der matcher.
+
+    Raises:
+        ValueError:
+            Hvis logic eller operator er ukendt.
+    '''
+    if 'filters' in spec:
+        parts = [build_filter(part) for part in spec['filters']]
+        logic = spec.get('logic', 'and')
+        if logic == 'and':
+            return lambda record: all(part(record) for part in parts)
+        if logic == 'or':
+            return lambda record: any(part(record) for part in parts)
+        raise ValueError(f'Ukendt logic: {logic}')
+
+    field = spec['field']
+    operator = spec.get('operator', 'eq')
+    target = spec.get('value')
+    if field in DATE_FIELDS and operator not in ('isnull', 'isnotnull'):
+        target = _parse_date(target)
+        return lambda record: _compare(operator, record['_dates'].get(field), target)
+    return lambda record: _compare(operator, _field_value(record, field), target)
+
+def sort_records(records: List[Dict[str, Any]], sort: Optional[List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    '''
+    Beskrivelse:
+        Sorterer rækker efter en NSP-sortering, fx
+        [{'field': 'ReferenceNo', 'dir': 'asc'}].
+
+    Flow:
+        1. Sorterer stabilt på hvert felt bagfra, så første felt afgør
+           rækkefølgen. Datofelter sammenlignes som tidspunkter, og
+           tomme værdier kommer først.
+        2. Uden sort bevares datasættets rækkefølge (ReferenceNo).
+
+    Args:
+        records:
+            Rækker der matcher filteret.
+        sort:
+            Sortering fra payload, eller None.
+
+    Returns:
+        List[Dict[str, Any]]:
+            De sorterede rækker.
+
+    Raises:
+        ValueError:
+            Hvis dir er ukendt.
+    '''
+    for spec in reversed(sort or []):
+        field = spec['field']
+        direction = spec.get('dir', 'asc')
+        if direction not in ('asc', 'desc'):
+            raise ValueError(f'Ukendt dir: {direction}')
+        if field in DATE_FIELDS:
+            key = lambda record, field=field: (record['_dates'].get(field) is not None, record['_dates'].get(field))
+        else:
+            key = lambda record, field=field: (_field_value(record, field) is not None, _field_value(record, field))
+        records = sorted(records, key=key, reverse=direction == 'desc')
+    return records
+
+class FakeNsp:
+    '''
+    Beskrivelse:
+        Datasæt og fejlinjektion for den falske NSP-server. Deles af alle
+        request-tråde og tæller kald pr. statuskode.
+
+    Args:
+        rows:
+            Antal syntetiske tickets.
+        seed:
+            Seed til datasæt og fejlinjektion.
+        latency, jitter:
+            Fast og tilfældig (0..jitter) ventetid før svar i sekunder.
+        error_rate:
+            Andel af kald der svarer 503.
+        throttle_rate:
+            Andel af kald der svarer 429 med Retry-After.
+        retry_after:
+            Værdien af Retry-After i sekunder.
+        stream_rate:
+            Max bytes/s for body, eller 0 for ubegrænset.
+        api_key:
+            Påkrævet x-api-key, eller None.
+        use_gzip:
+            Om body gzip-komprimeres, når klienten accepterer det.
+    '''
+
+    def __init__(
+        self,
+        rows: int = 50_000,
+        seed: int = 42,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        throttle_rate: float = 0.0,
+        retry_after: float = 1.0,
+        stream_rate: int = 0,
+        api_key: Optional[str] = None,
+        use_gzip: bool = True) -> None:
+        self.records = make_records(rows, seed)
+        for record in self.records:
+            record['_dates'] = {field: _parse_date(record.get(field)) for field in DATE_FIELDS}
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.stream_rate = stream_rate
+        self.api_key = api_key
+        self.use_gzip = use_gzip
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats: Dict[int, int] = {}
+
+    def count(self, status: int) -> None:
+        with self.lock:
+            self.stats[status] = self.stats.get(status, 0) + 1
+
+    def update(self, reference_no: int, **fields: Any) -> None:
+        '''Ændrer felter på en ticket (fx UpdatedDate), som om den blev opdateret i NSP.'''
+        record = next(record for record in self.records if record['ReferenceNo'] == reference_no)
+        record.update(fields)
+        record['_dates'] = {field: _parse_date(record.get(field)) for field in DATE_FIELDS}
+
+    def fault(self) -> Optional[int]:
+        '''Trækker en injiceret fejl (429 eller 503) eller None.'''
+        with self.lock:
+            draw = self.random.random()
+            delay = self.latency + self.random.uniform(0, self.jitter)
+        time.sleep(delay)
+        if draw < self.throttle_rate:
+            return 429
+        if draw < self.throttle_rate + self.error_rate:
+            return 503
+        return None
+
+    def query(self, payload: Dict[str, Any]) -> List[Dict[str, Any]]:
+        '''
+        Beskrivelse:
+            Udfører en NSP-forespørgsel mod datasættet.
+
+        Flow:
+            1. Kræver entityType 'Ticket'.
+            2. Filtrerer med build_filter og sorterer efter payloadens
+               sort via sort_records (uden sort på ReferenceNo).
+            3. Vælger siden ud fra page (1-indekseret) og pageSize.
+            4. Projicerer hver række til de ønskede kolonner, inkl.
+               relaterede '<kolonne>.<felt>'-nøgler (fx AgentGroup.Id)
+               og Id/EntityType.
+
+        Args:
+            payload:
+                Den afkodede request-body.
+
+        Returns:
+            List[Dict[str, Any]]:
+                Rækkerne på siden.
+
+        Raises:
+            ValueError:
+                Hvis payload er ugyldig.
+        '''
+        if payload.get('entityType') != 'Ticket':
+            raise ValueError(f'Ukendt entityType: {payload.get("entityType")}')
+        page = int(payload.get('page', 1))
+        page_size = int(payload.get('pageSize', 100))
+        if page < 1 or page_size < 1:
+            raise ValueError('page og pageSize skal være positive')
+        predicate = build_filter(payload['filters']) if payload.get('filters') else (lambda record: True)
+        matches = sort_records(
+            [record for record in self.records if predicate(record)], payload.get('sort'))
+        selected = matches[(page - 1) * page_size:page * page_size]
+
+        columns = payload.get('columns')
+        if not columns:
+            return [{k: v for k, v in record.items() if k != '_dates'} for record in selected]
+        keys = [key for key in self.records[0] if key in ALWAYS_COLUMNS or any(
+            key == column or key.startswith(f'{column}.') for column in columns)] if self.records else []
+        return [{key: record.get(key) for key in keys} for record in selected]
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    nsp: FakeNsp
+
+    def _reply(self, status: int, body: bytes, headers: Optional[Dict[str, str]] = None) -> None:
+        self.nsp.count(status)
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.nsp.stream_rate > 0:
+            for start in range(0, len(body), STREAM_CHUNK):
+                chunk = body[start:start + STREAM_CHUNK]
+                self.wfile.write(chunk)
+                self.wfile.flush()
+                time.sleep(len(chunk) / self.nsp.stream_rate)
+        else:
+            self.wfile.write(body)
+
+    def do_POST(self) -> None:
+        payload_bytes = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if self.nsp.api_key is not None and self.headers.get('x-api-key') != self.nsp.api_key:
+            self._reply(401, b'{"error": "unauthorized"}')
+            return
+        fault = self.nsp.fault()
+        if fault == 429:
+            self._reply(429, b'{"error": "too many requests"}', {'Retry-After': f'{self.nsp.retry_after:g}'})
+            return
+        if fault is not None:
+            self._reply(fault, b'{"error": "injected failure"}')
+            return
+        try:
+            rows = self.nsp.query(json.loads(payload_bytes))
+        except (ValueError, KeyError, TypeError) as exc:
+            self._reply(400, json.dumps({'error': str(exc)}).encode('utf-8'))
+            return
+        body = json.dumps({'Data': rows}, ensure_ascii=False).encode('utf-8')
+        headers = {}
+        if self.nsp.use_gzip and 'gzip' in self.headers.get('Accept-Encoding', ''):
+            body = gzip.compress(body, compresslevel=5)
+            headers['Content-Encoding'] = 'gzip'
+        self._reply(200, body, headers)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+def start_fake_nsp(port: int = 0, **options: Any) -> Tuple[ThreadingHTTPServer, FakeNsp, str]:
+    '''
+    Beskrivelse:
+        Starter den falske NSP-server i en daemon-tråd.
+
+    Args:
+        port:
+            TCP-port, eller 0 for en ledig port.
+        **options:
+            Nøgleord til FakeNsp.
+
+    Returns:
+        Tuple[ThreadingHTTPServer, FakeNsp, str]:
+            Serveren (stop med shutdown()), datasættet og URL'en.
+
+    Raises:
+        OSError:
+            Hvis porten ikke kan bindes.
+    '''
+    nsp = FakeNsp(**options)
+    handler = type('FakeNspHandler', (_Handler,), {'nsp': nsp})
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='fake-nsp', daemon=True).start()
+    return server, nsp, f'http://127.0.0.1:{server.server_address[1]}/'
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--rows', type=int, default=50_000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--throttle-rate', type=float, default=0.0)
+    parser.add_argument('--retry-after', type=float, default=1.0)
+    parser.add_argument('--stream-rate', type=int, default=0)
+    parser.add_argument('--api-key')
+    parser.add_argument('--no-gzip', action='store_true')
+    args = parser.parse_args()
+    server, nsp, url = start_fake_nsp(
+        args.port,
+        rows=args.rows,
+        seed=args.seed,
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate,
+        retry_after=args.retry_after,
+        stream_rate=args.stream_rate,
+        api_key=args.api_key,
+        use_gzip=not args.no_gzip)
+    print(f'Falsk NSP kører på {url} med {len(nsp.records)} tickets (Ctrl+C stopper)')
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+        print(f'Svar pr. statuskode: {nsp.stats}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,228 @@
+'''
+Samlet benchmark-harness for pipelinen. Genererer syntetiske NSP-svar
+(benchmarks/synthetic.py) i de angivne størrelser, måler hvert trin og
+hele cyklusser, gemmer resultaterne som JSON og sammenligner dem med en
+tidligere kørsel. Hvis et trin er blevet mere end --threshold langsommere
+end baseline, afsluttes med exit-kode 1.
+
+Trin:
+    json_decode       parse_records over svarbody i CHUNK_SIZE-chunks
+    format_df         format_df
+    create_dim_df     de fem dimensionstabeller
+    create_ticket_df  create_ticket_df
+    to_params         parametre til staging-indlæsningen
+    write_to_sql      write_sql_frames mod databasen (kun med --db)
+    cycle             hele cyklussen side for side (PAGE_SIZE rækker pr.
+                      side): decode, format, dimensioner/tickets og
+                      (med --db) skrivning
+
+Med --db bruges get_engine(), dvs. DB_URL eller DB_*-variablerne, og
+ensure_schema køres først (på PostgreSQL og SQLite oprettes tabellerne,
+fx DB_URL=sqlite:///bench.db). Brug en lokal testdatabase: syntetiske
+tickets upsertes med ReferenceNo fra 1. Ved gentagelser måles altså
+upsert af uændrede rækker efter første kørsel.
+
+Kørsel:
+    python -m benchmarks.run [--rows 10000 50000] [--repeat 3] [--db]
+                             [--output resultater.json]
+                             [--baseline baseline.json] [--threshold 0.2]
+'''
+
+#######################################################################
+
+import argparse
+import datetime
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import pandas as pd
+
+from benchmarks.synthetic import make_response_body
+from config import PAGE_SIZE
+from utils.create_dim_df import create_dim_df
+from utils.create_ticket_df import create_ticket_df
+from utils.format_df import format_df
+from utils.parse_response import CHUNK_SIZE, parse_records
+from utils.to_params import to_params
+from utils.write_to_sql import prepare_sql_frames, write_sql_frames
+
+#######################################################################
+
+MIN_DIFF_SECONDS = 0.005
+
+def _chunks(body: bytes) -> List[bytes]:
+    return [body[i:i + CHUNK_SIZE] for i in range(0, len(body), CHUNK_SIZE)]
+
+def _dims(df: pd.DataFrame) -> None:
+    create_dim_df(df, 'AgentGroup.Id', 'AgentGroup', 'id', 'group')
+    create_dim_df(df, 'u_Opgavetype.Id', 'u_Opgavetype', 'id', 'type')
+    create_dim_df(df, 'u_Omrder.Id', 'u_Omrder', 'id', 'area')
+    create_dim_df(df, 'BaseEntityStatus.Id', 'BaseEntityStatus', 'id', 'status')
+    create_dim_df(df, 'u_Afvisningsrsag.Id', 'u_Afvisningsrsag', 'id', 'reason')
+
+def _time(func: Callable[[], Any], repeat: int) -> float:
+    '''Median af repeat kørsler i sekunder.'''
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings)
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_size(rows: int, repeat: int, engine: Any = None) -> Dict[str, float]:
+    '''
+    Beskrivelse:
+        Måler alle trin for ét datasæt med rows syntetiske tickets.
+
+    Args:
+        rows:
+            Antal tickets.
+        repeat:
+            Antal gentagelser pr. trin (medianen bruges).
+        engine:
+            SQLAlchemy Engine til write_to_sql, eller None.
+
+    Returns:
+        Dict[str, float]:
+            Median-sekunder pr. trin.
+
+    Raises:
+        Ingen ud over fejl fra trinene.
+    '''
+    body = make_response_body(rows)
+    chunks = _chunks(body)
+    raw_df = parse_records(chunks)
+    df = format_df(raw_df)
+    ticket_df = create_ticket_df(df)
+    frames = prepare_sql_frames(df)
+    pages = [
+        _chunks(make_response_body(min(PAGE_SIZE, rows - start), start_id=start + 1))
+        for start in range(0, rows, PAGE_SIZE)]
+
+    def cycle() -> None:
+        for page_chunks in pages:
+            page_frames = prepare_sql_frames(format_df(parse_records(page_chunks)))
+            if engine is not None:
+                write_sql_frames(engine, page_frames)
+
+    results = {
+        'json_decode': _time(lambda: parse_records(chunks), repeat),
+        'format_df': _time(lambda: format_df(raw_df), repeat),
+        'create_dim_df': _time(lambda: _dims(df), repeat),
+        'create_ticket_df': _time(lambda: create_ticket_df(df), repeat),
+        'to_params': _time(lambda: to_params(ticket_df), repeat)}
+    if engine is not None:
+        results['write_to_sql'] = _time(lambda: write_sql_frames(engine, frames), repeat)
+    results['cycle'] = _time(cycle, repeat)
+    return results
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    '''
+    Beskrivelse:
+        Sammenligner resultater med en baseline og finder regressioner.
+
+    Flow:
+        1. For hver størrelse og hvert trin, som findes i begge kørsler,
+           beregnes forholdet mellem ny og gammel tid.
+        2. Et trin er regresseret, hvis det er mere end threshold
+           langsommere og mindst MIN_DIFF_SECONDS langsommere (så støj
+           på meget korte trin ignoreres).
+
+    Args:
+        results:
+            Resultat-JSON fra denne kørsel.
+        baseline:
+            Resultat-JSON fra en tidligere kørsel.
+        threshold:
+            Tilladt relativ forøgelse, fx 0.2 for 20 %.
+
+    Returns:
+        List[str]:
+            Beskrivelse af hver regression. Tom liste hvis ingen.
+
+    Raises:
+        Ingen.
+    '''
+    regressions = []
+    print(f'\n{"rækker":>8} {"trin":<18} {"baseline (s)":>13} {"nu (s)":>9} {"ændring":>9}')
+    for size, stages in results['results'].items():
+        for stage, seconds in stages.items():
+            before = baseline.get('results', {}).get(size, {}).get(stage)
+            if before is None:
+                continue
+            change = (seconds - before) / before if before > 0 else 0.0
+            flag = ''
+            if change > threshold and seconds - before >= MIN_DIFF_SECONDS:
+                flag = '  REGRESSION'
+                regressions.append(f'{stage} ved {size} rækker: {before:.4f}s -> {seconds:.4f}s ({change:+.0%})')
+            print(f'{size:>8} {stage:<18} {before:>13.4f} {seconds:>9.4f} {change:>+9.0%}{flag}')
+    return regressions
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, nargs='+', default=[10_000, 50_000], help='datasætstørrelser')
+    parser.add_argument('--repeat', type=int, default=3, help='gentagelser pr. trin (median)')
+    parser.add_argument('--db', action='store_true', help='mål også skrivning via get_engine()')
+    parser.add_argument('--output', help='gem resultater som JSON')
+    parser.add_argument('--baseline', help='JSON fra tidligere kørsel at sammenligne med')
+    parser.add_argument('--threshold', type=float, default=0.2, help='tilladt relativ forøgelse (default 0.2)')
+    args = parser.parse_args(argv)
+
+    engine = None
+    if args.db:
+        from utils.ensure_schema import ensure_schema
+        from utils.get_engine import get_engine
+        engine = get_engine()
+        ensure_schema(engine)
+
+    results: Dict[str, Any] = {
+        'meta': {
+            'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            'commit': _git_commit(),
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'platform': platform.platform(),
+            'repeat': args.repeat,
+            'page_size': PAGE_SIZE,
+            'db': engine.dialect.name if engine is not None else None},
+        'results': {}}
+
+    print(f'{"rækker":>8} {"trin":<18} {"median (s)":>11} {"rækker/s":>11}')
+    for rows in args.rows:
+        stages = run_size(rows, args.repeat, engine)
+        results['results'][str(rows)] = stages
+        for stage, seconds in stages.items():
+            print(f'{rows:>8} {stage:<18} {seconds:>11.4f} {rows / seconds if seconds else 0:>11.0f}')
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(results, file, indent=2)
+        print(f'\nResultater gemt i {args.output}')
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as file:
+            baseline = json.load(file)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print('\nRegressioner over tærsklen:')
+            for regression in regressions:
+                print(f'- {regression}')
+            return 1
+        print('\nIngen regressioner over tærsklen.')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,173 @@
+'''
+Syntetiske NSP-data til benchmarks. Genererer rækker med samme kolonner
+og formater som NSP-API'ets 'Data'-array, inkl. NULL-værdier og tomme
+strenge, så pipeline-trinene kan måles uden adgang til NSP.
+'''
+
+#######################################################################
+
+import json
+import random
+from typing import Any, Dict, List
+
+import pandas as pd
+
+from utils.create_dim_df import DICT_AREA, DICT_STATUS, DICT_TYPE
+
+#######################################################################
+
+EPOCH = pd.Timestamp('2025-09-01T00:00:00Z')
+
+GROUPS: Dict[int, str] = {
+    1001: 'Digitalisering og Data'}
+
+TYPES: Dict[int, str] = {
+    **DICT_TYPE,
+    181931: 'Udvikling',
+    181933: 'Drift'}
+
+AREAS: Dict[int, str] = {
+    **DICT_AREA,
+    181934: 'Ældreområdet'}
+
+REASONS: Dict[int, str] = {
+    183001: 'Not rejected',
+    183002: 'Duplicate'}
+
+def _iso(ts: pd.Timestamp) -> str:
+    return ts.strftime('%Y-%m-%dT%H:%M:%S.') + f'{ts.microsecond // 1000:03d}Z'
+
+def _label(field: str, label: str) -> str:
+    return f'Ticket.{field}.{label}.DisplayNameId.label-en'
+
+def make_records(n: int, seed: int = 42, start_id: int = 1) -> List[Dict[str, Any]]:
+    '''
+    Beskrivelse:
+        Genererer n syntetiske NSP-ticketrækker som dicts i samme
+        format som elementerne i NSP-API'ets 'Data'-array.
+
+    Flow:
+        1. Seeder en lokal Random-instans, så data er reproducerbare.
+        2. Danner for hver ticket oprettelses-, opstarts-, afslutnings-
+           og lukkedatoer samt id'er og labels for dimensionerne.
+        3. Indsætter NULL-værdier og tomme strenge i de felter, der
+           også mangler i virkelige data (åbne tickets, manglende
+           opstart, ingen afvisningsårsag).
+
+    Args:
+        n:
+            Antal rækker.
+        seed:
+            Seed til tilfældighedsgeneratoren (default 42).
+        start_id:
+            Første ReferenceNo (default 1).
+
+    Returns:
+        List[Dict[str, Any]]:
+            Liste af rå ticket-dicts.
+
+    Raises:
+        Ingen.
+    '''
+    rng = random.Random(seed)
+    statuses = list(DICT_STATUS)
+    types = list(TYPES)
+    areas = list(AREAS)
+    reasons = list(REASONS)
+    records: List[Dict[str, Any]] = []
+    for i in range(n):
+        ref = start_id + i
+        created = EPOCH + pd.Timedelta(seconds=rng.randrange(0, 120 * 86400))
+        start = created + pd.Timedelta(days=rng.randrange(0, 30))
+        end = start + pd.Timedelta(days=rng.randrange(0, 60))
+        closed = end + pd.Timedelta(hours=rng.randrange(0, 72))
+        is_closed = rng.random() < 0.6
+        has_start = rng.random() < 0.8
+        status_id = rng.choice([10, 11]) if is_closed else rng.choice(statuses)
+        group_id = next(iter(GROUPS))
+        type_id = rng.choice(types)
+        area_id = rng.choice(areas)
+        reason_id = rng.choice(reasons) if rng.random() < 0.3 else 0
+        updated = max(created, closed if is_closed else start)
+
+        records.append({
+            'Id': 900000 + ref,
+            'EntityType': 'Ticket',
+            'ReferenceNo': ref,
+            'BaseEntityStatus': DICT_STATUS[status_id],
+            'BaseEntityStatus.Id': status_id,
+            'AgentGroup': GROUPS[group_id],
+            'AgentGroup.Id': group_id,
+            'CreatedDate': _iso(created),
+            'CloseDateTime': _iso(closed) if is_closed else None,
+            'Priority': rng.choice(['Lav', 'Normal', 'Høj']),
+            'Priority.Id': rng.randrange(1, 4),
+            'BaseAgent': f'Agent {rng.randrange(1, 40)}',
+            'BaseAgent.Id': rng.randrange(1, 40),
+            'BaseEndUser': f'Bruger {rng.randrange(1, 2000)}',
+            'BaseEndUser.Id': rng.randrange(1, 2000),
+            'BaseHeader': f'Ticket {ref}',
+            'u_Opstart': _iso(start) if has_start else rng.choice([None, '']),
+            'u_Afslutning': _iso(end) if has_start else rng.choice([None, '']),
+            'u_Opgavetype': _label('u_Opgavetype', TYPES[type_id]),
+            'u_Opgavetype.Id': type_id,
+            'u_Omrder': _label('u_Omrder', AREAS[area_id]),
+            'u_Omrder.Id': area_id,
+            'u_Afvisningsrsag': _label('u_Afvisningsrsag', REASONS[reason_id]) if reason_id else None,
+            'u_Afvisningsrsag.Id': reason_id,
+            'UpdatedDate': _iso(updated)})
+    return records
+
+def make_df(n: int, seed: int = 42, start_id: int = 1) -> pd.DataFrame:
+    '''
+    Beskrivelse:
+        Danner et råt DataFrame med n syntetiske tickets, svarende til
+        det DataFrame, der dannes ud fra én NSP-side.
+
+    Flow:
+        1. Genererer rækker via make_records.
+        2. Danner DataFrame.
+
+    Args:
+        n:
+            Antal rækker.
+        seed:
+            Seed til tilfældighedsgeneratoren (default 42).
+        start_id:
+            Første ReferenceNo (default 1).
+
+    Returns:
+        pd.DataFrame:
+            Råt ticket-DataFrame.
+
+    Raises:
+        Ingen.
+    '''
+    return pd.DataFrame(make_records(n, seed, start_id))
+
+def make_response_body(n: int, seed: int = 42, start_id: int = 1) -> bytes:
+    '''
+    Beskrivelse:
+        Danner en syntetisk NSP-svarbody ({"Data": [...]}) som UTF-8
+        JSON, svarende til det, api_fetch modtager for én side.
+
+    Flow:
+        1. Genererer rækker via make_records.
+        2. Serialiserer dem under nøglen 'Data'.
+
+    Args:
+        n:
+            Antal rækker.
+        seed:
+            Seed til tilfældighedsgeneratoren (default 42).
+        start_id:
+            Første ReferenceNo (default 1).
+
+    Returns:
+        bytes:
+            JSON-body.
+
+    Raises:
+        Ingen.
+    '''
+    return json.dumps({'Data': make_records(n, seed, start_id)}, ensure_ascii=False).encode('utf-8')
@@ -12,13 +12,42 @@ DB_SERVER = os.getenv('DB_SERVER')
 DB_NAME = os.getenv('DB_NAME')
 DB_USERNAME = os.getenv('DB_USERNAME')
 DB_PASSWORD = os.getenv('DB_PASSWORD')
+DB_URL = os.getenv('DB_URL', '')
 
 # API-settings
 API_URL = os.getenv('API_URL')
 API_KEY = os.getenv('API_KEY')
+API_TIMEOUT = float(os.getenv('API_TIMEOUT', '30'))
+API_RETRIES = int(os.getenv('API_RETRIES', '5'))
+API_BACKOFF = float(os.getenv('API_BACKOFF', '1'))
+API_BACKOFF_MAX = float(os.getenv('API_BACKOFF_MAX', '60'))
 
 # Script settings
 SCRIPT_RUNTIME = int(os.getenv('SCRIPT_RUNTIME', '3600'))
+CATCHUP_INTERVAL = int(os.getenv('CATCHUP_INTERVAL', '60'))
+ERROR_BACKOFF_MAX = int(os.getenv('ERROR_BACKOFF_MAX', '21600'))
+REFRESH_TIME = os.getenv('REFRESH_TIME', '00:00')
+PAGE_SIZE = int(os.getenv('PAGE_SIZE', '1000'))
+FETCH_WORKERS = int(os.getenv('FETCH_WORKERS', '4'))
+FETCH_WINDOW_HOURS = int(os.getenv('FETCH_WINDOW_HOURS', '168'))
+FETCH_MAX_WINDOWS = int(os.getenv('FETCH_MAX_WINDOWS', '0'))
+WATERMARK_MARGIN = int(os.getenv('WATERMARK_MARGIN', '300'))
+PIPELINE_QUEUE_SIZE = int(os.getenv('PIPELINE_QUEUE_SIZE', '2'))
+BATCH_ROWS = int(os.getenv('BATCH_ROWS', '0'))
+EXTRACT_CONFIG = os.getenv('EXTRACT_CONFIG', '')
+PAGE_STORE_DIR = os.getenv('PAGE_STORE_DIR', '')
+PAGE_STORE_RETENTION_DAYS = int(os.getenv('PAGE_STORE_RETENTION_DAYS', '0'))
+PARQUET_DIR = os.getenv('PARQUET_DIR', '')
+RECONCILE_INTERVAL = int(os.getenv('RECONCILE_INTERVAL', '0'))
+RECONCILE_PAGE_SIZE = int(os.getenv('RECONCILE_PAGE_SIZE', '5000'))
+RECONCILE_BATCH_SIZE = int(os.getenv('RECONCILE_BATCH_SIZE', '500'))
+WRITE_CHUNK_SIZE = int(os.getenv('WRITE_CHUNK_SIZE', '5000'))
+WRITE_RETRIES = int(os.getenv('WRITE_RETRIES', '3'))
+WRITE_RETRY_DELAY = float(os.getenv('WRITE_RETRY_DELAY', '5'))
+METRICS_PORT = int(os.getenv('METRICS_PORT', '0'))
+METRICS_FILE = os.getenv('METRICS_FILE', '')
+METRICS_FILE_MAX_BYTES = int(os.getenv('METRICS_FILE_MAX_BYTES', '10485760'))
+METRICS_FILE_BACKUPS = int(os.getenv('METRICS_FILE_BACKUPS', '5'))
 TIMEZONE = 'Europe/Copenhagen'
 DATE_FORMAT = '%Y-%m-%d'
 TIMESTAMP_FALLBACK = '2025-09-01T00:00:00Z'
\ No newline at end of file
@@ -17,82 +17,383 @@ Processen kører i en uendelig løkke med en pause mellem hver cyklus.
 
 #######################################################################
 
+import datetime
+import functools
 import logging
 import time
+from typing import Any, Dict, List, Optional, Tuple
 
 import pandas as pd
+import sqlalchemy
 from sqlalchemy.engine import Engine
 
-from config import SCRIPT_RUNTIME
-from utils.api_fetch import api_fetch, ApiError
-from utils.format_df import format_df
-from utils.get_engine import get_engine
+from config import BATCH_ROWS, FETCH_WORKERS, PARQUET_DIR, PIPELINE_QUEUE_SIZE, WATERMARK_MARGIN
+from utils.api_fetch import api_fetch_pages, ApiError
+from utils.api_fetch_parallel import api_fetch_windows, split_windows
+from utils.dim_cache import load_dim_cache
+from utils.ensure_schema import ensure_schema
+from utils.etl_state import to_watermark, update_etl_state
+from utils.extract_config import default_query, load_extract_config, plan_queries
+from utils.get_engine import get_engine, get_target_engines
 from utils.get_last_updated import get_last_updated
-from utils.update_tickets import update_tickets
+from utils.iter_batches import iter_batches
+from utils.metrics import count_rows, observe, start_metrics, timed, write_metrics
+from utils.page_store import prune_pages
+from utils.parquet_sink import compact_parquet, parquet_dir, require_pyarrow, write_parquet
+from utils.prepare_page import prepare_page
+from utils.reconcile import reconcile, reconcile_due
+from utils.run_pipeline import run_pipeline
+from utils.scheduler import Scheduler, local_now
+from utils.update_tickets import get_last_refresh, refresh_committed, update_tickets
 from utils.setup_logging import setup_logging
-from utils.write_to_sql import write_to_sql
+from utils.write_to_sql import write_sql_frames
 
 #######################################################################
 
 logger = logging.getLogger(__name__)
 
-def main(engine: Engine) -> None:
+def get_plan_last_refresh(engines: Dict[str, Engine]) -> Optional[datetime.date]:
+    '''
+    Beskrivelse:
+        Finder datoen for seneste fulde genberegning af afledte felter,
+        som den skal bruges af Scheduler.refresh_due for hele planen.
+
+    Flow:
+        1. Læser seneste fulde genberegning (get_last_refresh) for hver
+           måldatabase.
+        2. Mangler den for blot én, returneres None, så genberegningen
+           køres; ellers returneres den ældste dato.
+
+    Args:
+        engines:
+            Engine pr. måldatabase.
+
+    Returns:
+        Optional[datetime.date]:
+            Ældste dato for seneste fulde genberegning, eller None.
+
+    Raises:
+        sqlalchemy.exc.SQLAlchemyError:
+            Hvis etl_state ikke kan læses.
+    '''
+    refreshes = [get_last_refresh(target_engine) for target_engine in engines.values()]
+    return None if None in refreshes else min(refreshes)
+
+def query_timestamp(timestamps: Dict[str, str], query: Dict[str, Any]) -> str:
+    '''
+    Beskrivelse:
+        Finder tidspunktet, hvorfra en forespørgsel skal hente: det
+        ældste watermark blandt forespørgslens måldatabaser, så ingen
+        af dem går glip af tickets.
+
+    Flow:
+        1. Sammenligner watermarks for query['routes'] som tidspunkter
+           (ikke som tekst) og returnerer det ældste.
+
+    Args:
+        timestamps:
+            Watermark pr. target som ISO8601 UTC-streng (fra
+            get_last_updated).
+        query:
+            Forespørgsel fra plan_queries.
+
+    Returns:
+        str:
+            Det ældste watermark blandt forespørgslens måldatabaser.
+
+    Raises:
+        KeyError:
+            Hvis et target i query['routes'] mangler i timestamps.
+    '''
+    return min((timestamps[target] for target in query['routes']), key=pd.Timestamp)
+
+def target_watermark(
+    fetched: List[Tuple[Optional[datetime.datetime], Optional[datetime.datetime]]],
+    timestamp: str) -> Optional[datetime.datetime]:
+    '''
+    Beskrivelse:
+        Finder det nye watermark for én måldatabase ud fra de
+        forespørgsler, der skrev til den i cyklussen.
+
+    Flow:
+        1. Tager det seneste watermark blandt forespørgslerne.
+        2. Stoppede en forespørgsel ved FETCH_MAX_WINDOWS, begrænses
+           watermark til den tidligste af deres øvre grænser, så
+           måldatabasen ikke springer over tickets, som den forespørgsel
+           endnu ikke har hentet.
+        3. Ligger resultatet ikke efter det nuværende watermark
+           (timestamp), returneres None, så watermark kun flyttes frem.
+
+    Args:
+        fetched:
+            (watermark, until) pr. forespørgsel til måldatabasen:
+            seneste UpdatedDate (eller None, hvis intet blev hentet) og
+            slutningen af sidste hentede vindue (None, hvis alt blev
+            hentet).
+        timestamp:
+            Måldatabasens nuværende watermark som ISO8601 UTC-streng.
+
+    Returns:
+        Optional[datetime.datetime]:
+            Nyt watermark (naiv UTC), eller None hvis det ikke skal
+            flyttes.
+
+    Raises:
+        Ingen.
+    '''
+    watermarks = [watermark for watermark, _ in fetched if watermark is not None]
+    limits = [until for _, until in fetched if until is not None]
+    if not watermarks:
+        return None
+    watermark = max(watermarks)
+    if limits:
+        watermark = min(watermark, min(limits))
+    if watermark <= to_watermark(pd.Series([timestamp])):
+        return None
+    return watermark
+
+def main(
+    engine: Engine,
+    full_refresh: bool = False,
+    plan: Optional[List[Dict[str, Any]]] = None,
+    today: Optional[datetime.date] = None) -> Dict[str, Any]:
     '''
     Beskrivelse:
         Én ETL-cyklus, der henter nye tickets, formatterer dem
         og skriver dem til SQL.                                  
 
     Flow:
-        1. Finder seneste last_updated fra databasen.            
-        2. Henter tickets opdateret siden timestamp via NSP-API'et.
-        3. Konverterer API-responsen til DataFrame.
-        4. Formatterer DataFrame til standardiseret format.
-        5. Upserter dimensionstabeller og tickets.
-        6. Opdaterer afledte ticketfelter i databasen.
+        1. Sikrer databaseskemaet (første gang) og finder seneste
+           watermark fra etl_state i hver måldatabase.
+        2. For hver forespørgsel i udtrækskonfigurationen (typisk én
+           for alle afdelinger): henter tickets opdateret siden det
+           ældste watermark blandt forespørgslens måldatabaser via
+           NSP-API'et (query_timestamp), side for side, mens næste side hentes i
+           baggrunden. Spænder intervallet over flere tidsvinduer
+           (backfill), hentes vinduerne i stedet parallelt via
+           api_fetch_windows, der yielder siderne vindue for vindue i
+           tidsrækkefølge. Med FETCH_MAX_WINDOWS hentes højst så mange
+           vinduer pr. cyklus; resten hentes i de følgende cyklusser.
+           Med BATCH_ROWS > 0 (hukommelsesbegrænset
+           tilstand) deles alle sider i batches af højst BATCH_ROWS
+           rækker (iter_batches), så hvert trin arbejder på en fast øvre
+           grænse af rækker.
+        3. For hver side (eller batch): formatterer DataFrame til standardiseret
+           format, fordeler rækkerne på måldatabaser efter agentgruppe
+           og danner dimensioner og ticket_df (prepare_page),
+           hvorefter dimensionstabeller og tickets upsertes i hver
+           måldatabase. Med PIPELINE_QUEUE_SIZE > 0 kører hentning,
+           transformation og skrivning samtidigt i hver sin tråd via
+           run_pipeline, så næste side hentes og transformeres, mens den
+           forrige skrives. Tickets skrives i chunks, og sidenummer og
+           antal skrevne rækker registreres i etl_state i samme
+           transaktion som hver chunk. Antal indsatte, opdaterede og
+           uændrede tickets logges pr. cyklus. Med PARQUET_DIR skrives
+           samme dimensioner og tickets også som Parquet-deltafiler
+           (utils/parquet_sink.py).
+        4. Når alle sider er skrevet, flyttes watermark i hver
+           måldatabase til seneste UpdatedDate i dens forespørgsler (kun
+           fremad, target_watermark), dog højst til forespørgslens
+           hentestart minus WATERMARK_MARGIN, så tickets opdateret under
+           hentningen på allerede hentede sider kommer med i næste
+           cyklus. Cyklussens varighed gemmes.
+           Stoppede hentningen ved FETCH_MAX_WINDOWS, flyttes watermark
+           til slutningen af sidste hentede vindue (også hvis vinduerne
+           var tomme), og højst dertil, hvis andre forespørgsler til
+           samme måldatabase nåede længere. Fejler cyklussen undervejs,
+           flyttes watermark ikke, og næste cyklus henter fra samme sted
+           igen, og afledte felter opdateres for de tickets,
+           der nåede at blive committet (refresh_committed).
+        5. Opdaterer afledte ticketfelter i hver måldatabase: fuldt hvis
+           full_refresh er sat (schedulerens daglige slot), ellers kun
+           for de tickets der blev indsat eller ændret i cyklussen (i
+           hukommelsesbegrænset tilstand efter hver batch, så id'erne
+           ikke samles op over hele cyklussen). Med PARQUET_DIR
+           kompakteres cyklussens Parquet-deltafiler ind i
+           månedspartitionerne (compact_parquet), med fuld genberegning
+           af afledte felter når full_refresh er sat.
+        6. Varighed og rækker for hvert trin og for hele cyklussen
+           registreres i metrics (utils/metrics.py).
 
     Args:
         engine:
             SQLAlchemy Engine-instans med forbindelse
-            til mål-databasen.                                  
+            til standarddatabasen (target '').                                  
+        full_refresh:
+            True for fuld genberegning af afledte ticketfelter.
+        plan:
+            Forespørgsler fra plan_queries, eller None for
+            standardopsætningen (default_query).
+        today:
+            Schedulerens lokale dato, der gemmes som dato for den fulde
+            genberegning (default dags dato i TIMEZONE).
 
     Returns:
-        None. Resultatet ligger i database-sideeffekter
-        og logging.                                              
+        Dict[str, Any]:
+            Cyklusinfo til scheduleren: 'rows' (antal behandlede
+            tickets) og 'backlog' (True hvis hentningen for en
+            forespørgsel stoppede, før alle vinduer var hentet, dvs. at
+            der ligger mere klar).
 
     Raises:
         ApiError:
             Hvis API-kaldet fejler og api_fetch hæver
             en ApiError.                                         
     '''
-    timestamp = get_last_updated(engine)
-    response = api_fetch(timestamp)
+    started = time.monotonic()
+    plan = plan or [default_query()]
+    engines = get_target_engines(engine, plan)
+    timestamps: Dict[str, str] = {}
+    for target, target_engine in engines.items():
+        ensure_schema(target_engine)
+        with timed('get_last_updated'):
+            timestamps[target] = get_last_updated(target_engine)
+
+    rows = 0
+    backlog = False
+    fetched: Dict[str, List[Tuple[Optional[datetime.datetime], Optional[datetime.datetime]]]] = {
+        target: [] for target in engines}
+    target_rows = dict.fromkeys(engines, 0)
+    touched_ids: Dict[str, List[Any]] = {target: [] for target in engines}
+    totals = {'inserted': 0, 'updated': 0, 'skipped': 0}
     try:
-        data = response.json()
-    except ValueError as exc:
-        logger.error('API-respons kunne ikke parses som JSON: %s', exc, exc_info=True)
-        return
-    
-    df = pd.DataFrame(data['Data'])
-    if df.empty:
+        for query in plan:
+            timestamp = query_timestamp(timestamps, query)
+            status: Dict[str, Any] = {'more': False, 'until': None}
+            # Siderne er sorteret på ReferenceNo, ikke UpdatedDate: en ticket
+            # på en allerede hentet side kan opdateres under hentningen, mens
+            # en senere side har en nyere UpdatedDate. Watermark må derfor
+            # ikke komme efter hentningens start (minus en margin for ure,
+            # der går forskelligt), så næste cyklus henter opdateringen.
+            fetch_started = (
+                datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+                - datetime.timedelta(seconds=WATERMARK_MARGIN))
+            if FETCH_WORKERS > 1 and len(split_windows(timestamp)) > 1:
+                pages = api_fetch_windows(timestamp, query=query, status=status)
+            else:
+                pages = api_fetch_pages(timestamp, query=query)
+            if BATCH_ROWS > 0:
+                pages = iter_batches(pages, BATCH_ROWS)
+
+            prepare = functools.partial(prepare_page, query=query)
+            if PIPELINE_QUEUE_SIZE > 0:
+                prepared = run_pipeline(enumerate(pages, start=1), [prepare], PIPELINE_QUEUE_SIZE)
+            else:
+                prepared = map(prepare, enumerate(pages, start=1))
+
+            watermark = None
+            for page, page_watermark, page_rows, routed in prepared:
+                if page_watermark is not None and (watermark is None or page_watermark > watermark):
+                    watermark = page_watermark
+                for target, frames in routed.items():
+                    try:
+                        counts, page_ids = write_sql_frames(
+                            engines[target], frames,
+                            state={'last_page': page, 'rows_processed': target_rows[target]})
+                    except sqlalchemy.exc.SQLAlchemyError as exc:
+                        touched_ids[target].extend(getattr(exc, 'touched_ids', []))
+                        raise
+                    target_rows[target] += len(frames[1])
+                    if BATCH_ROWS > 0 and not full_refresh:
+                        with timed('update_tickets'):
+                            update_tickets(engines[target], page_ids, today=today)
+                    else:
+                        touched_ids[target].extend(page_ids)
+                    if PARQUET_DIR:
+                        with timed('write_parquet'):
+                            write_parquet(frames, parquet_dir(target), today=today)
+                    for action, count in counts.items():
+                        totals[action] += count
+                rows += page_rows
+            until = None
+            if status['more']:
+                backlog = True
+                until = to_watermark(pd.Series([status['until']]))
+                if watermark is None or until > watermark:
+                    watermark = until
+            if watermark is not None and watermark > fetch_started:
+                watermark = fetch_started
+
+            for target in query['routes']:
+                fetched[target].append((watermark, until))
+    except Exception:
+        with timed('update_tickets'):
+            refresh_committed(engines, touched_ids)
+        raise
+
+    for target, target_engine in engines.items():
+        with target_engine.begin() as conn:
+            update_etl_state(
+                conn,
+                watermark=target_watermark(fetched[target], timestamps[target]),
+                rows_processed=target_rows[target],
+                cycle_duration=time.monotonic() - started)
+
+    if rows == 0:
         logger.info('Ingen nye tickets i API-responsen')
-        return
-    
-    df = format_df(df)
-    write_to_sql(engine, df)
-    update_tickets(engine)
+    else:
+        logger.info(
+            '%s tickets behandlet i cyklussen (%s indsat, %s opdateret, %s uændret)',
+            rows, totals['inserted'], totals['updated'], totals['skipped'])
+    with timed('update_tickets'):
+        for target, target_engine in engines.items():
+            update_tickets(target_engine, None if full_refresh else touched_ids[target], today=today)
+    if PARQUET_DIR:
+        with timed('compact_parquet'):
+            for target in engines:
+                compact_parquet(parquet_dir(target), today=today, full=full_refresh)
+    observe('cycle', time.monotonic() - started)
+    count_rows('cycle', rows)
+    return {'rows': rows, 'backlog': backlog}
  
 if __name__ == '__main__':
     setup_logging() 
+    if PARQUET_DIR:
+        try:
+            require_pyarrow()
+        except ImportError as exc:
+            logger.critical('Parquet-eksporten kan ikke startes: %s', exc)
+            raise SystemExit(1)
     engine = get_engine()
+    plan = plan_queries(load_extract_config())
+    engines = get_target_engines(engine, plan)
+    logger.info(
+        '%s NSP-forespørgsel(er) til %s måldatabase(r)', len(plan), len(engines))
+    for target_engine in engines.values():
+        try:
+            load_dim_cache(target_engine)
+        except sqlalchemy.exc.SQLAlchemyError as exc:
+            logger.error('Dimensionscache kunne ikke indlæses ved opstart: %s', exc, exc_info=True)
+
+    try:
+        start_metrics()
+    except OSError as exc:
+        logger.error('Metrics kunne ikke startes: %s', exc, exc_info=True)
 
+    scheduler = Scheduler()
     while True:
         logger.info('Loop initieret')
+        backlog = False
+        api_error = False
         try:
-            main(engine)
+            for target_engine in engines.values():
+                ensure_schema(target_engine)
+            now = local_now()
+            full_refresh = scheduler.refresh_due(get_plan_last_refresh(engines), now)
+            backlog = main(engine, full_refresh=full_refresh, plan=plan, today=now.date())['backlog']
+            if not backlog and reconcile_due(engines):
+                reconcile(engines, plan)
         except ApiError as exc:
+            api_error = True
             logger.error('API-fejl i loop: %s', exc, exc_info=True)
         except Exception as exc:
             logger.critical('Uventet fejl i loop: %s', exc, exc_info=True)
-            
+
+        try:
+            prune_pages()
+        except OSError as exc:
+            logger.error('Sidelageret kunne ikke ryddes: %s', exc, exc_info=True)
+
+        write_metrics()
         logger.info('Loop gennemført')
-        time.sleep(int(SCRIPT_RUNTIME))
\ No newline at end of file
+        time.sleep(scheduler.next_delay(backlog=backlog, api_error=api_error))
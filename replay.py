@@ -0,0 +1,150 @@
+'''
+Genopbygger tickets og dimensionstabeller fra sidelageret (PAGE_STORE_DIR)
+i stedet for at hente historikken fra NSP igen, fx efter ændringer i
+format_df eller create_ticket_df. Den seneste gemte version af hver
+ticket genafspilles i den rækkefølge, siderne blev hentet, gennem samme
+transformation og skrivning som main.py (inkl. udtrækskonfigurationens
+routing). Tickets, hvis normaliserede værdier er uændrede, springes over
+via row_hash, og tickets, der er nyere i tabellen eller soft-deleted,
+røres ikke. Til sidst genberegnes
+de afledte ticketfelter fuldt. Watermark i etl_state røres ikke, så den
+løbende tjeneste fortsætter, hvor den slap.
+
+Kørsel:
+    python replay.py [--since 2025-09-01T00:00:00Z] [--until ...]
+                     [--directory sti]
+'''
+
+#######################################################################
+
+import argparse
+import functools
+import logging
+import time
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy.engine import Engine
+
+from config import BATCH_ROWS, PAGE_STORE_DIR, PARQUET_DIR, PIPELINE_QUEUE_SIZE
+from utils.ensure_schema import ensure_schema
+from utils.extract_config import load_extract_config, plan_queries
+from utils.get_engine import get_engine, get_target_engines
+from utils.iter_batches import iter_batches
+from utils.page_store import iter_stored_pages
+from utils.parquet_sink import compact_parquet, parquet_dir, require_pyarrow, write_parquet
+from utils.prepare_page import prepare_page
+from utils.run_pipeline import run_pipeline
+from utils.setup_logging import setup_logging
+from utils.update_tickets import update_tickets
+from utils.write_to_sql import write_sql_frames
+
+#######################################################################
+
+logger = logging.getLogger(__name__)
+
+def replay(
+    engine: Engine,
+    plan: List[Dict[str, Any]],
+    directory: str = PAGE_STORE_DIR,
+    since: Optional[str] = None,
+    until: Optional[str] = None) -> Dict[str, int]:
+    '''
+    Beskrivelse:
+        Genafspiller gemte NSP-sider og upserter dem i måldatabaserne.
+
+    Flow:
+        1. Sikrer skemaet i hver måldatabase.
+        2. For hver forespørgsel i plan: læser den seneste gemte
+           version af hver ticket for dens entityType via
+           iter_stored_pages (latest_only) og kører dem gennem
+           prepare_page (format_df, routing og prepare_sql_frames) og
+           write_sql_frames (og write_parquet med PARQUET_DIR), med
+           run_pipeline når PIPELINE_QUEUE_SIZE > 0, og i batches af
+           højst BATCH_ROWS rækker når BATCH_ROWS > 0. Upserten
+           springer tickets over, der er nyere i tabellen (last_updated)
+           eller soft-deleted af afstemningen (restore_deleted False),
+           så genafspilningen ikke ruller data tilbage.
+           Der skrives ingen checkpoints i etl_state.
+        3. Genberegner afledte ticketfelter fuldt i hver måldatabase og
+           kompakterer Parquet-deltafilerne med fuld genberegning
+           (compact_parquet) med PARQUET_DIR.
+
+    Args:
+        engine:
+            Engine til standarddatabasen (target '').
+        plan:
+            Forespørgsler fra plan_queries.
+        directory:
+            Sidelagerets rodmappe (default PAGE_STORE_DIR).
+        since:
+            Valgfri inklusiv nedre grænse for UpdatedDate.
+        until:
+            Valgfri eksklusiv øvre grænse for UpdatedDate.
+
+    Returns:
+        Dict[str, int]:
+            Antal genafspillede rækker ('rows') samt indsatte,
+            opdaterede og uændrede tickets.
+
+    Raises:
+        ValueError:
+            Hvis directory ikke er angivet, eller en gemt side er ugyldig.
+        sqlalchemy.exc.SQLAlchemyError:
+            Hvis skrivningen fejler.
+    '''
+    if not directory:
+        raise ValueError('Intet sidelager angivet (PAGE_STORE_DIR eller --directory)')
+    started = time.monotonic()
+    engines = get_target_engines(engine, plan)
+    for target_engine in engines.values():
+        ensure_schema(target_engine)
+
+    totals = {'rows': 0, 'inserted': 0, 'updated': 0, 'skipped': 0}
+    for query in plan:
+        pages = iter_stored_pages(directory, since, until, query['entityType'], latest_only=True)
+        if BATCH_ROWS > 0:
+            pages = iter_batches(pages, BATCH_ROWS)
+        prepare = functools.partial(prepare_page, query=query)
+        if PIPELINE_QUEUE_SIZE > 0:
+            prepared = run_pipeline(enumerate(pages, start=1), [prepare], PIPELINE_QUEUE_SIZE)
+        else:
+            prepared = map(prepare, enumerate(pages, start=1))
+        for _, _, page_rows, routed in prepared:
+            for target, frames in routed.items():
+                counts, _ = write_sql_frames(engines[target], frames, restore_deleted=False)
+                if PARQUET_DIR:
+                    write_parquet(frames, parquet_dir(target))
+                for action, count in counts.items():
+                    totals[action] += count
+            totals['rows'] += page_rows
+
+    for target, target_engine in engines.items():
+        update_tickets(target_engine)
+        if PARQUET_DIR:
+            compact_parquet(parquet_dir(target), full=True)
+    logger.info(
+        '%s rækker genafspillet på %.1f s (%s indsat, %s opdateret, %s uændret)',
+        totals['rows'], time.monotonic() - started,
+        totals['inserted'], totals['updated'], totals['skipped'])
+    return totals
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--since', help='inklusiv nedre grænse for UpdatedDate (ISO8601 UTC)')
+    parser.add_argument('--until', help='eksklusiv øvre grænse for UpdatedDate (ISO8601 UTC)')
+    parser.add_argument('--directory', default=PAGE_STORE_DIR, help='sidelagerets rodmappe (default PAGE_STORE_DIR)')
+    args = parser.parse_args()
+
+    setup_logging()
+    if PARQUET_DIR:
+        try:
+            require_pyarrow()
+        except ImportError as exc:
+            logger.critical('Parquet-eksporten kan ikke startes: %s', exc)
+            raise SystemExit(1)
+    replay(
+        get_engine(),
+        plan_queries(load_extract_config()),
+        directory=args.directory,
+        since=args.since,
+        until=args.until)
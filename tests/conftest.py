@@ -0,0 +1,19 @@
+import pytest
+
+from benchmarks.fake_nsp import start_fake_nsp
+from utils import nsp_client
+from utils.nsp_client import NspClient
+
+#######################################################################
+
+@pytest.fixture
+def fake_nsp():
+    '''Starter den falske NSP-server med 40 tickets og peger den delte NspClient på den.'''
+    server, nsp, url = start_fake_nsp(rows=40, use_gzip=False)
+    nsp_client._client = NspClient(url=url, api_key='test', retries=0)
+    try:
+        yield nsp
+    finally:
+        server.shutdown()
+        nsp_client._client.close()
+        nsp_client._client = None
@@ -0,0 +1,39 @@
+from utils.api_fetch import api_fetch_pages
+from utils.api_fetch_parallel import api_fetch_windows
+
+#######################################################################
+
+EPOCH = '2000-01-01T00:00:00Z'
+UNTIL = '2030-01-01T00:00:00Z'
+
+def test_pages_cover_all_rows_once(fake_nsp):
+    pages = list(api_fetch_pages(EPOCH, page_size=10, until=UNTIL))
+
+    ids = [int(ref) for df in pages for ref in df['ReferenceNo']]
+    assert [len(df) for df in pages] == [10, 10, 10, 10]
+    assert ids == list(range(1, 41))
+
+def test_row_leaving_window_mid_fetch_does_not_shift_later_pages(fake_nsp):
+    ids = []
+    for page, df in enumerate(api_fetch_pages(EPOCH, page_size=10, until=UNTIL), start=1):
+        if page == 1:
+            # Ticket 5 (allerede hentet) opdateres og forlader vinduet,
+            # før side 3 hentes; med offset ville ticket 21 springes over.
+            fake_nsp.update(5, UpdatedDate='2031-01-01T00:00:00.000Z')
+        ids.extend(int(ref) for ref in df['ReferenceNo'])
+
+    assert ids == list(range(1, 41))
+
+def test_window_fetch_keeps_rows_after_ticket_moves_to_later_window(fake_nsp):
+    ids = []
+    # Første vindue [2025-01-01, 2026-05-16) er lukket og rummer alle
+    # 40 tickets; det sidste vindue er åbent.
+    pages = api_fetch_windows('2025-01-01T00:00:00Z', workers=1, window_hours=24 * 500, buffer_pages=1, page_size=10)
+    for page, df in enumerate(pages, start=1):
+        if page == 1:
+            fake_nsp.update(5, UpdatedDate='2026-09-01T00:00:00.000Z')
+        ids.extend(int(ref) for ref in df['ReferenceNo'])
+
+    assert sorted(set(ids)) == list(range(1, 41))
+    assert ids.count(5) == 2
+    assert ids[-1] == 5
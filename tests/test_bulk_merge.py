@@ -0,0 +1,45 @@
+import pandas as pd
+import pytest
+import sqlalchemy
+from sqlalchemy import text
+
+from utils.bulk_merge import bulk_merge
+
+#######################################################################
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = sqlalchemy.create_engine(f'sqlite:///{tmp_path / "merge.db"}')
+    with engine.begin() as conn:
+        conn.execute(text(
+            'CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT, row_hash INTEGER, last_updated TEXT)'))
+    return engine
+
+def _merge(engine, rows):
+    with engine.begin() as conn:
+        return bulk_merge(
+            conn, 'items', pd.DataFrame(rows, columns=['id', 'name', 'row_hash', 'last_updated']),
+            hash_col='row_hash', touch_cols=['last_updated'])
+
+def _rows(engine):
+    with engine.connect() as conn:
+        return [tuple(row) for row in conn.execute(text('SELECT * FROM items ORDER BY id'))]
+
+def test_insert_then_unchanged_then_updated(engine):
+    rows = [(1, 'a', 11, '2026-01-01 08:00:00'), (2, 'b', 22, '2026-01-01 08:00:00')]
+
+    assert _merge(engine, rows) == ({'inserted': 2, 'updated': 0, 'skipped': 0}, [1, 2])
+    assert _merge(engine, rows) == ({'inserted': 0, 'updated': 0, 'skipped': 2}, [])
+
+    changed = [(1, 'a', 11, '2026-01-01 08:00:00'), (2, 'c', 23, '2026-01-02 08:00:00')]
+    assert _merge(engine, changed) == ({'inserted': 0, 'updated': 1, 'skipped': 1}, [2])
+    assert _rows(engine) == changed
+
+def test_touch_only_change_is_written_but_not_counted(engine):
+    _merge(engine, [(1, 'a', 11, '2026-01-01 08:00:00')])
+
+    counts, keys = _merge(engine, [(1, 'a', 11, '2026-01-03 08:00:00')])
+
+    assert counts == {'inserted': 0, 'updated': 0, 'skipped': 1}
+    assert keys == []
+    assert _rows(engine) == [(1, 'a', 11, '2026-01-03 08:00:00')]
@@ -0,0 +1,65 @@
+import pandas as pd
+
+from utils.extract_config import ENTITY_COLUMNS, GROUP_COLUMN, GROUP_FIELD, plan_queries, route_rows
+
+#######################################################################
+
+def _extract(name, groups, target='', filters=None, columns=None):
+    return {
+        'name': name,
+        'entityType': 'Ticket',
+        'groups': groups,
+        'columns': columns or [],
+        'filters': filters or [],
+        'target': target}
+
+def test_single_group_becomes_eq_filter():
+    plan = plan_queries([_extract('a', ['Gruppe A'])])
+
+    assert len(plan) == 1
+    assert plan[0]['filters'] == [{'field': GROUP_FIELD, 'operator': 'eq', 'value': 'Gruppe A'}]
+    assert plan[0]['routes'] == {'': ['Gruppe A']}
+    assert plan[0]['columns'] == ENTITY_COLUMNS['Ticket']
+
+def test_groups_across_targets_merge_into_one_in_filter():
+    plan = plan_queries([
+        _extract('a', ['Gruppe B'], target='sqlite:///a.db'),
+        _extract('b', ['Gruppe A', 'Gruppe C'], target='sqlite:///b.db'),
+        _extract('c', ['Gruppe A'], target='sqlite:///a.db', columns=['u_Ekstrafelt'])])
+
+    assert len(plan) == 1
+    query = plan[0]
+    assert query['filters'] == [{'field': GROUP_FIELD, 'operator': 'in', 'value': ['Gruppe A', 'Gruppe B', 'Gruppe C']}]
+    assert query['routes'] == {'sqlite:///a.db': ['Gruppe B', 'Gruppe A'], 'sqlite:///b.db': ['Gruppe A', 'Gruppe C']}
+    assert query['columns'] == [*ENTITY_COLUMNS['Ticket'], 'u_Ekstrafelt']
+
+def test_extract_filters_split_queries_and_keep_own_filters():
+    extra = [{'field': 'Priority', 'operator': 'eq', 'value': 'Høj'}]
+    plan = plan_queries([_extract('a', ['Gruppe A']), _extract('b', ['Gruppe B'], filters=extra)])
+
+    assert len(plan) == 2
+    assert plan[0]['filters'] == [{'field': GROUP_FIELD, 'operator': 'eq', 'value': 'Gruppe A'}]
+    assert plan[1]['filters'] == [{'field': GROUP_FIELD, 'operator': 'eq', 'value': 'Gruppe B'}, *extra]
+
+def test_extract_without_groups_drops_group_filter():
+    plan = plan_queries([_extract('alle', [], target='sqlite:///alle.db'), _extract('a', ['Gruppe A'])])
+
+    assert len(plan) == 1
+    assert plan[0]['filters'] == []
+    assert plan[0]['routes'] == {'sqlite:///alle.db': None, '': ['Gruppe A']}
+
+def test_extract_without_groups_widens_target_with_groups():
+    plan = plan_queries([_extract('a', ['Gruppe A']), _extract('alle', [])])
+
+    assert plan[0]['routes'] == {'': None}
+    assert plan[0]['filters'] == []
+
+def test_route_rows_splits_formatted_page_by_group():
+    query = {'routes': {'': None, 'sqlite:///a.db': ['Gruppe A'], 'sqlite:///c.db': ['Gruppe C']}}
+    df = pd.DataFrame({'ReferenceNo': [1, 2, 3], GROUP_COLUMN: ['Gruppe A', 'Gruppe B', 'Gruppe A']})
+
+    routed = route_rows(df, query)
+
+    assert set(routed) == {'', 'sqlite:///a.db'}
+    assert routed[''] is df
+    assert routed['sqlite:///a.db']['ReferenceNo'].tolist() == [1, 3]
@@ -0,0 +1,37 @@
+import datetime
+
+import sqlalchemy
+from sqlalchemy import text
+
+import main
+
+#######################################################################
+
+def _now_iso(seconds=0):
+    moment = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=seconds)
+    return moment.strftime('%Y-%m-%dT%H:%M:%S.000Z')
+
+def test_update_on_fetched_page_during_fetch_is_picked_up_next_cycle(fake_nsp, tmp_path, monkeypatch):
+    fetch_pages = main.api_fetch_pages
+
+    def small_pages(timestamp, query=None):
+        for page, df in enumerate(fetch_pages(timestamp, page_size=10, query=query), start=1):
+            yield df
+            if page == 1 and not fake_nsp.records[2]['BaseHeader'].startswith('Ny'):
+                # Ticket 3 (side 1, allerede hentet) opdateres før ticket 35
+                # (side 4, ikke hentet endnu), som får en nyere UpdatedDate.
+                fake_nsp.update(3, BaseHeader='Ny titel', UpdatedDate=_now_iso())
+                fake_nsp.update(35, UpdatedDate=_now_iso(1))
+
+    monkeypatch.setattr(main, 'api_fetch_pages', small_pages)
+    monkeypatch.setattr(main, 'FETCH_WORKERS', 1)
+    monkeypatch.setattr(main, 'PIPELINE_QUEUE_SIZE', 0)
+    engine = sqlalchemy.create_engine(f'sqlite:///{tmp_path / "test.db"}')
+
+    assert main.main(engine)['rows'] == 40
+    with engine.connect() as conn:
+        assert conn.execute(text('SELECT ticket_title FROM tickets WHERE id = 3')).scalar() == 'Ticket 3'
+
+    main.main(engine)
+    with engine.connect() as conn:
+        assert conn.execute(text('SELECT ticket_title FROM tickets WHERE id = 3')).scalar() == 'Ny titel'
@@ -0,0 +1,34 @@
+import pytest
+
+from utils import nsp_client
+from utils.nsp_client import NspClient
+
+#######################################################################
+
+class _Response:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.ok = 200 <= status_code < 300
+        self.text = ''
+
+    def close(self):
+        pass
+
+class _Session:
+    def __init__(self, responses):
+        self.responses = list(responses)
+
+    def post(self, url, **kwargs):
+        return self.responses.pop(0)
+
+@pytest.mark.parametrize('retry_after', ['86400', 'inf', 'nan', 'Wed, 21 Oct 2099 07:28:00 GMT'])
+def test_retry_after_is_capped_at_backoff_max(monkeypatch, retry_after):
+    delays = []
+    monkeypatch.setattr(nsp_client.time, 'sleep', delays.append)
+    client = NspClient(url='http://nsp.invalid/', retries=1, backoff=0.5, backoff_max=30)
+    client.session = _Session([_Response(429, {'Retry-After': retry_after}), _Response(200)])
+
+    assert client.post('{}').status_code == 200
+    assert len(delays) == 1
+    assert 0 <= delays[0] <= 30
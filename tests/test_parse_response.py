@@ -0,0 +1,56 @@
+import json
+
+import pandas as pd
+import pytest
+
+from utils.parse_response import parse_records
+
+#######################################################################
+
+RECORDS = [
+    {'ReferenceNo': 1, 'Score': -12.5e-3, 'BaseHeader': 'Citat "x" og \\ skråstreg\nny linje', 'Closed': None},
+    {'ReferenceNo': 22, 'BaseHeader': 'Æblegrød på ø 😀', 'Tags': ['a', {'b': True}], 'Closed': False},
+    {'ReferenceNo': 333, 'Score': 1234567890123, 'Extra': {'Nested': [1, 2.0, None]}},
+]
+
+BODY = json.dumps({'Meta': {'Total': 3, 'Data': 'ikke denne'}, 'Data': RECORDS, 'Count': 3}).encode()
+ESCAPED_BODY = json.dumps({'Data': RECORDS}, ensure_ascii=True).encode()
+UTF8_BODY = json.dumps({'Data': RECORDS}, ensure_ascii=False).encode('utf-8')
+
+def _chunks(body, size):
+    return [body[offset:offset + size] for offset in range(0, len(body), size)]
+
+def _nulls_as_none(df):
+    # Manglende felter er None i parse_records og NaN i pd.DataFrame(records)
+    return df.astype(object).where(df.notna(), None)
+
+@pytest.mark.parametrize('body', [BODY, ESCAPED_BODY, UTF8_BODY], ids=['mixed', 'ascii-escapes', 'utf-8'])
+def test_every_chunk_size_matches_json_loads(body):
+    expected = pd.DataFrame(json.loads(body)['Data'])
+
+    for size in range(1, len(body) + 1):
+        result = parse_records(_chunks(body, size))
+        assert list(result.dtypes) == list(expected.dtypes)
+        pd.testing.assert_frame_equal(_nulls_as_none(result), _nulls_as_none(expected))
+
+def test_empty_data_list_gives_empty_frame():
+    assert parse_records([b'{"Data": [], "Count": 0}']).empty
+
+def test_missing_data_key_raises_key_error():
+    with pytest.raises(KeyError):
+        parse_records([b'{"Count": 0}'])
+    with pytest.raises(KeyError):
+        parse_records([b'{}'])
+
+def test_trailing_whitespace_is_accepted():
+    assert len(parse_records([b'{"Data": [{"a": 1}]}', b' \n\t '])) == 1
+
+@pytest.mark.parametrize('tail', [b'x', b' {}', b'\n[1]', b'}'])
+def test_trailing_data_raises_value_error(tail):
+    with pytest.raises(ValueError):
+        parse_records(_chunks(b'{"Data": [{"a": 1}]}' + tail, 3))
+
+@pytest.mark.parametrize('body', [b'{"Data": [1]}', b'{"Data": [{"a": 1}', b'{"Data": [{"a": tru}]}'])
+def test_invalid_body_raises_value_error(body):
+    with pytest.raises(ValueError):
+        parse_records(_chunks(body, 4))
@@ -0,0 +1,68 @@
+import json
+
+import pandas as pd
+import sqlalchemy
+from sqlalchemy import text
+
+from benchmarks.synthetic import make_records
+from replay import replay
+from utils.ensure_schema import ensure_schema
+from utils.extract_config import default_query
+from utils.format_df import format_df
+from utils.page_store import commit_page, open_page
+from utils.write_to_sql import write_to_sql
+
+#######################################################################
+
+OLD = '2026-01-10T08:00:00.000Z'
+NEW = '2026-02-10T08:00:00.000Z'
+
+def _version(updated, title):
+    return dict(make_records(1)[0], UpdatedDate=updated, BaseHeader=title)
+
+def _store(directory, records):
+    sink = open_page(directory)
+    sink.write(json.dumps({'Data': records}).encode())
+    commit_page(sink, pd.DataFrame(records), 'Ticket', directory)
+
+def _engine(tmp_path, records=()):
+    engine = sqlalchemy.create_engine(f'sqlite:///{tmp_path / "replay.db"}')
+    ensure_schema(engine)
+    if records:
+        write_to_sql(engine, format_df(pd.DataFrame(records)))
+    return engine
+
+def _ticket(engine):
+    with engine.connect() as conn:
+        return conn.execute(text('SELECT ticket_title, deleted_at FROM tickets WHERE id = 1')).fetchone()
+
+def test_replay_writes_only_latest_stored_version(tmp_path):
+    directory = str(tmp_path / 'store')
+    _store(directory, [_version(NEW, 'Ny')])
+    _store(directory, [_version(OLD, 'Gammel')])
+    engine = _engine(tmp_path)
+
+    replay(engine, [default_query()], directory=directory)
+
+    assert _ticket(engine)[0] == 'Ny'
+
+def test_replay_does_not_overwrite_newer_row(tmp_path):
+    directory = str(tmp_path / 'store')
+    _store(directory, [_version(OLD, 'Gammel')])
+    engine = _engine(tmp_path, [_version(NEW, 'Ny')])
+
+    totals = replay(engine, [default_query()], directory=directory, until='2026-02-01T00:00:00Z')
+
+    assert _ticket(engine)[0] == 'Ny'
+    assert totals['updated'] == 0
+
+def test_replay_leaves_soft_deleted_ticket_deleted(tmp_path):
+    directory = str(tmp_path / 'store')
+    _store(directory, [_version(NEW, 'Ændret mapping')])
+    engine = _engine(tmp_path, [_version(NEW, 'Ny')])
+    with engine.begin() as conn:
+        conn.execute(text("UPDATE tickets SET deleted_at = '2026-03-01 00:00:00' WHERE id = 1"))
+
+    replay(engine, [default_query()], directory=directory)
+
+    assert tuple(_ticket(engine)) == ('Ny', '2026-03-01 00:00:00')
@@ -0,0 +1,71 @@
+import datetime
+
+import pandas as pd
+import sqlalchemy
+from sqlalchemy import text
+
+from benchmarks.synthetic import make_records
+from utils.ensure_schema import ensure_schema
+from utils.format_df import format_df
+from utils.parquet_sink import derive_measures
+from utils.update_tickets import update_tickets
+from utils.write_to_sql import write_to_sql
+
+#######################################################################
+
+DATES = [
+    ('2026-03-10', '2026-03-20', 11),
+    ('2026-03-01', '2026-03-20', 20),
+    ('2026-02-01', '2026-02-20', 20),
+    (None, '2026-03-20', 5),
+    ('2026-03-10', None, 5),
+]
+
+def _engine(tmp_path):
+    engine = sqlalchemy.create_engine(f'sqlite:///{tmp_path / "tickets.db"}')
+    ensure_schema(engine)
+    write_to_sql(engine, format_df(pd.DataFrame(make_records(len(DATES)))))
+    with engine.begin() as conn:
+        conn.execute(text('UPDATE tickets SET closed_date = NULL'))
+        for ticket_id, (start, end, duration) in enumerate(DATES, start=1):
+            conn.execute(
+                text('UPDATE tickets SET start_date = :start, end_date = :end, duration = :duration WHERE id = :id'),
+                {'start': start, 'end': end, 'duration': duration, 'id': ticket_id})
+    return engine
+
+def _measures(engine):
+    with engine.connect() as conn:
+        return pd.read_sql(
+            text('SELECT id, start_date, end_date, duration, closed_date, days_till_start, offset_duration '
+                 'FROM tickets ORDER BY id'), conn)
+
+def test_refresh_uses_given_date_like_parquet(tmp_path):
+    engine = _engine(tmp_path)
+    today = datetime.date(2026, 3, 5)
+
+    update_tickets(engine, today=today)
+
+    stored = _measures(engine)
+    expected = derive_measures(stored, today)
+    assert stored['days_till_start'].tolist() == [5, 0, 0, 0, 5]
+    assert stored['days_till_start'].tolist() == expected['days_till_start'].tolist()
+    assert stored['offset_duration'].tolist() == expected['offset_duration'].tolist()
+
+def test_touched_refresh_uses_given_date(tmp_path):
+    engine = _engine(tmp_path)
+    update_tickets(engine, today=datetime.date(2026, 3, 5))
+
+    update_tickets(engine, ids=[1], today=datetime.date(2026, 3, 8))
+
+    assert _measures(engine)['days_till_start'].tolist() == [2, 0, 0, 0, 5]
+
+def test_touched_refresh_leaves_other_tickets(tmp_path):
+    engine = _engine(tmp_path)
+    with engine.begin() as conn:
+        conn.execute(text('UPDATE tickets SET days_till_start = 99, offset_duration = 99'))
+
+    update_tickets(engine, ids=[1, 4], today=datetime.date(2026, 3, 5))
+
+    stored = _measures(engine)
+    assert stored['days_till_start'].tolist() == [5, 99, 99, 0, 99]
+    assert stored['offset_duration'].tolist() == [11, 99, 99, 0, 99]
@@ -0,0 +1,34 @@
+import datetime
+
+from main import query_timestamp, target_watermark
+
+#######################################################################
+
+def _dt(day, hour=0):
+    return datetime.datetime(2026, 3, day, hour)
+
+def test_query_timestamp_is_oldest_watermark_of_own_targets():
+    timestamps = {'': '2026-03-05T00:00:00Z', 'a': '2026-03-02T12:00:00Z', 'b': '2026-03-01T00:00:00Z'}
+
+    assert query_timestamp(timestamps, {'routes': {'': None, 'a': ['Gruppe A']}}) == '2026-03-02T12:00:00Z'
+
+def test_query_timestamp_compares_as_time_not_text():
+    timestamps = {'': '2026-03-02T00:00:00Z', 'a': '2026-03-01T23:00:00+00:00'}
+
+    assert query_timestamp(timestamps, {'routes': {'': None, 'a': None}}) == '2026-03-01T23:00:00+00:00'
+
+def test_target_watermark_takes_latest_of_queries():
+    fetched = [(_dt(3), None), (None, None), (_dt(4, 6), None)]
+
+    assert target_watermark(fetched, '2026-03-01T00:00:00Z') == _dt(4, 6)
+
+def test_target_watermark_is_capped_by_unfinished_query():
+    fetched = [(_dt(9), None), (_dt(5), _dt(5)), (_dt(7), _dt(7))]
+
+    assert target_watermark(fetched, '2026-03-01T00:00:00Z') == _dt(5)
+
+def test_target_watermark_only_moves_forward():
+    assert target_watermark([(_dt(3), None)], '2026-03-03T00:00:00Z') is None
+    assert target_watermark([(_dt(2), None)], '2026-03-03T00:00:00Z') is None
+    assert target_watermark([], '2026-03-03T00:00:00Z') is None
+    assert target_watermark([(None, None)], '2026-03-03T00:00:00Z') is None
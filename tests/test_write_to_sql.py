@@ -0,0 +1,40 @@
+import pandas as pd
+import pytest
+import sqlalchemy
+
+from utils import write_to_sql
+
+#######################################################################
+
+def _failing_merge(errors):
+    calls = []
+
+    def merge(*args, **kwargs):
+        calls.append(1)
+        if errors:
+            raise errors.pop(0)
+        return {'inserted': 1}, [1]
+    return merge, calls
+
+@pytest.fixture
+def engine(tmp_path, monkeypatch):
+    monkeypatch.setattr(write_to_sql, 'WRITE_RETRIES', 2)
+    monkeypatch.setattr(write_to_sql, 'WRITE_RETRY_DELAY', 0)
+    return sqlalchemy.create_engine(f'sqlite:///{tmp_path / "chunk.db"}')
+
+def test_transient_error_is_retried(engine, monkeypatch):
+    error = sqlalchemy.exc.OperationalError('INSERT', {}, Exception('database is locked'))
+    merge, calls = _failing_merge([error])
+    monkeypatch.setattr(write_to_sql, 'bulk_merge', merge)
+
+    assert write_to_sql._write_chunk(engine, pd.DataFrame(), None) == ({'inserted': 1}, [1])
+    assert len(calls) == 2
+
+def test_permanent_error_is_raised_at_once(engine, monkeypatch):
+    error = sqlalchemy.exc.IntegrityError('INSERT', {}, Exception('UNIQUE constraint failed'))
+    merge, calls = _failing_merge([error])
+    monkeypatch.setattr(write_to_sql, 'bulk_merge', merge)
+
+    with pytest.raises(sqlalchemy.exc.IntegrityError):
+        write_to_sql._write_chunk(engine, pd.DataFrame(), None)
+    assert len(calls) == 1
@@ -1,51 +1,71 @@
 import json
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional
 
+import pandas as pd
 import requests
 
-from config import API_URL, API_KEY
+from config import PAGE_SIZE, PAGE_STORE_DIR
+from utils.extract_config import default_query
+from utils.metrics import count_rows, timed
+from utils.nsp_client import ApiError, get_client
+from utils.page_store import commit_page, discard_page, open_page
+from utils.parse_response import parse_response
 
 #######################################################################
 
 logger = logging.getLogger(__name__)
 
-class ApiError(Exception):
-    '''
-    Beskrivelse:
-        Specialiseret exception-type til API-relaterede fejl,
-        fx manglende forbindelse eller ugyldigt svar fra NSP-API'et.
-
-    Flow:
-        Bruges til at indkapsle alle forventede fejl ved API-kald,
-        så kaldere kan håndtere dem samlet (fx i main-loopet).       
-
-    Args:
-        Ingen.
-
-    Returns:
-        Ingen. Klassen repræsenterer kun en fejlsituation.
-
-    Raises:
-        Ingen direkte. Bruges som type for hævede fejl.               
-    '''
-    pass
+SORT_ORDER: List[Dict[str, str]] = [{'field': 'ReferenceNo', 'dir': 'asc'}]
 
-def api_fetch(timestamp: str) -> requests.Response:
+def api_fetch(
+    timestamp: str,
+    after: Optional[int] = None,
+    page_size: int = PAGE_SIZE,
+    until: Optional[str] = None,
+    stream: bool = False,
+    query: Optional[Dict[str, Any]] = None) -> requests.Response:
     '''
     Beskrivelse:
-        Henter tickets fra NSP-API'et, filtreret på UpdatedDate >= timestamp.
+        Henter én side fra NSP-API'et for en forespørgsel fra
+        udtrækskonfigurationen, filtreret på UpdatedDate >= timestamp
+        (og UpdatedDate < until, hvis angivet) og ReferenceNo > after.
         Resultatet returneres som et `requests.Response`-objekt.       
 
     Flow:
         1. Logger at et API-kald initieres.
-        2. Bygger JSON-payload med ønskede kolonner og filtre.
-        3. Sender POST-request til NSP-API'et med API-nøgle.
-        4. Logger succes ved 2xx-svar og hæver ApiError ved fejl.
+        2. Bygger JSON-payload med forespørgslens entityType, kolonner
+           og filtre (fx agentgrupper) samt UpdatedDate-filtrene.
+           Pagineringen er keyset-baseret: siderne sorteres på
+           ReferenceNo (SORT_ORDER), og hver side efter den første
+           filtreres på ReferenceNo > after (sidste ReferenceNo på
+           forrige side) i stedet for et sidenummer. Forlader en ticket
+           filtret under hentningen (fx fordi UpdatedDate ændres inden for
+           et lukket vindue), flyttes de efterfølgende rækker derfor ikke,
+           og ingen rækker springes over på sidegrænserne.
+        3. Sender POST-request via den delte NspClient, der genbruger
+           forbindelser og genforsøger ved forbigående fejl.
+        4. Logger succes ved 2xx-svar. NspClient hæver ApiError ved fejl.
 
     Args:
         timestamp:
             ISO8601-dato/tid i UTC, typisk hentet fra databasen
             via last_updated-feltet.
+        after:
+            Sidste ReferenceNo på forrige side, eller None for første
+            side (default None).
+        page_size:
+            Antal rækker pr. side (default PAGE_SIZE).
+        until:
+            Valgfri eksklusiv øvre grænse for UpdatedDate
+            (ISO8601 UTC). None betyder ingen øvre grænse.
+        stream:
+            Om response-body skal streames i stedet for at blive
+            læst med det samme (default False).
+        query:
+            Forespørgsel fra plan_queries, eller None for
+            standardopsætningen (default_query).
 
     Returns:
         requests.Response:
@@ -55,57 +75,202 @@ def api_fetch(timestamp: str) -> requests.Response:
     Raises:
         ApiError:
             Hvis API'et returnerer en statuskode uden for 2xx-området
-            eller hvis selve HTTP-kaldet fejler (fx netværksfejl).
+            eller hvis selve HTTP-kaldet fejler (fx netværksfejl),
+            efter at genforsøgsbudgettet er brugt.
     '''
-    logger.info('Henter data fra API')
+    logger.info('Henter data fra API (ReferenceNo efter %s)', after)
+    query = query or default_query()
+    filters: List[Dict[str, Any]] = [
+        *query['filters'],
+        {
+        'field': 'UpdatedDate',
+        'operator': 'gte',
+        'value': timestamp}]
+    if after is not None:
+        filters.append({
+            'field': 'ReferenceNo',
+            'operator': 'gt',
+            'value': after})
+    if until is not None:
+        filters.append({
+            'field': 'UpdatedDate',
+            'operator': 'lt',
+            'value': until})
     payload = json.dumps({
-        'entityType': 'Ticket',
+        'entityType': query['entityType'],
         'page': 1,
-        'pageSize': 1000,
-        'columns': [
-            'ReferenceNo',
-            'BaseEntityStatus',
-            'AgentGroup',
-            'CreatedDate',
-            'CloseDateTime',
-            'Priority',
-            'BaseAgent',
-            'BaseEndUser',
-            'BaseHeader',
-            'u_Opstart',
-            'u_Afslutning',
-            'u_Opgavetype',
-            'u_Omrder',
-            'u_Afvisningsrsag',
-            'UpdatedDate'],
+        'pageSize': page_size,
+        'columns': query['columns'],
+        'sort': SORT_ORDER,
         'filters': {
             'logic': 'and',
-            'filters': [{
-                'field': 'AgentGroup.GroupName',
-                'operator': 'eq',
-                'value': 'Digitalisering og Data'},
-                {
-                'field': 'UpdatedDate',
-                'operator': 'gte',
-                'value': timestamp}]
-            }
+            'filters': filters}
         })
-    headers = {
-        'x-api-key': API_KEY,
-        'Content-Type': 'application/json'}
+    response = get_client().post(payload, stream=stream)
+    logger.info('Data hentet fra API')
+    return response
+
+def _parse_page(response: requests.Response, entity_type: str, store: bool = True) -> pd.DataFrame:
+    '''
+    Beskrivelse:
+        Parser et NSP-svar via parse_response og gemmer samtidig den rå
+        body i sidelageret (utils/page_store.py), hvis PAGE_STORE_DIR er
+        sat, så siden senere kan genafspilles uden at hente fra NSP.
+
+    Flow:
+        1. Uden PAGE_STORE_DIR, eller med store False, parses svaret
+           direkte.
+        2. Ellers åbnes en midlertidig sidefil, som body kopieres til
+           under parsingen. Lykkes parsingen, registreres filen i
+           indekset (commit_page); ellers slettes den.
+
+    Args:
+        response:
+            HTTP-svar hentet med stream=True.
+        entity_type:
+            NSP-entityType for forespørgslen.
+        store:
+            False for sider, der ikke skal genafspilles, fx nøglesæt
+            med få kolonner (default True).
+
+    Returns:
+        pd.DataFrame:
+            Rækkerne fra svaret.
+
+    Raises:
+        ValueError, KeyError, requests.exceptions.RequestException:
+            Som parse_response.
+        OSError:
+            Hvis siden ikke kan skrives til sidelageret.
+    '''
+    if not PAGE_STORE_DIR or not store:
+        return parse_response(response)
+    try:
+        sink = open_page()
+    except OSError:
+        response.close()
+        raise
+    try:
+        df = parse_response(response, sink=sink)
+    except Exception:
+        discard_page(sink)
+        raise
+    commit_page(sink, df, entity_type)
+    return df
+
+def _fetch_page(
+    timestamp: str,
+    after: Optional[int],
+    page_size: int,
+    until: Optional[str],
+    query: Optional[Dict[str, Any]] = None) -> pd.DataFrame:
+    '''
+    Beskrivelse:
+        Henter én side via api_fetch og parser JSON-svaret direkte
+        fra strømmen til et DataFrame.
+
+    Flow:
+        1. Kalder api_fetch for siden efter after med stream=True.
+        2. Parser 'Data'-arrayet inkrementelt til kolonnebuffere via
+           parse_response og danner DataFrame én gang. Med PAGE_STORE_DIR
+           gemmes den rå body samtidig i sidelageret (_parse_page),
+           medmindre forespørgslen har 'store': False.
+        3. Registrerer varighed af kald (indtil headers) og JSON-
+           parsing (inkl. læsning af body) samt antal rækker i metrics.
+
+    Args:
+        timestamp:
+            ISO8601-dato/tid i UTC, der filtreres på.
+        after:
+            Sidste ReferenceNo på forrige side, eller None for første
+            side.
+        page_size:
+            Antal rækker pr. side.
+        until:
+            Valgfri eksklusiv øvre grænse for UpdatedDate.
+        query:
+            Forespørgsel fra plan_queries, eller None for
+            standardopsætningen.
+
+    Returns:
+        pd.DataFrame:
+            Rækkerne på siden. Tomt DataFrame hvis siden er tom.
+
+    Raises:
+        ApiError:
+            Hvis API-kaldet fejler, hvis forbindelsen afbrydes under
+            læsning, eller hvis svaret ikke kan parses som JSON.
+        OSError:
+            Hvis siden ikke kan gemmes i sidelageret.
+    '''
+    query = query or default_query()
+    with timed('api_fetch'):
+        response = api_fetch(timestamp, after, page_size, until, stream=True, query=query)
     try:
-        response = requests.post(
-            API_URL, 
-            headers=headers, 
-            data=payload,
-            timeout=30)
+        with timed('json_decode'):
+            df = _parse_page(response, query['entityType'], store=query.get('store', True))
+        count_rows('api_fetch', len(df))
+        return df
+    except ValueError as exc:
+        logger.error('API-respons kunne ikke parses som JSON: %s', exc, exc_info=True)
+        raise ApiError('API response could not be parsed as JSON') from exc
     except requests.exceptions.RequestException as exc:
-        logger.error('Forbindelsesfejl ved API-kald: %s', exc, exc_info=True)
-        raise ApiError('API request failed due to a connection error') from exc
-    if response.ok:
-        logger.info('Data hentet fra API')
-        logger.debug('API-kald statuskode: %s', response.status_code)
-    else:
-        logger.error('API-kald fejlede (%s): %s', response.status_code, response.text)
-        raise ApiError(f'API request failed with status {response.status_code}')
-    return response
\ No newline at end of file
+        logger.error('Forbindelsesfejl under læsning af API-respons: %s', exc, exc_info=True)
+        raise ApiError('API response could not be read') from exc
+
+def api_fetch_pages(
+    timestamp: str,
+    page_size: int = PAGE_SIZE,
+    until: Optional[str] = None,
+    query: Optional[Dict[str, Any]] = None) -> Iterator[pd.DataFrame]:
+    '''
+    Beskrivelse:
+        Generator der henter alle sider af tickets opdateret siden
+        timestamp og yielder én side ad gangen som DataFrame. Næste
+        side hentes i en baggrundstråd, mens den aktuelle side
+        behandles af kalderen.
+
+    Flow:
+        1. Starter hentning af side 1 i en baggrundstråd.
+        2. Venter på den aktuelle side.
+        3. Hvis siden er fuld (page_size rækker), startes hentning
+           af næste side (ReferenceNo efter sidens største ReferenceNo),
+           før den aktuelle side yieldes.
+        4. Stopper når en side indeholder færre end page_size rækker.
+
+    Args:
+        timestamp:
+            ISO8601-dato/tid i UTC, der filtreres på.
+        page_size:
+            Antal rækker pr. side (default PAGE_SIZE).
+        until:
+            Valgfri eksklusiv øvre grænse for UpdatedDate.
+        query:
+            Forespørgsel fra plan_queries, eller None for
+            standardopsætningen.
+
+    Returns:
+        Iterator[pd.DataFrame]:
+            Ikke-tomme DataFrames, én pr. side, i siderækkefølge.
+
+    Raises:
+        ApiError:
+            Hvis hentningen af en side fejler.
+    '''
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='api_fetch')
+    try:
+        page = 1
+        future = executor.submit(_fetch_page, timestamp, None, page_size, until, query)
+        while future is not None:
+            df = future.result()
+            future = None
+            if len(df) >= page_size:
+                after = int(pd.to_numeric(df['ReferenceNo']).max())
+                future = executor.submit(_fetch_page, timestamp, after, page_size, until, query)
+            if df.empty:
+                break
+            logger.info('Side %s hentet (%s rækker)', page, len(df))
+            yield df
+            page += 1
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
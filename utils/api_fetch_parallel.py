@@ -0,0 +1,230 @@
+import logging
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import pandas as pd
+
+from config import FETCH_MAX_WINDOWS, FETCH_WINDOW_HOURS, FETCH_WORKERS, PAGE_SIZE
+from utils.api_fetch import api_fetch_pages
+from utils.run_pipeline import put_until_stopped
+
+#######################################################################
+
+logger = logging.getLogger(__name__)
+
+ISO_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+
+_WINDOW_DONE = object()
+
+def split_windows(
+    timestamp: str,
+    window_hours: int = FETCH_WINDOW_HOURS) -> List[Tuple[str, Optional[str]]]:
+    '''
+    Beskrivelse:
+        Opdeler intervallet fra timestamp til nu i tidsvinduer af
+        window_hours timers længde til brug for parallel hentning.
+
+    Flow:
+        1. Parser timestamp som UTC og finder nuværende tidspunkt.
+        2. Danner sammenhængende vinduer [start, slut) af fast længde.
+        3. Sidste vindue får ingen øvre grænse (None), så tickets
+           opdateret under kørslen også kommer med.
+
+    Args:
+        timestamp:
+            ISO8601-dato/tid i UTC, hvorfra der skal hentes.
+        window_hours:
+            Længden af hvert vindue i timer (default FETCH_WINDOW_HOURS).
+
+    Returns:
+        List[Tuple[str, Optional[str]]]:
+            Liste af (start, slut)-par som ISO8601 UTC-strenge.
+            Slut er None for det sidste vindue.
+
+    Raises:
+        ValueError:
+            Hvis timestamp ikke kan parses som dato/tid.
+    '''
+    start = pd.Timestamp(timestamp)
+    start = start.tz_localize('UTC') if start.tzinfo is None else start.tz_convert('UTC')
+    now = pd.Timestamp.now(tz='UTC')
+    step = pd.Timedelta(hours=window_hours)
+
+    windows: List[Tuple[str, Optional[str]]] = []
+    window_start = timestamp
+    boundary = start + step
+    while boundary < now:
+        window_end = boundary.strftime(ISO_FORMAT)
+        windows.append((window_start, window_end))
+        window_start = window_end
+        boundary += step
+    windows.append((window_start, None))
+    return windows
+
+def _stream_window(
+    window_start: str,
+    window_end: Optional[str],
+    query: Optional[Dict[str, Any]],
+    page_size: int,
+    out_queue: queue.Queue,
+    stop: threading.Event) -> None:
+    '''
+    Beskrivelse:
+        Henter siderne for ét tidsvindue til out_queue. Køen er
+        begrænset, så vinduet højst ligger buffer_pages sider foran
+        kalderen. Køres i en tråd fra api_fetch_windows.
+
+    Flow:
+        1. Henter vinduets sider med api_fetch_pages (keyset-paginering
+           på ReferenceNo inden for [window_start, window_end)).
+        2. Lægger hver side i out_queue med put_until_stopped og
+           stopper uden videre, hvis stop sættes.
+        3. Fejler hentningen, lægges undtagelsen i køen i stedet for
+           _WINDOW_DONE, så kalderen kan hæve den.
+        4. Generatoren lukkes altid, så en igangværende prefetch
+           stoppes.
+        5. Afslutter med _WINDOW_DONE, når alle sider er lagt i køen.
+
+    Args:
+        window_start:
+            Vinduets nedre grænse som ISO8601 UTC (inklusiv).
+        window_end:
+            Vinduets øvre grænse som ISO8601 UTC (eksklusiv), eller
+            None for det sidste, åbne vindue.
+        query:
+            Udtræksforespørgsel (filtre og felter), eller None for
+            standardforespørgslen.
+        page_size:
+            Antal tickets pr. side.
+        out_queue:
+            Vinduets egen kø, som api_fetch_windows læser fra.
+        stop:
+            Sættes af api_fetch_windows, når kalderen stopper.
+
+    Returns:
+        None. Sider, undtagelse og _WINDOW_DONE leveres via out_queue.
+
+    Raises:
+        Ingen. Fejl fra hentningen leveres via out_queue.
+    '''
+    pages = api_fetch_pages(window_start, page_size=page_size, until=window_end, query=query)
+    try:
+        for df in pages:
+            if not put_until_stopped(out_queue, df, stop):
+                return
+    except Exception as exc:
+        put_until_stopped(out_queue, exc, stop)
+        return
+    finally:
+        pages.close()
+    put_until_stopped(out_queue, _WINDOW_DONE, stop)
+
+def api_fetch_windows(
+    timestamp: str,
+    workers: int = FETCH_WORKERS,
+    window_hours: int = FETCH_WINDOW_HOURS,
+    query: Optional[Dict[str, Any]] = None,
+    buffer_pages: int = 2,
+    max_windows: int = FETCH_MAX_WINDOWS,
+    status: Optional[Dict[str, Any]] = None,
+    page_size: int = PAGE_SIZE) -> Iterator[pd.DataFrame]:
+    '''
+    Beskrivelse:
+        Henter tickets opdateret siden timestamp ved at opdele
+        UpdatedDate-intervallet i tidsvinduer og hente vinduerne
+        samtidigt. Bruges til backfill, hvor én seriel hentning ville
+        tage mange cyklusser. Siderne yieldes én ad gangen i stedet for
+        at samle hele backfillet i ét DataFrame, så hukommelsesforbruget
+        ikke vokser med backfillets størrelse.
+
+    Flow:
+        1. Opdeler intervallet i vinduer via split_windows. Med
+           max_windows > 0 hentes kun de første max_windows vinduer, og
+           status['more'] sættes til True og status['until'] til
+           slutningen af sidste hentede vindue, så kalderen ved, at
+           hentningen stoppede før nu, og hvorfra næste cyklus skal
+           fortsætte. Ellers sættes status['more'] til False.
+        2. Højst workers vinduer hentes samtidigt, hver i sin tråd, som
+           lægger siderne i en kø med plads til buffer_pages sider.
+           Fulde køer bremser hentningen (backpressure), så højst ca.
+           workers * (buffer_pages + 2) sider er i hukommelsen ad gangen.
+        3. Hvert vindue [start, slut) hentes med keyset-paginering på
+           ReferenceNo (api_fetch_pages), så en ticket, der opdateres
+           under hentningen og forlader sit lukkede vindue, ikke flytter
+           de efterfølgende rækker, og ingen rækker i vinduet springes
+           over. Inden for et vindue forekommer hvert ReferenceNo derfor
+           højst én gang.
+        4. Siderne yieldes vindue for vindue i tidsrækkefølge. Når et
+           vindue er tømt, startes det næste. En ticket, der under
+           hentningen flytter til et senere vindue, hentes igen dér med
+           sin nyere version, som skrives efter den ældre. Den fjernes
+           ikke som dublet, da den bærer opdateringen.
+
+    Args:
+        timestamp:
+            ISO8601-dato/tid i UTC, hvorfra der skal hentes.
+        workers:
+            Maksimalt antal samtidige vinduer (default FETCH_WORKERS).
+        window_hours:
+            Længden af hvert vindue i timer (default FETCH_WINDOW_HOURS).
+        query:
+            Forespørgsel fra plan_queries, eller None for
+            standardopsætningen.
+        buffer_pages:
+            Antal hentede sider, der kan vente pr. vindue (default 2).
+        max_windows:
+            Maksimalt antal vinduer pr. kald, eller 0 for alle (default
+            FETCH_MAX_WINDOWS).
+        status:
+            Valgfri dict, som udfyldes med 'more' og 'until' (se Flow).
+        page_size:
+            Antal rækker pr. side (default PAGE_SIZE).
+
+    Returns:
+        Iterator[pd.DataFrame]:
+            Ikke-tomme sider i vinduernes rækkefølge.
+
+    Raises:
+        ApiError:
+            Hvis hentningen af et vindue fejler.
+    '''
+    windows = split_windows(timestamp, window_hours)
+    more = 0 < max_windows < len(windows)
+    if more:
+        logger.info('Henter %s af %s vinduer i denne cyklus', max_windows, len(windows))
+        windows = windows[:max_windows]
+    if status is not None:
+        status['more'] = more
+        status['until'] = windows[-1][1] if more else None
+    workers = max(1, min(workers, len(windows)))
+    logger.info('Henter %s vinduer parallelt side for side (%s workers)', len(windows), workers)
+    stop = threading.Event()
+    queues: List[Optional[queue.Queue]] = [queue.Queue(maxsize=max(buffer_pages, 1)) for _ in windows]
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='api_window')
+
+    def submit(index: int) -> None:
+        if index < len(windows):
+            window_start, window_end = windows[index]
+            executor.submit(_stream_window, window_start, window_end, query, page_size, queues[index], stop)
+
+    try:
+        for index in range(workers):
+            submit(index)
+        for index, (window_start, window_end) in enumerate(windows):
+            rows = 0
+            while True:
+                item = queues[index].get()
+                if item is _WINDOW_DONE:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                rows += len(item)
+                yield item
+            logger.info('Vindue %s - %s hentet (%s rækker)', window_start, window_end or 'nu', rows)
+            queues[index] = None
+            submit(index + workers)
+    finally:
+        stop.set()
+        executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,111 @@
+import logging
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import pandas as pd
+from sqlalchemy.engine import Connection
+
+from utils.sql_dialect import get_dialect
+from utils.to_params import to_params
+
+#######################################################################
+
+logger = logging.getLogger(__name__)
+
+def bulk_merge(
+    conn: Connection,
+    table_name: str,
+    df: pd.DataFrame,
+    key: str = 'id',
+    hash_col: Optional[str] = None,
+    touch_cols: Sequence[str] = (),
+    clear_cols: Sequence[str] = (),
+    version_col: Optional[str] = None,
+    frozen_cols: Sequence[str] = ()) -> Tuple[Dict[str, int], List[Any]]:
+    '''
+    Beskrivelse:
+        Upserter alle rækker i df til table_name med én bulk-indlæsning
+        i en midlertidig staging-tabel og én set-baseret upsert på
+        serveren, i stedet for én upsert pr. række. SQL'en leveres af
+        databasens SqlDialect (MERGE på MSSQL, INSERT ... ON CONFLICT
+        på PostgreSQL og SQLite).
+
+    Flow:
+        1. Fjerner dubletter på key (sidste forekomst vinder), da
+           upserten ikke tillader flere kilderækker pr. målrække.
+        2. Opretter en tom temp-tabel (<table_name>_staging) med samme
+           kolonnetyper som måltabellen.
+        3. Indsætter alle rækker i staging-tabellen med ét executemany-
+           kald direkte på driveren (pyodbc fast_executemany på MSSQL)
+           med rækketupler fra to_params.
+        4. Kører én upsert fra staging-tabellen til måltabellen:
+           - Matcher på key
+           - Opdaterer alle øvrige kolonner ved match (kun hvis hash_col
+             er NULL i target eller afviger fra source, når hash_col
+             er angivet)
+           - Skriver touch_cols ved match, også når hash_col er uændret,
+             hvis værdien afviger, og nulstiller clear_cols. Rækker, hvor
+             kun det sker, tælles som uændrede
+           - Springer match over, hvor kildens version_col er ældre end
+             målets, eller hvor en af frozen_cols er sat i målet
+           - Indsætter ny række ved ikke-match
+           Handlingen pr. berørt nøgle returneres af dialekten.
+        5. Dropper staging-tabellen.
+
+    Args:
+        conn:
+            Åben SQLAlchemy Connection i en aktiv transaktion.
+        table_name:
+            Navnet på måltabellen.
+        df:
+            DataFrame hvis kolonnenavne svarer til kolonner i måltabellen,
+            og hvor NULL-værdier er None.
+        key:
+            Navnet på nøglekolonnen der matches på (default 'id').
+        hash_col:
+            Valgfri kolonne med rækkefingeraftryk. Er den angivet,
+            springes rækker med uændret fingeraftryk over.
+        touch_cols:
+            Kolonner uden for fingeraftrykket (fx last_updated), som
+            skrives, selv om fingeraftrykket er uændret.
+        clear_cols:
+            Kolonner uden for df (fx deleted_at), som sættes til NULL for
+            hver række, der upsertes.
+        version_col:
+            Valgfri kolonne (fx last_updated). Er den angivet, overskriver
+            en ældre version ikke en nyere.
+        frozen_cols:
+            Kolonner uden for df (fx deleted_at), der låser en eksisterende
+            række, når de er sat.
+
+    Returns:
+        Tuple[Dict[str, int], List[Any]]:
+            Antal rækker der blev indsat ('inserted'), opdateret
+            ('updated') og sprunget over ('skipped', inkl. rækker hvor
+            kun touch_cols er skrevet), samt nøglerne for de indsatte og
+            opdaterede rækker. Nøglekolonnen
+            forventes at være et heltal.
+
+    Raises:
+        sqlalchemy.exc.SQLAlchemyError:
+            Hvis en af SQL-sætningerne fejler.
+    '''
+    if df.empty:
+        return {'inserted': 0, 'updated': 0, 'skipped': 0}, []
+    df = df.drop_duplicates(subset=[key], keep='last')
+    dialect = get_dialect(conn)
+    columns: List[str] = list(df.columns)
+
+    staging = dialect.create_staging(conn, f'{table_name}_staging', table_name, columns)
+    dialect.insert_rows(conn, staging, columns, to_params(df))
+    actions = dialect.merge(
+        conn, table_name, staging, columns, key, hash_col, touch_cols, clear_cols, version_col, frozen_cols)
+    dialect.drop_temp(conn, staging)
+
+    written = [(action, key_value) for action, key_value in actions if action != 'TOUCH']
+    inserted = sum(1 for action, _ in written if action == 'INSERT')
+    counts = {
+        'inserted': inserted,
+        'updated': len(written) - inserted,
+        'skipped': len(df) - len(written)}
+    logger.debug('%s bulk-merged via %s (%s)', table_name, staging, counts)
+    return counts, [key_value for _, key_value in written]
@@ -59,8 +59,9 @@ def create_dim_df(
         3. Fjerner dubletter baseret på id-kolonnen.
         4. Omdøber kolonner til id_name og label_name.
         5. Finder det relevante opslagsdict i DICT_LOOKUP baseret på label_name.
-        6. Mapper id'er til nye labels via opslagsdict, og anvender
-           den oprindelige label fra df som fallback, hvis der ikke findes et match.
+        6. Mapper id'er til nye labels via opslagsdict med ét vektoriseret
+           map, og anvender den oprindelige label fra df som fallback,
+           hvis der ikke findes et match.
         7. Returnerer en ren dimensionstabel med kolonnerne [id_name, label_name].
 
     Args:
@@ -86,9 +87,6 @@ def create_dim_df(
     Raises:
         KeyError:
             Hvis id_column_name eller label_column_name ikke findes i df.
-        IndexError:
-            Hvis fallback-labelen for en id-værdi ikke kan findes i df
-            (teoretisk kanttilfælde).
     '''
     logger.info('Danner %s_df', label_name)
     dim_df = (
@@ -100,10 +98,8 @@ def create_dim_df(
     lookup_dict = DICT_LOOKUP.get(label_name)
 
     if lookup_dict is not None:
-        dim_df[label_name] = dim_df[id_name].map(
-            lambda dim_id: lookup_dict.get(
-                dim_id,
-                dim_df.loc[dim_df[id_name] == dim_id, label_name].iloc[0]))
+        mapped = dim_df[id_name].map(lookup_dict)
+        dim_df[label_name] = mapped.where(mapped.notna(), dim_df[label_name])
 
     logger.info('%s_df dannet', label_name)
     return dim_df
\ No newline at end of file
@@ -1,30 +1,134 @@
 import logging
-from typing import List
+from typing import Dict, List, Optional, Tuple
 
+import numpy as np
 import pandas as pd
 
+from config import DATE_FORMAT
+from utils.to_params import native_column
+
 #######################################################################
 
 # Flere hjælpekolonner. (is_planned = 0,1), ... ?
 
 logger = logging.getLogger(__name__)
 
+TICKET_SCHEMA: Dict[str, Tuple[Optional[str], str]] = {
+    'id': ('ReferenceNo', 'int'),
+    'agent_group_id': ('AgentGroup.Id', 'id'),
+    'task_status_id': ('BaseEntityStatus.Id', 'id'),
+    'created_date': ('CreatedDate', 'date'),
+    'closed_date': ('CloseDateTime', 'date'),
+    'open_days': (None, 'int'),
+    'queue_days': (None, 'int'),
+    'priority': ('Priority', 'text'),
+    'agent': ('BaseAgent', 'text'),
+    'user': ('BaseEndUser', 'text'),
+    'ticket_title': ('BaseHeader', 'text'),
+    'start_date': ('u_Opstart', 'date'),
+    'end_date': ('u_Afslutning', 'date'),
+    'duration': (None, 'int'),
+    'task_type_id': ('u_Opgavetype.Id', 'id'),
+    'task_area_id': ('u_Omrder.Id', 'id'),
+    'reason_for_rejection_id': ('u_Afvisningsrsag.Id', 'id'),
+    'last_updated': ('UpdatedDate', 'text')}
+
+HASH_EXCLUDE_COLS: List[str] = [
+    'id',
+    'last_updated']
+
+# Kolonner uden for fingeraftrykket, som upserten altid holder ajour
+TOUCH_COLS: List[str] = [col for col in HASH_EXCLUDE_COLS if col != 'id']
+
+def row_hash(typed: Dict[str, pd.Series]) -> np.ndarray:
+    '''
+    Beskrivelse:
+        Beregner et stabilt fingeraftryk pr. række af de typede
+        ticket-kolonner, så uændrede tickets kan springes over ved upsert.
+
+    Flow:
+        1. Udvælger alle kolonner undtagen HASH_EXCLUDE_COLS (id matches
+           separat, og last_updated ændres af NSP ved trivielle
+           redigeringer).
+        2. Hasher kolonnerne i deres deklarerede dtype (TICKET_SCHEMA)
+           med pandas' faste hash-nøgle og kombinerer dem pr. række.
+        3. Fortolker resultatet som signed 64-bit, så det passer i BIGINT.
+
+    Args:
+        typed:
+            Typede kolonner pr. outputnavn fra create_ticket_df.
+
+    Returns:
+        np.ndarray:
+            int64-array med én hash pr. række.
+
+    Raises:
+        Ingen.
+    '''
+    hash_df = pd.DataFrame(
+        {name: series for name, series in typed.items() if name not in HASH_EXCLUDE_COLS},
+        copy=False)
+    hashes = pd.util.hash_pandas_object(hash_df, index=False)
+    return hashes.to_numpy().view('int64')
+
+def _typed_column(values: pd.Series, kind: str) -> pd.Series:
+    '''
+    Beskrivelse:
+        Konverterer en rå kolonne til den dtype, der er deklareret
+        for dens type i TICKET_SCHEMA.
+
+    Flow:
+        1. 'id': nullable Int64, hvor 0 betyder "ingen værdi" (NA).
+        2. 'int': nullable Int64.
+        3. 'date': datetime64 normaliseret til dato, parset med DATE_FORMAT.
+        4. 'text': string-dtype.
+
+    Args:
+        values:
+            Rå kolonne fra df.
+        kind:
+            En af 'id', 'int', 'date' eller 'text'.
+
+    Returns:
+        pd.Series:
+            Typet kolonne med samme index som values.
+
+    Raises:
+        ValueError:
+            Hvis kind er ukendt, eller hvis værdier i en id-/int-kolonne
+            ikke er heltal.
+    '''
+    if kind == 'id':
+        ids = pd.to_numeric(values, errors='coerce').astype('Int64')
+        return ids.mask(ids == 0)
+    if kind == 'int':
+        return pd.to_numeric(values, errors='coerce').astype('Int64')
+    if kind == 'date':
+        return pd.to_datetime(values, errors='coerce', format=DATE_FORMAT)
+    if kind == 'text':
+        return values.astype('string')
+    raise ValueError(f'Ukendt kolonnetype: {kind}')
+
 def create_ticket_df(df: pd.DataFrame) -> pd.DataFrame:
     '''
     Beskrivelse:
         Danner en normaliseret ticket-DataFrame til indlæsning i databasen
-        baseret på rå NSP-ticketdata.
+        baseret på rå NSP-ticketdata. Kolonnerne dannes én ad gangen ud
+        fra TICKET_SCHEMA, uden at ændre df og uden kopier af hele
+        DataFrame undervejs.
 
     Flow:
-        1. Konverterer rå datokolonner til datetime (med coercion ved fejl).
-        2. Beregner afledte felter:
+        1. Konverterer hver kildekolonne i TICKET_SCHEMA til sin
+           deklarerede dtype: nullable Int64 for id'er (0 bliver NULL)
+           og heltal, datetime for datoer og string for tekst.
+        2. Beregner afledte felter på de typede datoer:
            - open_days: antal dage fra oprettelse til lukning (inkl. begge dage)
            - duration: antal dage fra opstart til afslutning (inkl. begge dage)
            - queue_days: antal dage fra oprettelse til opstart
-        3. Omdøber kolonner til konsistente snake_case-navne.
-        4. Vælger et fast sæt kolonner til output.
-        5. Konverterer udvalgte id- og datokolonner til object og sætter
-           0 og NaN til None, så de håndteres korrekt som NULL i SQL.
+        3. Beregner row_hash over de typede kolonner via row_hash.
+        4. Konverterer hver kolonne én gang til native Python-værdier
+           med None for NULL og samler resultatet i ét DataFrame med
+           snake_case-kolonnenavne i fast rækkefølge.
 
     Args:
         df:
@@ -42,7 +146,9 @@ def create_ticket_df(df: pd.DataFrame) -> pd.DataFrame:
              'closed_date', 'open_days', 'queue_days', 'priority',
              'agent', 'user', 'ticket_title', 'start_date', 'end_date',
              'duration', 'task_type_id', 'task_area_id',
-             'reason_for_rejection_id', 'last_updated'].
+             'reason_for_rejection_id', 'last_updated', 'row_hash'].
+            Alle kolonner er object med native Python-værdier
+            (int, datetime.date, str) og None for NULL.
 
     Raises:
         KeyError:
@@ -50,86 +156,19 @@ def create_ticket_df(df: pd.DataFrame) -> pd.DataFrame:
             ikke findes i df (fx ved fejl i tidligere pipeline-step).
     '''
     logger.info('Danner ticket_df')
-    date_cols: List[str] = [
-        'CreatedDate',
-        'CloseDateTime',
-        'u_Opstart',
-        'u_Afslutning']
-    
-    for col in date_cols:
-        df[col] = pd.to_datetime(df[col], errors='coerce')
-    df['open_days'] = (
-    df['CloseDateTime'].dt.normalize() - df['CreatedDate'].dt.normalize()).dt.days + 1
-    df['duration'] = (df['u_Afslutning'].dt.normalize() - df['u_Opstart'].dt.normalize()).dt.days + 1
-    df['queue_days'] = (df['u_Opstart'].dt.normalize() - df['CreatedDate'].dt.normalize()).dt.days
-    ticket_df = df.rename(columns={
-        'ReferenceNo': 'id',
-        'AgentGroup.Id': 'agent_group_id',
-        'BaseEntityStatus.Id': 'task_status_id',
-        'Priority': 'priority',
-        'BaseAgent': 'agent',
-        'BaseEndUser': 'user',
-        'BaseHeader': 'ticket_title',
-        'u_Opstart': 'start_date',
-        'u_Afslutning': 'end_date',
-        'u_Opgavetype.Id': 'task_type_id',
-        'u_Omrder.Id': 'task_area_id',
-        'u_Afvisningsrsag.Id': 'reason_for_rejection_id',
-        'CreatedDate': 'created_date',
-        'CloseDateTime': 'closed_date',
-        'UpdatedDate': 'last_updated'})
-
-    ticket_df = ticket_df[[
-        'id',
-        'agent_group_id',
-        'task_status_id',
-        'created_date',
-        'closed_date',
-        'open_days',
-        'queue_days',
-        'priority',
-        'agent',
-        'user',
-        'ticket_title',
-        'start_date',
-        'end_date',
-        'duration',
-        'task_type_id',
-        'task_area_id',
-        'reason_for_rejection_id',
-        'last_updated']]
-
-    id_cols: List[str] = [
-        'agent_group_id',
-        'task_status_id',
-        'task_type_id',
-        'task_area_id',
-        'reason_for_rejection_id']
-    
-    for col in id_cols:
-        ticket_df[col] = ticket_df[col].astype('object')
-        ticket_df.loc[ticket_df[col] == 0, col] = None
-        ticket_df.loc[ticket_df[col].isna(), col] = None
-
-    int_cols: List[str] = [
-        'open_days',
-        'queue_days',
-        'duration']
-    
-    for col in int_cols:
-        ticket_df[col] = ticket_df[col].astype('object')
-        ticket_df.loc[ticket_df[col].isna(), col] = None
-    
-    normalized_date_cols: List[str] = [
-        'created_date',
-        'closed_date',
-        'start_date',
-        'end_date']
-    
-    for col in normalized_date_cols:
-        ticket_df[col] = ticket_df[col].astype('object')
-        ticket_df.loc[ticket_df[col].isna(), col] = None
-
-    ticket_df = ticket_df.where(ticket_df.notna(), None)
+    typed: Dict[str, pd.Series] = {}
+    for name, (source, kind) in TICKET_SCHEMA.items():
+        if source is not None:
+            typed[name] = _typed_column(df[source], kind)
+
+    typed['open_days'] = (typed['closed_date'] - typed['created_date']).dt.days.astype('Int64') + 1
+    typed['duration'] = (typed['end_date'] - typed['start_date']).dt.days.astype('Int64') + 1
+    typed['queue_days'] = (typed['start_date'] - typed['created_date']).dt.days.astype('Int64')
+    typed = {name: typed[name] for name in TICKET_SCHEMA}
+
+    hashes = row_hash(typed)
+    columns = {name: native_column(typed[name], as_date=kind == 'date') for name, (_, kind) in TICKET_SCHEMA.items()}
+    columns['row_hash'] = hashes
+    ticket_df = pd.DataFrame(columns, index=df.index, copy=False)
     logger.info('ticket_df dannet')
-    return ticket_df
\ No newline at end of file
+    return ticket_df
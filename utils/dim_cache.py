@@ -0,0 +1,207 @@
+import logging
+from typing import Any, Dict, List, Tuple
+
+import pandas as pd
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+from utils.sql_dialect import get_dialect
+
+#######################################################################
+
+logger = logging.getLogger(__name__)
+
+DIM_TABLES: Dict[str, str] = {
+    'agent_groups': 'group',
+    'task_types': 'type',
+    'task_areas': 'area',
+    'task_status': 'status',
+    'reasons_for_rejection': 'reason'}
+
+# Database (engine-URL) -> tabel -> id -> label. Én cache pr. database,
+# da udtrækskonfigurationen kan skrive til flere måldatabaser.
+DIM_CACHE: Dict[str, Dict[str, Dict[Any, Any]]] = {}
+
+def _normalize(value: Any) -> Any:
+    '''
+    Beskrivelse:
+        Gør manglende værdier ens (None), så NaN, pd.NA og None
+        sammenlignes som samme label i cachen.
+
+    Args:
+        value:
+            Label fra databasen eller et DataFrame.
+
+    Returns:
+        Any:
+            None for manglende værdier, ellers value uændret.
+
+    Raises:
+        Ingen.
+    '''
+    return None if pd.isna(value) else value
+
+def _cache(engine: Engine) -> Dict[str, Dict[Any, Any]]:
+    '''
+    Beskrivelse:
+        Finder (eller opretter) dimensionscachen for én database, så
+        flere måldatabaser i samme proces har hver deres cache.
+
+    Args:
+        engine:
+            Engine for måldatabasen; cachen nøgles på dens URL.
+
+    Returns:
+        Dict[str, Dict[Any, Any]]:
+            id→label pr. dimensionstabel for databasen.
+
+    Raises:
+        Ingen.
+    '''
+    return DIM_CACHE.setdefault(str(engine.url), {})
+
+def load_dim_cache(engine: Engine) -> None:
+    '''
+    Beskrivelse:
+        Indlæser de aktuelle id→label-par fra alle dimensionstabeller
+        i DIM_TABLES til processens dimensionscache for databasen.
+
+    Flow:
+        1. Læser id og label-kolonnen fra hver tabel i DIM_TABLES.
+        2. Erstatter cachens indhold for tabellen med resultatet.
+
+    Args:
+        engine:
+            SQLAlchemy Engine-instans med forbindelse til databasen.
+
+    Returns:
+        None. Resultatet ligger i DIM_CACHE under engine-URL'en.
+
+    Raises:
+        sqlalchemy.exc.SQLAlchemyError:
+            Hvis en af forespørgslerne fejler.
+    '''
+    logger.info('Indlæser dimensionscache')
+    quote = get_dialect(engine).quote
+    cache = _cache(engine)
+    with engine.connect() as conn:
+        for table_name, label_col in DIM_TABLES.items():
+            result = conn.execute(text(f'SELECT id, {quote(label_col)} FROM {table_name};'))
+            cache[table_name] = {row[0]: _normalize(row[1]) for row in result}
+    logger.info(
+        'Dimensionscache indlæst (%s)',
+        ', '.join(f'{table}: {len(pairs)}' for table, pairs in cache.items()))
+
+def is_dim_cache_loaded(engine: Engine) -> bool:
+    '''
+    Beskrivelse:
+        Angiver om cachen for databasen indeholder alle tabeller i
+        DIM_TABLES.
+
+    Flow:
+        1. Tjekker at hver tabel i DIM_TABLES findes i cachen for engine.
+
+    Args:
+        engine:
+            SQLAlchemy Engine-instans for databasen.
+
+    Returns:
+        bool:
+            True hvis cachen er indlæst, ellers False.
+
+    Raises:
+        Ingen.
+    '''
+    cache = _cache(engine)
+    return all(table_name in cache for table_name in DIM_TABLES)
+
+def changed_dim_rows(
+    engine: Engine,
+    table_name: str,
+    dim_df: pd.DataFrame,
+    label_col: str) -> pd.DataFrame:
+    '''
+    Beskrivelse:
+        Returnerer de rækker i dim_df, der er nye eller har fået ny label
+        i forhold til dimensionscachen.
+
+    Flow:
+        1. Slår hvert id op i cachen for table_name i databasen.
+        2. Beholder rækker hvor id mangler, eller hvor labelen afviger.
+
+    Args:
+        engine:
+            SQLAlchemy Engine-instans for databasen.
+        table_name:
+            Navnet på dimensionstabellen.
+        dim_df:
+            Dimensionstabel med kolonnerne ['id', label_col].
+        label_col:
+            Navnet på label-kolonnen.
+
+    Returns:
+        pd.DataFrame:
+            Delmængde af dim_df med nye eller ændrede rækker.
+
+    Raises:
+        KeyError:
+            Hvis cachen for table_name ikke er indlæst.
+    '''
+    cache = _cache(engine)[table_name]
+    missing = object()
+    mask = [
+        cache.get(dim_id, missing) != _normalize(label)
+        for dim_id, label in zip(dim_df['id'], dim_df[label_col])]
+    return dim_df[mask]
+
+def update_dim_cache(engine: Engine, written: List[Tuple[str, pd.DataFrame, str]]) -> None:
+    '''
+    Beskrivelse:
+        Opdaterer dimensionscachen med rækker, der er skrevet til
+        databasen. Kaldes først, når transaktionen er committet.
+
+    Flow:
+        1. Lægger id→label for hver skrevet række ind i cachen
+           for den pågældende tabel.
+
+    Args:
+        engine:
+            SQLAlchemy Engine-instans for databasen.
+        written:
+            Liste af (tabelnavn, DataFrame, label-kolonne) for de
+            rækker, der blev skrevet.
+
+    Returns:
+        None.
+
+    Raises:
+        KeyError:
+            Hvis cachen for en tabel ikke er indlæst.
+    '''
+    for table_name, dim_df, label_col in written:
+        cache = _cache(engine)[table_name]
+        for dim_id, label in zip(dim_df['id'], dim_df[label_col]):
+            cache[dim_id] = _normalize(label)
+
+def invalidate_dim_cache(engine: Engine) -> None:
+    '''
+    Beskrivelse:
+        Tømmer dimensionscachen for databasen, så den genindlæses
+        ved næste skrivning. Bruges når en skrivning fejler, og
+        cachens indhold derfor ikke kan stoles på.
+
+    Flow:
+        1. Fjerner databasens cache fra DIM_CACHE.
+
+    Args:
+        engine:
+            SQLAlchemy Engine-instans for databasen.
+
+    Returns:
+        None.
+
+    Raises:
+        Ingen.
+    '''
+    logger.info('Dimensionscache invalideret')
+    DIM_CACHE.pop(str(engine.url), None)
@@ -0,0 +1,54 @@
+import logging
+from typing import Set
+
+import sqlalchemy
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+from utils.sql_dialect import get_dialect
+
+#######################################################################
+
+logger = logging.getLogger(__name__)
+
+_schema_ensured: Set[str] = set()
+
+def ensure_schema(engine: Engine) -> None:
+    '''
+    Beskrivelse:
+        Sikrer at de kolonner og tabeller, som ETL-processen selv
+        vedligeholder, findes i databasen. Sætningerne er idempotente
+        og køres kun én gang pr. database pr. proces.
+
+    Flow:
+        1. Returnerer med det samme, hvis skemaet allerede er sikret
+           for databasen (engine-URL'en) i denne proces.
+        2. Kører hver sætning fra databasens SqlDialect
+           (schema_statements) i én transaktion. På MSSQL er det
+           row_hash-kolonnen og etl_state; på PostgreSQL og SQLite
+           oprettes også tickets og dimensionstabellerne.
+        3. Markerer skemaet som sikret for databasen.
+
+    Args:
+        engine:
+            SQLAlchemy Engine-instans med forbindelse til databasen.
+
+    Returns:
+        None.
+
+    Raises:
+        sqlalchemy.exc.SQLAlchemyError:
+            Hvis en DDL-sætning fejler, fx pga. manglende rettigheder.
+    '''
+    if str(engine.url) in _schema_ensured:
+        return
+    logger.info('Sikrer databaseskema')
+    try:
+        with engine.begin() as conn:
+            for statement in get_dialect(conn).schema_statements(conn):
+                conn.execute(text(statement))
+    except sqlalchemy.exc.SQLAlchemyError as exc:
+        logger.error('Fejl ved sikring af databaseskema: %s', exc, exc_info=True)
+        raise
+    _schema_ensured.add(str(engine.url))
+    logger.info('Databaseskema sikret')
@@ -0,0 +1,132 @@
+import datetime
+import logging
+from typing import Any, Optional, Union
+
+import pandas as pd
+from sqlalchemy import DateTime, Float, bindparam, text
+from sqlalchemy.engine import Connection, Engine
+
+from utils.format_df import parse_dates
+from utils.sql_dialect import get_dialect
+
+#######################################################################
+
+logger = logging.getLogger(__name__)
+
+TICKETS_SOURCE = 'tickets'
+
+def to_watermark(values: pd.Series) -> Optional[datetime.datetime]:
+    '''
+    Beskrivelse:
+        Finder det seneste tidspunkt i en serie af NSP-timestamps og
+        returnerer det som naiv UTC-datetime til lagring i etl_state.
+
+    Flow:
+        1. Parser værdierne som UTC via parse_dates (ugyldige værdier
+           bliver NaT).
+        2. Finder maksimum og fjerner tidszonen.
+
+    Args:
+        values:
+            Serie med ISO8601-timestamps, fx df['UpdatedDate'].
+
+    Returns:
+        Optional[datetime.datetime]:
+            Seneste tidspunkt som naiv UTC-datetime, eller None hvis
+            serien ikke indeholder gyldige værdier.
+
+    Raises:
+        Ingen.
+    '''
+    latest = parse_dates(values).max()
+    if pd.isna(latest):
+        return None
+    return latest.tz_localize(None).to_pydatetime()
+
+def get_etl_state(conn: Union[Engine, Connection], source: str = TICKETS_SOURCE) -> Optional[Any]:
+    '''
+    Beskrivelse:
+        Læser ETL-tilstanden for én kilde fra etl_state med et
+        nøgleopslag på source.
+
+    Flow:
+        1. Udfører SELECT på etl_state for den givne source.
+        2. Returnerer rækken eller None.
+
+    Args:
+        conn:
+            SQLAlchemy Engine eller åben Connection.
+        source:
+            Navnet på kilden (default TICKETS_SOURCE).
+
+    Returns:
+        Optional[Row]:
+            Række med kolonnerne source, watermark, last_page,
+            rows_processed, cycle_duration og updated_at, eller None
+            hvis kilden ikke har nogen tilstand endnu.
+
+    Raises:
+        sqlalchemy.exc.SQLAlchemyError:
+            Hvis forespørgslen fejler.
+    '''
+    query = text('''
+        SELECT source, watermark, last_page, rows_processed, cycle_duration, updated_at
+        FROM etl_state
+        WHERE source = :source;
+        ''').columns(watermark=DateTime(), updated_at=DateTime())
+    if isinstance(conn, Engine):
+        with conn.connect() as connection:
+            return connection.execute(query, {'source': source}).fetchone()
+    return conn.execute(query, {'source': source}).fetchone()
+
+def update_etl_state(
+    conn: Connection,
+    source: str = TICKETS_SOURCE,
+    watermark: Optional[datetime.datetime] = None,
+    last_page: Optional[int] = None,
+    rows_processed: Optional[int] = None,
+    cycle_duration: Optional[float] = None) -> None:
+    '''
+    Beskrivelse:
+        Upserter ETL-tilstanden for én kilde. Kaldes med kalderens
+        Connection, så tilstanden committes i samme transaktion som
+        de data, den beskriver.
+
+    Flow:
+        1. Upsert på source i etl_state via databasens SqlDialect
+           (MERGE på MSSQL, INSERT ... ON CONFLICT ellers).
+        2. Felter der er None, bevarer deres nuværende værdi.
+        3. updated_at sættes til nuværende UTC-tid.
+
+    Args:
+        conn:
+            Åben SQLAlchemy Connection i en aktiv transaktion.
+        source:
+            Navnet på kilden (default TICKETS_SOURCE).
+        watermark:
+            Nyt watermark (naiv UTC-datetime), eller None.
+        last_page:
+            Seneste skrevne side i cyklussen, eller None.
+        rows_processed:
+            Antal rækker skrevet indtil videre i cyklussen, eller None.
+        cycle_duration:
+            Varighed af seneste afsluttede cyklus i sekunder, eller None.
+
+    Returns:
+        None.
+
+    Raises:
+        sqlalchemy.exc.SQLAlchemyError:
+            Hvis upsert-sætningen fejler.
+    '''
+    query = text(get_dialect(conn).upsert_state_sql()).bindparams(
+        bindparam('watermark', type_=DateTime()),
+        bindparam('cycle_duration', type_=Float()))
+    conn.execute(
+        query,
+        {
+            'source': source,
+            'watermark': watermark,
+            'last_page': last_page,
+            'rows_processed': rows_processed,
+            'cycle_duration': cycle_duration})
@@ -0,0 +1,205 @@
+import json
+import logging
+from typing import Any, Dict, List
+
+import pandas as pd
+
+from config import EXTRACT_CONFIG
+from utils.create_ticket_df import TICKET_SCHEMA
+
+#######################################################################
+
+logger = logging.getLogger(__name__)
+
+GROUP_FIELD = 'AgentGroup.GroupName'
+GROUP_COLUMN = 'AgentGroup'
+
+# Kolonner som de efterfølgende trin bruger pr. entityType. For tickets
+# udledes de af TICKET_SCHEMA, hvor 'X.Id' hentes via kolonnen 'X'.
+ENTITY_COLUMNS: Dict[str, List[str]] = {
+    'Ticket': list(dict.fromkeys(
+        source.split('.')[0] for source, _ in TICKET_SCHEMA.values() if source is not None))}
+
+DEFAULT_EXTRACTS: List[Dict[str, Any]] = [{
+    'name': 'Digitalisering og Data',
+    'entityType': 'Ticket',
+    'groups': ['Digitalisering og Data'],
+    'columns': [],
+    'filters': [],
+    'target': ''}]
+
+def load_extract_config(path: str = EXTRACT_CONFIG) -> List[Dict[str, Any]]:
+    '''
+    Beskrivelse:
+        Indlæser og validerer den deklarative udtrækskonfiguration: én
+        post pr. afdeling med entityType, agentgrupper, ekstra kolonner,
+        ekstra filtre og måldatabase.
+
+    Flow:
+        1. Er path tom, bruges DEFAULT_EXTRACTS (én afdeling,
+           'Digitalisering og Data', skrevet til standarddatabasen).
+        2. Ellers læses JSON-filen, som enten er en liste af poster
+           eller et objekt med nøglen 'extracts'.
+        3. Hver post normaliseres med defaults: entityType 'Ticket',
+           groups [] (alle grupper), columns [], filters [] og
+           target '' (standarddatabasen, ellers en SQLAlchemy-URL).
+        4. entityType valideres mod ENTITY_COLUMNS.
+
+    Args:
+        path:
+            Sti til JSON-filen, eller '' for standardopsætningen
+            (default EXTRACT_CONFIG).
+
+    Returns:
+        List[Dict[str, Any]]:
+            Normaliserede poster med nøglerne name, entityType, groups,
+            columns, filters og target.
+
+    Raises:
+        OSError:
+            Hvis filen ikke kan læses.
+        ValueError:
+            Hvis filen ikke er gyldig JSON, er tom, eller en post har
+            en ukendt entityType eller forkerte typer.
+    '''
+    if not path:
+        return [dict(extract) for extract in DEFAULT_EXTRACTS]
+
+    with open(path, encoding='utf-8') as file:
+        raw = json.load(file)
+    entries = raw.get('extracts') if isinstance(raw, dict) else raw
+    if not isinstance(entries, list) or not entries:
+        raise ValueError(f'Udtrækskonfigurationen {path} indeholder ingen udtræk')
+
+    extracts: List[Dict[str, Any]] = []
+    for i, entry in enumerate(entries, start=1):
+        if not isinstance(entry, dict):
+            raise ValueError(f'Udtræk nr. {i} i {path} er ikke et objekt')
+        extract = {
+            'name': str(entry.get('name', f'udtræk {i}')),
+            'entityType': entry.get('entityType', 'Ticket'),
+            'groups': entry.get('groups', []),
+            'columns': entry.get('columns', []),
+            'filters': entry.get('filters', []),
+            'target': entry.get('target', '')}
+        if extract['entityType'] not in ENTITY_COLUMNS:
+            raise ValueError(f'Ukendt entityType i udtræk {extract["name"]}: {extract["entityType"]}')
+        for key in ('groups', 'columns', 'filters'):
+            if not isinstance(extract[key], list):
+                raise ValueError(f'{key} i udtræk {extract["name"]} skal være en liste')
+        extracts.append(extract)
+    logger.info('Udtrækskonfiguration indlæst fra %s (%s udtræk)', path, len(extracts))
+    return extracts
+
+def plan_queries(extracts: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    '''
+    Beskrivelse:
+        Samler udtrækkene til det mindste antal NSP-forespørgsler, så N
+        afdelinger koster ét gennemløb af NSP i stedet for N.
+
+    Flow:
+        1. Grupperer udtræk med samme entityType og samme ekstra filtre
+           i én forespørgsel.
+        2. Agentgrupperne samles i ét filter på GROUP_FIELD: 'eq' for én
+           gruppe og 'in' for flere. Har et af udtrækkene ingen grupper
+           (alle grupper), udelades gruppefiltret.
+        3. Kolonnerne er de kolonner, de efterfølgende trin bruger
+           (ENTITY_COLUMNS), plus udtrækkenes ekstra kolonner.
+        4. routes angiver pr. måldatabase hvilke grupper der skal
+           skrives dertil (None for alle rækker i forespørgslen).
+
+    Args:
+        extracts:
+            Poster fra load_extract_config.
+
+    Returns:
+        List[Dict[str, Any]]:
+            Forespørgsler med nøglerne entityType, columns, filters
+            (uden UpdatedDate-filtrene, som api_fetch tilføjer) og routes.
+
+    Raises:
+        Ingen.
+    '''
+    queries: Dict[str, Dict[str, Any]] = {}
+    for extract in extracts:
+        key = json.dumps([extract['entityType'], extract['filters']], sort_keys=True)
+        query = queries.setdefault(key, {
+            'entityType': extract['entityType'],
+            'columns': list(ENTITY_COLUMNS[extract['entityType']]),
+            'filters': list(extract['filters']),
+            'routes': {}})
+        query['columns'] += [col for col in extract['columns'] if col not in query['columns']]
+        groups = list(extract['groups']) or None
+        routes = query['routes']
+        if extract['target'] in routes:
+            known = routes[extract['target']]
+            routes[extract['target']] = None if known is None or groups is None else known + groups
+        else:
+            routes[extract['target']] = groups
+
+    plan = list(queries.values())
+    for query in plan:
+        if any(groups is None for groups in query['routes'].values()):
+            continue
+        groups = sorted({group for groups in query['routes'].values() for group in groups})
+        if len(groups) == 1:
+            query['filters'].insert(0, {'field': GROUP_FIELD, 'operator': 'eq', 'value': groups[0]})
+        else:
+            query['filters'].insert(0, {'field': GROUP_FIELD, 'operator': 'in', 'value': groups})
+    logger.debug('%s udtræk samlet til %s NSP-forespørgsel(er)', len(extracts), len(plan))
+    return plan
+
+def default_query() -> Dict[str, Any]:
+    '''
+    Beskrivelse:
+        Forespørgslen for standardopsætningen (DEFAULT_EXTRACTS): ét
+        udtræk til måldatabasen default uden ekstra filtre. Bruges, når
+        en funktion kaldes uden query, fx api_fetch og replay.
+
+    Args:
+        Ingen.
+
+    Returns:
+        Dict[str, Any]:
+            Forespørgslen i samme form som elementerne fra plan_queries.
+
+    Raises:
+        Ingen.
+    '''
+    return plan_queries(DEFAULT_EXTRACTS)[0]
+
+def route_rows(df: pd.DataFrame, query: Dict[str, Any]) -> Dict[str, pd.DataFrame]:
+    '''
+    Beskrivelse:
+        Fordeler rækkerne fra én formatteret side af en forespørgsel på
+        måldatabaserne efter agentgruppe. Kaldes efter format_df, så
+        siden kun formatteres én gang, uanset antallet af mål.
+
+    Flow:
+        1. For hver måldatabase i query['routes'] udvælges rækker, hvis
+           GROUP_COLUMN er blandt målets grupper (alle rækker, hvis målet
+           ikke har grupper).
+        2. Mål uden rækker udelades.
+
+    Args:
+        df:
+            Side fra NSP efter format_df (GROUP_COLUMN indeholder
+            agentgruppens navn).
+        query:
+            Forespørgsel fra plan_queries.
+
+    Returns:
+        Dict[str, pd.DataFrame]:
+            Rækker pr. måldatabase (target).
+
+    Raises:
+        KeyError:
+            Hvis GROUP_COLUMN mangler, og et mål er begrænset til
+            bestemte grupper.
+    '''
+    routed: Dict[str, pd.DataFrame] = {}
+    for target, groups in query['routes'].items():
+        target_df = df if groups is None else df[df[GROUP_COLUMN].isin(groups)]
+        if not target_df.empty:
+            routed[target] = target_df
+    return routed
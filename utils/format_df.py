@@ -22,6 +22,49 @@ DATE_COLS: List[str] = [
     'u_Opstart',
     'u_Afslutning']
 
+def parse_dates(values: pd.Series) -> pd.Series:
+    '''
+    Beskrivelse:
+        Parser en kolonne med NSP-datostrenge til tidszonebevidste
+        UTC-datetimes i ét vektoriseret kald pr. format, i stedet for
+        ét pd.to_datetime-kald pr. værdi.
+
+    Flow:
+        1. Konverterer til string-dtype, stripper whitespace og sætter
+           tomme strenge til NA.
+        2. Parser værdier i NSP's UTC-format (ISO8601 med 'Z'-suffix)
+           med format='ISO8601'.
+        3. Parser eventuelle øvrige værdier med format='mixed', som
+           udleder formatet pr. værdi ligesom et enkeltstående
+           pd.to_datetime-kald.
+        4. Ugyldige værdier bliver NaT (errors='coerce'). Gentagne
+           timestamps parses kun én gang (cache=True).
+
+    Args:
+        values:
+            Serie med rå datostrenge, None, NaN eller pd.NA.
+
+    Returns:
+        pd.Series:
+            Serie med dtype datetime64[ns, UTC] og samme index som values.
+
+    Raises:
+        Ingen. Ugyldige værdier konverteres til NaT.
+    '''
+    raw = values.astype('string').str.strip()
+    raw = raw.mask(raw == '')
+    is_utc = raw.str.endswith('Z').fillna(False).astype(bool)
+
+    parsed = pd.Series(pd.NaT, index=values.index, dtype='datetime64[ns, UTC]')
+    if is_utc.any():
+        parsed[is_utc] = pd.to_datetime(
+            raw[is_utc], errors='coerce', utc=True, format='ISO8601', cache=True)
+    other = raw.notna() & ~is_utc
+    if other.any():
+        parsed[other] = pd.to_datetime(
+            raw[other], errors='coerce', utc=True, format='mixed', cache=True)
+    return parsed
+
 def format_df(df: pd.DataFrame) -> pd.DataFrame:
     '''
     Beskrivelse:
@@ -31,9 +74,10 @@ def format_df(df: pd.DataFrame) -> pd.DataFrame:
 
     Flow:
         1. Dropper tekniske/overflødige kolonner defineret i DROP_COLS.
-        2. Konverterer datokolonner i DATE_COLS til datetime (UTC),
-           konverterer dem til lokal tidszone (TIMEZONE) og formatterer
-           dem som tekst baseret på DATE_FORMAT.
+        2. Konverterer datokolonner i DATE_COLS til datetime (UTC) med
+           én vektoriseret parse_dates pr. kolonne, konverterer dem til
+           lokal tidszone (TIMEZONE) og formatterer dem som tekst
+           baseret på DATE_FORMAT.
         3. Rydder op i tekstfelterne 'u_Opgavetype', 'u_Omrder' og
            'u_Afvisningsrsag' ved at fjerne faste prefix/suffix-strenge.
 
@@ -63,18 +107,7 @@ def format_df(df: pd.DataFrame) -> pd.DataFrame:
             logger.warning('Forventet datokolonne mangler: %s', col)
             continue
 
-        raw = df[col].astype('string').str.strip()
-        parsed_values = []
-        for value in raw:
-            # value er enten en str eller pd.NA
-            if value is pd.NA or value == '':
-                parsed_values.append(pd.NaT)
-            else:
-                parsed_values.append(
-                    pd.to_datetime(value, errors='coerce', utc=True))
-
-        dt = pd.Series(parsed_values, index=df.index)
-        dt = dt.dt.tz_convert(TIMEZONE)
+        dt = parse_dates(df[col]).dt.tz_convert(TIMEZONE)
         df[col] = dt.dt.strftime(DATE_FORMAT)
 
     df['u_Opgavetype'] = (
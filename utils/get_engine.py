@@ -1,37 +1,48 @@
 import logging
+from typing import Any, Dict, List
 from urllib.parse import quote_plus
 
 import sqlalchemy
 from sqlalchemy.engine import Engine
 
-from config import DB_DRIVER, DB_SERVER, DB_NAME, DB_USERNAME, DB_PASSWORD
+from config import DB_DRIVER, DB_SERVER, DB_NAME, DB_USERNAME, DB_PASSWORD, DB_URL
 
 #######################################################################
 
 logger = logging.getLogger(__name__)
 
-def get_engine() -> Engine:
+# Engines for øvrige måldatabaser, genbrugt på tværs af cyklusser
+_ENGINES: Dict[str, Engine] = {}
+
+def get_engine(url: str = DB_URL) -> Engine:
     '''
     Beskrivelse:
         Opretter og returnerer en SQLAlchemy Engine-instans baseret på
-        konfigurationsvariabler fra config-modulet. Forbindelsen
-        etableres via pyodbc.
+        konfigurationsvariabler fra config-modulet. Som standard
+        etableres forbindelsen til SQL Server via pyodbc; er url (DB_URL)
+        sat, bruges den i stedet (fx sqlite:///lokal.db eller
+        postgresql+psycopg2://...), så skrivestien kan køre mod en
+        anden database via utils/sql_dialect.py.
 
     Flow:
         1. Logger at engine-oprettelse er initieret.
-        2. Samler en ODBC-connection string til SQL Server.
-        3. URL-enkoder connection string til brug i SQLAlchemy.
-        4. Opretter engine med fast_executemany aktiveret.
-        5. Logger succesfuld oprettelse eller fejl.
+        2. Bruger url, hvis den er sat. Ellers samles en ODBC-
+           connection string til SQL Server, som URL-enkodes til brug
+           i SQLAlchemy.
+        3. Opretter engine med fast_executemany aktiveret for
+           mssql+pyodbc.
+        4. Logger succesfuld oprettelse eller fejl.
 
     Args:
-        Ingen. Engine konfigureres udelukkende ud fra
-        globale konfigurationsvariabler.
+        url:
+            SQLAlchemy-URL, eller '' for SQL Server ud fra DB_*-
+            variablerne (default DB_URL). Bruges også til
+            måldatabaser i udtrækskonfigurationen.
 
     Returns:
         Engine:
-            En initialiseret SQLAlchemy Engine med
-            fast_executemany=True.
+            En initialiseret SQLAlchemy Engine (med
+            fast_executemany=True for mssql+pyodbc).
 
     Raises:
         sqlalchemy.exc.SQLAlchemyError:
@@ -39,20 +50,61 @@ def get_engine() -> Engine:
             connection string eller netværksfejl.
     '''
     logger.info('Henter engine')
-    odbc_str = (
-        f'DRIVER={DB_DRIVER};'
-        f'SERVER={DB_SERVER};'
-        f'DATABASE={DB_NAME};'
-        f'UID={DB_USERNAME};'
-        f'PWD={DB_PASSWORD};'
-        'Trusted_Connection=no;'     
-        'TrustServerCertificate=yes;')
-
-    conn_str = f'mssql+pyodbc:///?odbc_connect={quote_plus(odbc_str)}'
+    if url:
+        conn_str = url
+    else:
+        odbc_str = (
+            f'DRIVER={DB_DRIVER};'
+            f'SERVER={DB_SERVER};'
+            f'DATABASE={DB_NAME};'
+            f'UID={DB_USERNAME};'
+            f'PWD={DB_PASSWORD};'
+            'Trusted_Connection=no;'     
+            'TrustServerCertificate=yes;')
+
+        conn_str = f'mssql+pyodbc:///?odbc_connect={quote_plus(odbc_str)}'
+
+    options = {'fast_executemany': True} if conn_str.startswith('mssql+pyodbc') else {}
     try:
-        engine = sqlalchemy.create_engine(conn_str, fast_executemany=True)
+        engine = sqlalchemy.create_engine(conn_str, **options)
         logger.info('Engine hentet')
     except sqlalchemy.exc.SQLAlchemyError as exc:
         logger.error('Fejl ved oprettelse af database-engine: %s', exc, exc_info=True)
         raise
-    return engine
\ No newline at end of file
+    return engine
+
+def get_target_engines(engine: Engine, plan: List[Dict[str, Any]]) -> Dict[str, Engine]:
+    '''
+    Beskrivelse:
+        Finder Engine-instansen for hver måldatabase i forespørgslerne
+        fra udtrækskonfigurationen.
+
+    Flow:
+        1. Target '' er standarddatabasen (engine).
+        2. Øvrige targets er SQLAlchemy-URL'er, som åbnes via get_engine
+           første gang og genbruges derefter.
+
+    Args:
+        engine:
+            Engine til standarddatabasen.
+        plan:
+            Forespørgsler fra plan_queries.
+
+    Returns:
+        Dict[str, Engine]:
+            Engine pr. target.
+
+    Raises:
+        sqlalchemy.exc.SQLAlchemyError:
+            Hvis en engine ikke kan oprettes.
+    '''
+    engines: Dict[str, Engine] = {}
+    for query in plan:
+        for target in query['routes']:
+            if not target:
+                engines[target] = engine
+                continue
+            if target not in _ENGINES:
+                _ENGINES[target] = get_engine(target)
+            engines[target] = _ENGINES[target]
+    return engines
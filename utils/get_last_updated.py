@@ -1,10 +1,13 @@
 import datetime
 import logging
 
+import pandas as pd
+
 from sqlalchemy import text
 from sqlalchemy.engine import Engine
 
 from config import TIMESTAMP_FALLBACK
+from utils.etl_state import get_etl_state, to_watermark, update_etl_state
 
 #######################################################################
 
@@ -13,23 +16,32 @@ logger = logging.getLogger(__name__)
 def get_last_updated(engine: Engine) -> str:
     '''
     Beskrivelse:
-        Henter seneste last_updated-timestamp fra tickets-tabellen
-        og returnerer det som en ISO8601 UTC-streng. Hvis der ikke
-        findes nogen værdier, anvendes et fast fallback-timestamp.
+        Henter det seneste watermark for tickets fra etl_state og
+        returnerer det som en ISO8601 UTC-streng. Findes der intet
+        watermark endnu, bruges MAX(last_updated) fra tickets-tabellen
+        eller et fast fallback-timestamp, som gemmes i etl_state, så
+        tabellen kun skannes én gang.
 
     Flow:
-        1. Udfører en SQL-forespørgsel:
+        1. Slår tilstanden for kilden 'tickets' op i etl_state
+           (nøgleopslag på primærnøglen).
+        2. Hvis der ikke findes et watermark, udføres
            SELECT MAX(last_updated) AS max_last_updated FROM tickets;
-        2. Læser første række fra resultatet.
-        3. Hvis værdien er None, logges info og fallback-timestamp
-           returneres.
-        4. Ellers sættes tidszonen til UTC og værdien konverteres til
+           så eksisterende installationer fortsætter, hvor de slap.
+           Gemmer databasen last_updated som tekst (fx SQLite), parses
+           værdien via to_watermark.
+        3. Hvis værdien stadig er None, logges info og fallback-timestamp
+           bruges.
+        4. Værdien fra trin 2 eller 3 gemmes som watermark i etl_state
+           i samme transaktion, så næste cyklus finder den i trin 1,
+           også når etl_state-rækken fandtes med et tomt watermark.
+        5. Sættes tidszonen til UTC og værdien konverteres til
            ISO8601-streng med 'Z'-suffix.
 
     Args:
         engine:
             En SQLAlchemy Engine-instans med forbindelse til
-            databasen, der indeholder tickets-tabellen.
+            databasen, der indeholder etl_state- og tickets-tabellen.
 
     Returns:
         str:
@@ -42,18 +54,25 @@ def get_last_updated(engine: Engine) -> str:
             forespørgslen ikke kan udføres.
     '''
     logger.info('Henter last_updated')
-    query = '''
-        SELECT MAX(last_updated) AS max_last_updated
-        FROM tickets;
-        '''
-    with engine.connect() as conn:
-        result = conn.execute(text(query))
-        row = result.fetchone()
-
-    max_dt = row.max_last_updated
-    if max_dt is None:
-        logger.info('Ingen last_updated fundet, bruger fallback-timestamp')
-        return TIMESTAMP_FALLBACK
+    with engine.begin() as conn:
+        state = get_etl_state(conn)
+        max_dt = state.watermark if state is not None else None
+        if max_dt is None:
+            logger.info('Intet watermark i etl_state, bruger MAX(last_updated) fra tickets')
+            query = '''
+                SELECT MAX(last_updated) AS max_last_updated
+                FROM tickets;
+                '''
+            row = conn.execute(text(query)).fetchone()
+            max_dt = row.max_last_updated
+            if isinstance(max_dt, str):
+                max_dt = to_watermark(pd.Series([max_dt]))
+            if max_dt is None:
+                logger.info('Ingen last_updated fundet, bruger fallback-timestamp')
+                max_dt = to_watermark(pd.Series([TIMESTAMP_FALLBACK]))
+            update_etl_state(conn, watermark=max_dt)
+            logger.info('Watermark gemt i etl_state')
+
     max_dt = max_dt.replace(tzinfo=datetime.timezone.utc)
     logger.info('last_updated hentet')
-    return max_dt.isoformat().replace('+00:00', 'Z')
\ No newline at end of file
+    return max_dt.isoformat().replace('+00:00', 'Z')
@@ -0,0 +1,48 @@
+import logging
+from typing import Iterable, Iterator
+
+import pandas as pd
+
+#######################################################################
+
+logger = logging.getLogger(__name__)
+
+def iter_batches(frames: Iterable[pd.DataFrame], batch_rows: int) -> Iterator[pd.DataFrame]:
+    '''
+    Beskrivelse:
+        Deler en strøm af sider op i batches af højst batch_rows rækker,
+        så hvert efterfølgende trin (format_df, create_ticket_df og
+        skrivningen) arbejder på en fast øvre grænse af rækker, uanset
+        hvor store siderne er.
+
+    Flow:
+        1. Sider med højst batch_rows rækker yieldes uændret.
+        2. Større sider opdeles i på hinanden følgende udsnit med
+           batch_rows rækker (det sidste kan være mindre). Hvert udsnit
+           kopieres, så siden kan frigives, når sidste udsnit er yieldet.
+        3. Tomme sider springes over.
+
+    Args:
+        frames:
+            Sider, fx fra api_fetch_pages eller iter_stored_pages.
+        batch_rows:
+            Maksimalt antal rækker pr. batch (skal være positiv).
+
+    Returns:
+        Iterator[pd.DataFrame]:
+            Batches i samme rækkefølge som rækkerne i frames.
+
+    Raises:
+        ValueError:
+            Hvis batch_rows ikke er positiv.
+    '''
+    if batch_rows <= 0:
+        raise ValueError(f'batch_rows skal være positiv: {batch_rows}')
+    for df in frames:
+        if len(df) <= batch_rows:
+            if not df.empty:
+                yield df
+            continue
+        for start in range(0, len(df), batch_rows):
+            yield df.iloc[start:start + batch_rows].reset_index(drop=True)
+        logger.debug('Side med %s rækker delt i batches af %s', len(df), batch_rows)
@@ -0,0 +1,337 @@
+import contextlib
+import datetime
+import json
+import logging
+import logging.handlers
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+try:
+    import resource
+except ImportError:  # Ikke tilgængelig på Windows
+    resource = None
+
+from config import METRICS_FILE, METRICS_FILE_BACKUPS, METRICS_FILE_MAX_BYTES, METRICS_PORT
+
+#######################################################################
+
+logger = logging.getLogger(__name__)
+
+BUCKETS: Tuple[float, ...] = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+_lock = threading.Lock()
+_durations: Dict[str, List[float]] = {}     # stage -> [count, sum, max, bucket_0, ..., bucket_n]
+_rows: Dict[str, int] = {}
+_bytes: Dict[str, int] = {'decoded': 0, 'wire': 0}
+_metrics_logger: Optional[logging.Logger] = None
+_server: Optional[ThreadingHTTPServer] = None
+
+def observe(stage: str, seconds: float) -> None:
+    '''
+    Beskrivelse:
+        Registrerer én varighed for stage i histogrammet.
+
+    Flow:
+        1. Opretter stage-posten ved første måling (count, sum, max og
+           én tæller pr. grænse i BUCKETS).
+        2. Tæller count og sum op, opdaterer max og tæller hver bucket,
+           hvis øvre grænse er mindst seconds (kumulativt, som
+           Prometheus forventer).
+
+    Args:
+        stage:
+            Navn på trinnet, fx 'format_df' eller 'upsert_tickets'.
+        seconds:
+            Varighed i sekunder.
+
+    Returns:
+        None.
+
+    Raises:
+        Ingen.
+    '''
+    with _lock:
+        values = _durations.setdefault(stage, [0.0, 0.0, 0.0] + [0.0] * len(BUCKETS))
+        values[0] += 1
+        values[1] += seconds
+        values[2] = max(values[2], seconds)
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                values[3 + i] += 1
+
+@contextlib.contextmanager
+def timed(stage: str) -> Iterator[None]:
+    '''
+    Beskrivelse:
+        Context manager der måler varigheden af blokken og registrerer
+        den for stage via observe.
+
+    Flow:
+        1. Læser time.perf_counter før blokken.
+        2. Registrerer forskellen via observe, når blokken er færdig,
+           også hvis den fejler.
+
+    Args:
+        stage:
+            Navn på trinnet, fx 'format_df' eller 'upsert_tickets'.
+
+    Returns:
+        Iterator[None].
+
+    Raises:
+        Ingen ud over undtagelser fra blokken selv.
+    '''
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - started)
+
+def count_rows(stage: str, rows: int) -> None:
+    '''
+    Beskrivelse:
+        Tæller behandlede rækker for et trin (trådsikkert).
+
+    Args:
+        stage:
+            Trinnets navn, fx 'format_df' eller 'upsert_tickets'.
+        rows:
+            Antal rækker der lægges til trinnets tæller.
+
+    Returns:
+        None.
+
+    Raises:
+        Ingen.
+    '''
+    with _lock:
+        _rows[stage] = _rows.get(stage, 0) + int(rows)
+
+def count_bytes(decoded: int, wire: Optional[int] = None) -> None:
+    '''
+    Beskrivelse:
+        Tæller bytes hentet fra NSP (trådsikkert), så komprimeringens
+        effekt kan aflæses i snapshot og på /metrics.
+
+    Args:
+        decoded:
+            Bytes efter dekomprimering.
+        wire:
+            Bytes over nettet (Content-Length), eller None hvis ukendt;
+            så tælles kun decoded.
+
+    Returns:
+        None.
+
+    Raises:
+        Ingen.
+    '''
+    with _lock:
+        _bytes['decoded'] += int(decoded)
+        if wire is not None:
+            _bytes['wire'] += int(wire)
+
+def peak_rss_bytes() -> Optional[int]:
+    '''
+    Beskrivelse:
+        Processens højeste residente hukommelse (peak RSS) siden start.
+
+    Flow:
+        1. Uden modulet resource (Windows) returneres None.
+        2. ru_maxrss omregnes til bytes (KiB på Linux, bytes på macOS).
+
+    Args:
+        Ingen.
+
+    Returns:
+        Optional[int]:
+            Peak RSS i bytes, eller None hvis det ikke kan måles.
+
+    Raises:
+        Ingen.
+    '''
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss er i KiB på Linux og i bytes på macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+def snapshot() -> Dict[str, Any]:
+    '''
+    Beskrivelse:
+        Returnerer de akkumulerede metrikker siden processtart.
+
+    Returns:
+        Dict[str, Any]:
+            'timestamp', 'stages' (pr. trin: count, seconds_total,
+            seconds_max og rows), 'bytes_fetched', 'bytes_fetched_wire'
+            og 'peak_rss_bytes'.
+
+    Raises:
+        Ingen.
+    '''
+    with _lock:
+        stages: Dict[str, Dict[str, Any]] = {}
+        for stage in sorted(set(_durations) | set(_rows)):
+            values = _durations.get(stage)
+            stages[stage] = {
+                'count': int(values[0]) if values else 0,
+                'seconds_total': round(values[1], 6) if values else 0.0,
+                'seconds_max': round(values[2], 6) if values else 0.0,
+                'rows': _rows.get(stage, 0)}
+        bytes_fetched = dict(_bytes)
+    return {
+        'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'stages': stages,
+        'bytes_fetched': bytes_fetched['decoded'],
+        'bytes_fetched_wire': bytes_fetched['wire'],
+        'peak_rss_bytes': peak_rss_bytes()}
+
+def render_prometheus() -> str:
+    '''
+    Beskrivelse:
+        Formatterer metrikkerne i Prometheus' teksteksponeringsformat.
+
+    Flow:
+        1. etl_stage_duration_seconds: histogram pr. trin.
+        2. etl_stage_rows_total: tæller pr. trin.
+        3. etl_fetch_bytes_total: tæller for dekomprimerede og
+           overførte bytes.
+        4. etl_peak_rss_bytes: gauge med processens peak RSS (udelades,
+           hvis den ikke kan måles).
+
+    Args:
+        Ingen.
+
+    Returns:
+        str:
+            Tekst klar til at blive serveret på /metrics.
+
+    Raises:
+        Ingen.
+    '''
+    lines = [
+        '# HELP etl_stage_duration_seconds Varighed af ETL-trin.',
+        '# TYPE etl_stage_duration_seconds histogram']
+    with _lock:
+        durations = {stage: list(values) for stage, values in _durations.items()}
+        rows = dict(_rows)
+        bytes_fetched = dict(_bytes)
+    for stage, values in sorted(durations.items()):
+        for i, bound in enumerate(BUCKETS):
+            lines.append(f'etl_stage_duration_seconds_bucket{{stage="{stage}",le="{bound}"}} {int(values[3 + i])}')
+        lines.append(f'etl_stage_duration_seconds_bucket{{stage="{stage}",le="+Inf"}} {int(values[0])}')
+        lines.append(f'etl_stage_duration_seconds_sum{{stage="{stage}"}} {values[1]:.6f}')
+        lines.append(f'etl_stage_duration_seconds_count{{stage="{stage}"}} {int(values[0])}')
+    lines += [
+        '# HELP etl_stage_rows_total Rækker behandlet pr. ETL-trin.',
+        '# TYPE etl_stage_rows_total counter']
+    lines += [f'etl_stage_rows_total{{stage="{stage}"}} {count}' for stage, count in sorted(rows.items())]
+    lines += [
+        '# HELP etl_fetch_bytes_total Bytes hentet fra NSP.',
+        '# TYPE etl_fetch_bytes_total counter',
+        f'etl_fetch_bytes_total{{encoding="decoded"}} {bytes_fetched["decoded"]}',
+        f'etl_fetch_bytes_total{{encoding="wire"}} {bytes_fetched["wire"]}']
+    peak = peak_rss_bytes()
+    if peak is not None:
+        lines += [
+            '# HELP etl_peak_rss_bytes Processens peak resident set size.',
+            '# TYPE etl_peak_rss_bytes gauge',
+            f'etl_peak_rss_bytes {peak}']
+    return '\n'.join(lines) + '\n'
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    '''Serverer render_prometheus på /metrics.'''
+
+    def do_GET(self) -> None:
+        if self.path.split('?', 1)[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = render_prometheus().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        logger.debug('Metrics-forespørgsel: ' + format, *args)
+
+def start_metrics(
+    port: int = METRICS_PORT,
+    path: str = METRICS_FILE,
+    max_bytes: int = METRICS_FILE_MAX_BYTES,
+    backups: int = METRICS_FILE_BACKUPS) -> None:
+    '''
+    Beskrivelse:
+        Starter de konfigurerede metrik-udgange: et lokalt HTTP-endpoint
+        i Prometheus-format og/eller en roterende JSON-lines-fil.
+
+    Flow:
+        1. Er port > 0, startes en ThreadingHTTPServer på port i en
+           daemon-tråd, som serverer /metrics.
+        2. Er path angivet, oprettes en dedikeret logger med en
+           RotatingFileHandler (max_bytes pr. fil, backups gamle filer),
+           som write_metrics skriver til.
+
+    Args:
+        port:
+            TCP-port til /metrics, eller 0 for intet endpoint
+            (default METRICS_PORT).
+        path:
+            Sti til JSON-lines-filen, eller '' for ingen fil
+            (default METRICS_FILE).
+        max_bytes:
+            Maksimal filstørrelse før rotation (default METRICS_FILE_MAX_BYTES).
+        backups:
+            Antal roterede filer der bevares (default METRICS_FILE_BACKUPS).
+
+    Returns:
+        None.
+
+    Raises:
+        OSError:
+            Hvis porten ikke kan bindes, eller filen ikke kan åbnes.
+    '''
+    global _metrics_logger, _server
+    if port > 0 and _server is None:
+        _server = ThreadingHTTPServer(('', port), _MetricsHandler)
+        threading.Thread(target=_server.serve_forever, name='metrics', daemon=True).start()
+        logger.info('Metrics-endpoint startet på port %s (/metrics)', port)
+    if path and _metrics_logger is None:
+        handler = logging.handlers.RotatingFileHandler(
+            path, maxBytes=max_bytes, backupCount=backups, encoding='utf-8')
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        metrics_logger = logging.getLogger(f'{__name__}.file')
+        metrics_logger.setLevel(logging.INFO)
+        metrics_logger.propagate = False
+        metrics_logger.addHandler(handler)
+        _metrics_logger = metrics_logger
+        logger.info('Metrics skrives til %s', path)
+
+def write_metrics() -> None:
+    '''
+    Beskrivelse:
+        Skriver de akkumulerede metrikker til metrikfilen. Kaldes efter
+        hver cyklus.
+
+    Flow:
+        1. Er metrikfilen ikke startet (start_metrics uden path), gøres
+           intet.
+        2. Ellers skrives snapshot() som én JSON-linje via den
+           roterende filhandler.
+
+    Args:
+        Ingen.
+
+    Returns:
+        None.
+
+    Raises:
+        Ingen. Skrivefejl håndteres af logging-modulet.
+    '''
+    if _metrics_logger is not None:
+        _metrics_logger.info(json.dumps(snapshot(), ensure_ascii=False))
@@ -0,0 +1,286 @@
+import email.utils
+import logging
+import math
+import random
+import threading
+import time
+from typing import Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from config import (
+    API_URL,
+    API_KEY,
+    API_TIMEOUT,
+    API_RETRIES,
+    API_BACKOFF,
+    API_BACKOFF_MAX,
+    FETCH_WORKERS)
+
+#######################################################################
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+class ApiError(Exception):
+    '''
+    Beskrivelse:
+        Specialiseret exception-type til API-relaterede fejl,
+        fx manglende forbindelse eller ugyldigt svar fra NSP-API'et.
+
+    Flow:
+        Bruges til at indkapsle alle forventede fejl ved API-kald,
+        så kaldere kan håndtere dem samlet (fx i main-loopet).
+
+    Args:
+        Ingen.
+
+    Returns:
+        Ingen. Klassen repræsenterer kun en fejlsituation.
+
+    Raises:
+        Ingen direkte. Bruges som type for hævede fejl.
+    '''
+    pass
+
+class NspClient:
+    '''
+    Beskrivelse:
+        HTTP-klient til NSP-API'et, der ejer en pooled requests.Session
+        med keep-alive, gzip/deflate og genforsøg med eksponentiel
+        backoff og jitter.
+
+    Flow:
+        1. Opretter en Session med en HTTPAdapter, hvis connection pool
+           er stor nok til FETCH_WORKERS samtidige kald.
+        2. Sætter faste headers (API-nøgle, JSON, komprimering).
+        3. post() genforsøger ved forbindelsesfejl og statuskoderne i
+           RETRY_STATUSES og respekterer Retry-After fra serveren.
+        4. ApiError hæves først, når genforsøgsbudgettet er brugt.
+
+    Args:
+        url:
+            NSP-API'ets URL (default API_URL).
+        api_key:
+            API-nøgle, der sendes som x-api-key (default API_KEY).
+        timeout:
+            Timeout i sekunder pr. kald (default API_TIMEOUT).
+        retries:
+            Antal genforsøg efter første kald (default API_RETRIES).
+        backoff:
+            Basisventetid i sekunder for backoff (default API_BACKOFF).
+        backoff_max:
+            Maksimal ventetid i sekunder for backoff (default API_BACKOFF_MAX).
+
+    Returns:
+        Ingen. Klassen indkapsler HTTP-forbindelsen.
+
+    Raises:
+        Ingen ved oprettelse.
+    '''
+    def __init__(
+        self,
+        url: Optional[str] = API_URL,
+        api_key: Optional[str] = API_KEY,
+        timeout: float = API_TIMEOUT,
+        retries: int = API_RETRIES,
+        backoff: float = API_BACKOFF,
+        backoff_max: float = API_BACKOFF_MAX) -> None:
+        self.url = url
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+
+        pool_size = max(FETCH_WORKERS, 1) + 1
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session = requests.Session()
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update({
+            'x-api-key': api_key or '',
+            'Content-Type': 'application/json',
+            'Accept-Encoding': 'gzip, deflate',
+            'Connection': 'keep-alive'})
+
+    def _backoff_delay(self, attempt: int) -> float:
+        '''
+        Beskrivelse:
+            Beregner ventetid før næste forsøg med "full jitter":
+            en tilfældig værdi mellem 0 og backoff * 2^attempt,
+            begrænset af backoff_max.
+
+        Flow:
+            1. Beregner eksponentielt loft ud fra attempt.
+            2. Returnerer en tilfældig ventetid under loftet.
+
+        Args:
+            attempt:
+                Nummeret på det forsøg der netop fejlede (0-indekseret).
+
+        Returns:
+            float:
+                Ventetid i sekunder.
+
+        Raises:
+            Ingen.
+        '''
+        ceiling = min(self.backoff_max, self.backoff * (2 ** attempt))
+        return random.uniform(0, ceiling)
+
+    @staticmethod
+    def _retry_after(response: requests.Response) -> Optional[float]:
+        '''
+        Beskrivelse:
+            Læser Retry-After-headeren fra et svar, enten som antal
+            sekunder eller som HTTP-dato.
+
+        Flow:
+            1. Returnerer None hvis headeren mangler.
+            2. Forsøger at parse værdien som sekunder.
+            3. Forsøger ellers at parse værdien som HTTP-dato og
+               beregner ventetiden derfra.
+
+        Args:
+            response:
+                HTTP-svaret fra NSP-API'et.
+
+        Returns:
+            Optional[float]:
+                Ventetid i sekunder, eller None hvis headeren mangler
+                eller ikke kan parses (også NaN og uendelig).
+
+        Raises:
+            Ingen.
+        '''
+        value = response.headers.get('Retry-After')
+        if not value:
+            return None
+        try:
+            seconds = float(value)
+        except ValueError:
+            pass
+        else:
+            return max(seconds, 0.0) if math.isfinite(seconds) else None
+        try:
+            retry_at = email.utils.parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        return max(retry_at.timestamp() - time.time(), 0.0)
+
+    def post(self, payload: str, stream: bool = False) -> requests.Response:
+        '''
+        Beskrivelse:
+            Sender en POST-request med payload til NSP-API'et og
+            genforsøger ved forbigående fejl.
+
+        Flow:
+            1. Sender requesten via den delte Session.
+            2. Ved forbindelsesfejl eller status i RETRY_STATUSES ventes
+               Retry-After (hvis angivet, dog højst backoff_max, så en
+               stor eller fejlagtig værdi fra serveren ikke blokerer en
+               hentetråd i timevis) eller en backoff med jitter,
+               hvorefter kaldet forsøges igen.
+            3. Returnerer svaret ved 2xx.
+            4. Hæver ApiError ved øvrige statuskoder, eller når
+               genforsøgsbudgettet er brugt.
+
+        Args:
+            payload:
+                JSON-serialiseret request-body.
+            stream:
+                Om response-body skal streames (default False).
+
+        Returns:
+            requests.Response:
+                HTTP-responsen, forudsat at statuskoden er i 2xx-intervallet.
+
+        Raises:
+            ApiError:
+                Hvis API'et returnerer en statuskode uden for 2xx-området,
+                eller hvis kaldet stadig fejler efter alle genforsøg.
+        '''
+        attempt = 0
+        while True:
+            try:
+                response = self.session.post(
+                    self.url,
+                    data=payload,
+                    timeout=self.timeout,
+                    stream=stream)
+            except requests.exceptions.RequestException as exc:
+                if attempt >= self.retries:
+                    logger.error('Forbindelsesfejl ved API-kald: %s', exc, exc_info=True)
+                    raise ApiError('API request failed due to a connection error') from exc
+                delay = self._backoff_delay(attempt)
+                logger.warning(
+                    'Forbindelsesfejl ved API-kald (forsøg %s/%s), prøver igen om %.1f s: %s',
+                    attempt + 1, self.retries + 1, delay, exc)
+            else:
+                if response.ok:
+                    logger.debug('API-kald statuskode: %s', response.status_code)
+                    return response
+                if response.status_code not in RETRY_STATUSES or attempt >= self.retries:
+                    logger.error('API-kald fejlede (%s): %s', response.status_code, response.text)
+                    raise ApiError(f'API request failed with status {response.status_code}')
+                retry_after = self._retry_after(response)
+                if retry_after is None:
+                    delay = self._backoff_delay(attempt)
+                else:
+                    delay = min(retry_after, self.backoff_max)
+                response.close()
+                logger.warning(
+                    'API-kald fejlede (%s) (forsøg %s/%s), prøver igen om %.1f s',
+                    response.status_code, attempt + 1, self.retries + 1, delay)
+            time.sleep(delay)
+            attempt += 1
+
+    def close(self) -> None:
+        '''
+        Beskrivelse:
+            Lukker den underliggende Session og dens forbindelser.
+
+        Flow:
+            1. Lukker Session.
+
+        Args:
+            Ingen.
+
+        Returns:
+            None.
+
+        Raises:
+            Ingen.
+        '''
+        self.session.close()
+
+_client: Optional[NspClient] = None
+_client_lock = threading.Lock()
+
+def get_client() -> NspClient:
+    '''
+    Beskrivelse:
+        Returnerer den delte NspClient for processen, så alle API-kald
+        genbruger samme connection pool.
+
+    Flow:
+        1. Opretter klienten ved første kald (trådsikkert).
+        2. Returnerer den eksisterende klient ved efterfølgende kald.
+
+    Args:
+        Ingen.
+
+    Returns:
+        NspClient:
+            Den delte klient.
+
+    Raises:
+        Ingen.
+    '''
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = NspClient()
+        return _client
@@ -0,0 +1,468 @@
+import datetime
+import gzip
+import json
+import logging
+import os
+import shutil
+import threading
+import uuid
+from typing import IO, Any, Dict, Iterator, List, Optional
+
+import pandas as pd
+
+from config import PAGE_STORE_DIR, PAGE_STORE_RETENTION_DAYS
+from utils.format_df import parse_dates
+from utils.metrics import count_rows, timed
+from utils.parse_response import CHUNK_SIZE, parse_records
+
+#######################################################################
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILE = 'index.jsonl'
+COMPRESS_LEVEL = 6
+ISO_FORMAT = '%Y-%m-%dT%H:%M:%S.%fZ'
+
+_index_lock = threading.Lock()
+
+def _iso(value: pd.Timestamp) -> str:
+    '''
+    Beskrivelse:
+        Formatterer et UTC-tidspunkt som ISO8601 (ISO_FORMAT) til
+        manifestets updated_min og updated_max.
+
+    Args:
+        value:
+            Tidszonebevidst tidspunkt i UTC.
+
+    Returns:
+        str:
+            Tidspunktet som fx '2026-01-31T08:00:00.000000Z'.
+
+    Raises:
+        Ingen.
+    '''
+    return value.strftime(ISO_FORMAT)
+
+def _utc(value: Optional[str]) -> Optional[pd.Timestamp]:
+    '''
+    Beskrivelse:
+        Parser en tidsgrænse (since/until i iter_stored_pages) som UTC,
+        så den kan sammenlignes med manifestets tidspunkter uanset
+        format.
+
+    Flow:
+        1. Tom værdi eller None giver None (ingen grænse).
+        2. Tidspunkter uden tidszone tolkes som UTC; øvrige omregnes.
+
+    Args:
+        value:
+            ISO8601-dato/tid, eller None.
+
+    Returns:
+        Optional[pd.Timestamp]:
+            Tidszonebevidst tidspunkt i UTC, eller None.
+
+    Raises:
+        ValueError:
+            Hvis value ikke kan parses som dato/tid.
+    '''
+    if not value:
+        return None
+    timestamp = pd.Timestamp(value)
+    return timestamp.tz_localize('UTC') if timestamp.tzinfo is None else timestamp.tz_convert('UTC')
+
+def open_page(directory: str = PAGE_STORE_DIR) -> IO[bytes]:
+    '''
+    Beskrivelse:
+        Åbner en ny, midlertidig gzip-fil i sidelageret, som den rå
+        body fra én NSP-side kan streames ind i (se parse_response).
+
+    Flow:
+        1. Opretter mappen pages/<UTC-dato> under directory.
+        2. Åbner <tidspunkt>-<id>.json.gz.tmp til skrivning med gzip.
+           Filen får først sit endelige navn i commit_page.
+
+    Args:
+        directory:
+            Sidelagerets rodmappe (default PAGE_STORE_DIR).
+
+    Returns:
+        IO[bytes]:
+            Åben gzip-fil. Afsluttes med commit_page eller discard_page.
+
+    Raises:
+        OSError:
+            Hvis mappen eller filen ikke kan oprettes.
+    '''
+    now = datetime.datetime.now(datetime.timezone.utc)
+    page_dir = os.path.join(directory, 'pages', now.strftime('%Y-%m-%d'))
+    os.makedirs(page_dir, exist_ok=True)
+    name = f'{now.strftime("%Y%m%dT%H%M%S%f")}-{uuid.uuid4().hex[:8]}.json.gz'
+    return gzip.open(os.path.join(page_dir, f'{name}.tmp'), 'wb', compresslevel=COMPRESS_LEVEL)
+
+def discard_page(sink: IO[bytes]) -> None:
+    '''
+    Beskrivelse:
+        Kasserer en midlertidig sidefil fra open_page, når siden var
+        tom, eller parsingen fejlede, så tomme og ufuldstændige sider
+        ikke havner i lageret.
+
+    Flow:
+        1. Lukker filen.
+        2. Sletter den; er den allerede væk, ignoreres det.
+
+    Args:
+        sink:
+            Filen returneret af open_page.
+
+    Returns:
+        None.
+
+    Raises:
+        OSError:
+            Hvis filen findes, men ikke kan slettes.
+    '''
+    sink.close()
+    try:
+        os.remove(sink.name)
+    except FileNotFoundError:
+        pass
+
+def commit_page(
+    sink: IO[bytes],
+    df: pd.DataFrame,
+    entity_type: str,
+    directory: str = PAGE_STORE_DIR) -> Optional[str]:
+    '''
+    Beskrivelse:
+        Afslutter en sidefil fra open_page og registrerer den i
+        sidelagerets indeks med sidens UpdatedDate-interval.
+
+    Flow:
+        1. Lukker gzip-filen. Er siden tom, slettes filen.
+        2. Giver filen sit endelige navn (os.replace), så halvt skrevne
+           filer aldrig står under et gyldigt navn.
+        3. Tilføjer én JSON-linje til INDEX_FILE med filens relative
+           sti, entityType, antal rækker, mindste og største UpdatedDate
+           og hentetidspunktet.
+
+    Args:
+        sink:
+            Fil fra open_page, som body er skrevet til.
+        df:
+            Den parsede side.
+        entity_type:
+            NSP-entityType for siden, fx 'Ticket'.
+        directory:
+            Sidelagerets rodmappe (default PAGE_STORE_DIR).
+
+    Returns:
+        Optional[str]:
+            Filens sti relativt til directory, eller None hvis siden
+            var tom.
+
+    Raises:
+        OSError:
+            Hvis filen eller indekset ikke kan skrives.
+    '''
+    if df.empty:
+        discard_page(sink)
+        return None
+    sink.close()
+    path = sink.name[:-len('.tmp')]
+    os.replace(sink.name, path)
+
+    updated = parse_dates(df['UpdatedDate'])
+    entry = {
+        'file': os.path.relpath(path, directory).replace(os.sep, '/'),
+        'entity_type': entity_type,
+        'rows': len(df),
+        'updated_min': _iso(updated.min()) if updated.notna().any() else None,
+        'updated_max': _iso(updated.max()) if updated.notna().any() else None,
+        'fetched_at': datetime.datetime.now(datetime.timezone.utc).strftime(ISO_FORMAT)}
+    with _index_lock:
+        with open(os.path.join(directory, INDEX_FILE), 'a', encoding='utf-8') as file:
+            file.write(json.dumps(entry, ensure_ascii=False) + '\n')
+    return entry['file']
+
+def read_index(directory: str = PAGE_STORE_DIR) -> List[Dict[str, Any]]:
+    '''
+    Beskrivelse:
+        Læser sidelagerets indeks.
+
+    Flow:
+        1. Læser INDEX_FILE linje for linje. Ugyldige linjer (fx en
+           afbrudt skrivning) logges og springes over.
+
+    Args:
+        directory:
+            Sidelagerets rodmappe (default PAGE_STORE_DIR).
+
+    Returns:
+        List[Dict[str, Any]]:
+            Indeksposter i den rækkefølge, siderne blev gemt. Tom liste
+            hvis indekset ikke findes.
+
+    Raises:
+        OSError:
+            Hvis indekset findes, men ikke kan læses.
+    '''
+    path = os.path.join(directory, INDEX_FILE)
+    if not os.path.exists(path):
+        return []
+    entries: List[Dict[str, Any]] = []
+    with open(path, encoding='utf-8') as file:
+        for number, line in enumerate(file, start=1):
+            if not line.strip():
+                continue
+            try:
+                entries.append(json.loads(line))
+            except json.JSONDecodeError:
+                logger.warning('Ugyldig linje %s i %s springes over', number, path)
+    return entries
+
+def _read_stored_page(
+    directory: str,
+    entry: Dict[str, Any],
+    lower: Optional[pd.Timestamp],
+    upper: Optional[pd.Timestamp]) -> Optional[pd.DataFrame]:
+    '''
+    Beskrivelse:
+        Læser én gemt side og fjerner rækker uden for [lower, upper).
+
+    Flow:
+        1. Streamer filen gennem gzip og parse_records i
+           CHUNK_SIZE-chunks.
+        2. Fjerner rækker, hvis UpdatedDate ligger uden for
+           [lower, upper), når en af grænserne er sat.
+
+    Args:
+        directory:
+            Sidelagerets rodmappe.
+        entry:
+            Indeksposten for siden.
+        lower:
+            Inklusiv nedre grænse for UpdatedDate, eller None.
+        upper:
+            Eksklusiv øvre grænse for UpdatedDate, eller None.
+
+    Returns:
+        Optional[pd.DataFrame]:
+            Sidens rækker (evt. tomt), eller None hvis filen mangler.
+
+    Raises:
+        ValueError:
+            Hvis filen ikke er gyldig JSON.
+        OSError:
+            Hvis filen findes, men ikke kan læses.
+    '''
+    path = os.path.join(directory, *entry['file'].split('/'))
+    try:
+        with timed('json_decode'), gzip.open(path, 'rb') as file:
+            df = parse_records(iter(lambda: file.read(CHUNK_SIZE), b''))
+    except FileNotFoundError:
+        logger.warning('Gemt side mangler og springes over: %s', path)
+        return None
+    if lower is not None or upper is not None:
+        updated = parse_dates(df['UpdatedDate'])
+        mask = pd.Series(True, index=df.index)
+        if lower is not None:
+            mask &= updated >= lower
+        if upper is not None:
+            mask &= updated < upper
+        df = df[mask.to_numpy()].reset_index(drop=True)
+    return df
+
+def _latest_rows(
+    directory: str,
+    entries: List[Dict[str, Any]],
+    lower: Optional[pd.Timestamp],
+    upper: Optional[pd.Timestamp]) -> Dict[int, Any]:
+    '''
+    Beskrivelse:
+        Finder den seneste gemte version af hver ticket, så en ældre
+        version ikke genafspilles efter en nyere.
+
+    Flow:
+        1. Læser alle sider i entries (i hentningsrækkefølge) og gemmer
+           kun ReferenceNo, UpdatedDate og rækkens placering.
+        2. Sorterer på UpdatedDate og placering og beholder sidste
+           forekomst pr. ReferenceNo: nyeste UpdatedDate vinder, og ved
+           samme UpdatedDate den senest hentede.
+
+    Args:
+        directory:
+            Sidelagerets rodmappe.
+        entries:
+            Indeksposter sorteret efter hentetidspunkt.
+        lower:
+            Inklusiv nedre grænse for UpdatedDate, eller None.
+        upper:
+            Eksklusiv øvre grænse for UpdatedDate, eller None.
+
+    Returns:
+        Dict[int, Any]:
+            Rækkenumrene (numpy-array) der skal genafspilles pr.
+            position i entries. Sider uden sådanne rækker er udeladt.
+
+    Raises:
+        ValueError, OSError:
+            Som _read_stored_page.
+    '''
+    keys: List[pd.DataFrame] = []
+    for position, entry in enumerate(entries):
+        df = _read_stored_page(directory, entry, lower, upper)
+        if df is None or df.empty:
+            continue
+        keys.append(pd.DataFrame({
+            'ref': pd.to_numeric(df['ReferenceNo'], errors='coerce'),
+            'updated': parse_dates(df['UpdatedDate']),
+            'entry': position,
+            'row': range(len(df))}))
+    if not keys:
+        return {}
+    latest = (
+        pd.concat(keys, ignore_index=True)
+        .sort_values(['updated', 'entry', 'row'], kind='stable', na_position='first')
+        .drop_duplicates('ref', keep='last'))
+    return {entry: group['row'].sort_values().to_numpy() for entry, group in latest.groupby('entry')}
+
+def iter_stored_pages(
+    directory: str = PAGE_STORE_DIR,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    entity_type: str = 'Ticket',
+    latest_only: bool = False) -> Iterator[pd.DataFrame]:
+    '''
+    Beskrivelse:
+        Genafspiller gemte NSP-sider fra sidelageret som DataFrames i
+        samme format som api_fetch_pages, så tickets og dimensioner kan
+        genopbygges uden at hente fra NSP igen.
+
+    Flow:
+        1. Udvælger indeksposter for entity_type, hvis UpdatedDate-
+           interval overlapper [since, until). Kun indekset læses for
+           at finde siderne.
+        2. Sorterer posterne efter hentetidspunkt, så den senest hentede
+           version af en ticket skrives sidst.
+        3. Med latest_only læses siderne først én gang for at finde den
+           seneste version af hver ticket (_latest_rows), og kun de
+           rækker yieldes. Ellers yieldes alle versioner.
+        4. Streamer hver fil gennem gzip og parse_records i
+           CHUNK_SIZE-chunks og fjerner rækker uden for [since, until)
+           (_read_stored_page).
+        5. Manglende filer logges og springes over.
+
+    Args:
+        directory:
+            Sidelagerets rodmappe (default PAGE_STORE_DIR).
+        since:
+            Valgfri inklusiv nedre grænse for UpdatedDate (ISO8601 UTC).
+        until:
+            Valgfri eksklusiv øvre grænse for UpdatedDate (ISO8601 UTC).
+        entity_type:
+            NSP-entityType der genafspilles (default 'Ticket').
+        latest_only:
+            True for kun at yielde den seneste gemte version af hver
+            ticket (default False).
+
+    Returns:
+        Iterator[pd.DataFrame]:
+            Ikke-tomme sider i hentningsrækkefølge.
+
+    Raises:
+        ValueError:
+            Hvis en fil ikke er gyldig JSON.
+        OSError:
+            Hvis en fil ikke kan læses.
+    '''
+    lower = _utc(since)
+    upper = _utc(until)
+
+    entries = [
+        entry for entry in read_index(directory)
+        if entry.get('entity_type') == entity_type
+        and (lower is None or (entry.get('updated_max') and pd.Timestamp(entry['updated_max']) >= lower))
+        and (upper is None or (entry.get('updated_min') and pd.Timestamp(entry['updated_min']) < upper))]
+    entries.sort(key=lambda entry: (entry['fetched_at'], entry['file']))
+    logger.info('Genafspiller %s gemte sider fra %s', len(entries), directory)
+
+    latest = _latest_rows(directory, entries, lower, upper) if latest_only else None
+    for position, entry in enumerate(entries):
+        if latest is not None and position not in latest:
+            continue
+        df = _read_stored_page(directory, entry, lower, upper)
+        if df is None:
+            continue
+        if latest is not None:
+            df = df.iloc[latest[position]].reset_index(drop=True)
+        if df.empty:
+            continue
+        count_rows('replay', len(df))
+        yield df
+
+def prune_pages(
+    directory: str = PAGE_STORE_DIR,
+    retention_days: int = PAGE_STORE_RETENTION_DAYS,
+    now: Optional[datetime.datetime] = None) -> int:
+    '''
+    Beskrivelse:
+        Sletter sider, der er hentet for mere end retention_days dage
+        siden, så sidelageret ikke vokser uden grænse (fx med
+        grænsesiden, der hentes igen i hver cyklus).
+
+    Flow:
+        1. Gør intet, hvis directory eller retention_days ikke er sat.
+        2. Finder dato-mapperne under pages/, som ligger før
+           skæringsdatoen (UTC). Er der ingen, stopper den her, så
+           indekset kun læses, når der faktisk er noget at rydde op i
+           (højst én gang i døgnet).
+        3. Skriver indekset om uden posterne for de mapper (til en
+           midlertidig fil, der erstatter indekset med os.replace),
+           og sletter derefter mapperne, inkl. efterladte .tmp-filer.
+
+    Args:
+        directory:
+            Sidelagerets rodmappe (default PAGE_STORE_DIR).
+        retention_days:
+            Antal dage sider gemmes, eller 0 for altid (default
+            PAGE_STORE_RETENTION_DAYS).
+        now:
+            Valgfrit tidspunkt (UTC) til brug i stedet for nuværende tid.
+
+    Returns:
+        int:
+            Antal indeksposter, der er fjernet.
+
+    Raises:
+        OSError:
+            Hvis indekset ikke kan skrives, eller en mappe ikke kan
+            slettes.
+    '''
+    if not directory or retention_days <= 0:
+        return 0
+    pages_dir = os.path.join(directory, 'pages')
+    if not os.path.isdir(pages_dir):
+        return 0
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+    cutoff = (now - datetime.timedelta(days=retention_days)).strftime('%Y-%m-%d')
+    expired = sorted(name for name in os.listdir(pages_dir) if name < cutoff)
+    if not expired:
+        return 0
+
+    prefixes = tuple(f'pages/{name}/' for name in expired)
+    with _index_lock:
+        entries = read_index(directory)
+        kept = [entry for entry in entries if not entry.get('file', '').startswith(prefixes)]
+        path = os.path.join(directory, INDEX_FILE)
+        with open(f'{path}.tmp', 'w', encoding='utf-8') as file:
+            for entry in kept:
+                file.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        os.replace(f'{path}.tmp', path)
+    for name in expired:
+        shutil.rmtree(os.path.join(pages_dir, name))
+    removed = len(entries) - len(kept)
+    logger.info(
+        'Sidelager ryddet: %s sider fra %s dag(e) før %s slettet', removed, len(expired), cutoff)
+    return removed
@@ -0,0 +1,648 @@
+import datetime
+import hashlib
+import logging
+import os
+import shutil
+import time
+import uuid
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from sqlalchemy.engine import make_url
+
+from config import PARQUET_DIR
+from utils.create_ticket_df import TICKET_SCHEMA
+from utils.metrics import count_rows
+from utils.scheduler import local_now
+from utils.write_to_sql import DimTables
+
+#######################################################################
+
+logger = logging.getLogger(__name__)
+
+PART_FILE = 'part-0.parquet'
+NULL_PARTITION = '__HIVE_DEFAULT_PARTITION__'
+PARTITION_COLUMN = 'created_month'
+TICKETS_DIR = 'tickets'
+# Deltafiler og id -> måned-indekset ligger uden for tickets/, og mappen
+# starter med '_', så pyarrow.dataset og DuckDB ikke læser dem som data.
+DELTA_DIR = os.path.join('_meta', 'tickets_delta')
+MONTH_INDEX_FILE = os.path.join('_meta', 'tickets_months.parquet')
+
+# Arrow-type pr. kolonnetype i TICKET_SCHEMA
+ARROW_TYPES: Dict[str, str] = {
+    'id': 'int64',
+    'int': 'int64',
+    'date': 'date32',
+    'text': 'string'}
+
+# Kolonner som ellers kun beregnes eller sættes i databasen
+# (update_tickets og afstemningen)
+MEASURE_COLS: List[str] = ['days_till_start', 'offset_duration']
+SOFT_DELETE_COL = 'deleted_at'
+
+def _pyarrow() -> Tuple[Any, Any]:
+    '''
+    Beskrivelse:
+        Importerer pyarrow først, når sinken bruges, så tjenesten kan
+        køre uden pyarrow, når PARQUET_DIR ikke er sat.
+
+    Args:
+        Ingen.
+
+    Returns:
+        Tuple[Any, Any]:
+            Modulerne pyarrow og pyarrow.parquet.
+
+    Raises:
+        ImportError:
+            Hvis pyarrow ikke er installeret.
+    '''
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError as exc:
+        raise ImportError('PARQUET_DIR kræver pyarrow (pip install pyarrow)') from exc
+    return pyarrow, pyarrow.parquet
+
+def require_pyarrow() -> None:
+    '''
+    Beskrivelse:
+        Kontrollerer ved opstart, at pyarrow kan importeres, når
+        PARQUET_DIR er sat, så en manglende afhængighed stopper
+        tjenesten, før der hentes fra NSP, i stedet for at fejle hver
+        cyklus efter SQL-skrivningen (og før watermark flyttes).
+
+    Flow:
+        1. Importerer pyarrow via _pyarrow.
+
+    Args:
+        Ingen.
+
+    Returns:
+        None.
+
+    Raises:
+        ImportError:
+            Hvis pyarrow ikke er installeret.
+    '''
+    _pyarrow()
+
+def parquet_dir(target: str, root: str = PARQUET_DIR) -> str:
+    '''
+    Beskrivelse:
+        Finder mappen for en måldatabase fra udtrækskonfigurationen.
+
+    Flow:
+        1. Standarddatabasen (target '') skriver direkte i root.
+        2. Øvrige targets skriver i en undermappe opkaldt efter
+           databasens navn i URL'en (uden sti og endelse) eller, hvis
+           den ikke har et, en kort hash af URL'en.
+
+    Args:
+        target:
+            Target fra udtrækskonfigurationen.
+        root:
+            Rodmappe for Parquet-filerne (default PARQUET_DIR).
+
+    Returns:
+        str:
+            Mappen, som write_parquet skal skrive til.
+
+    Raises:
+        Ingen.
+    '''
+    if not target:
+        return root
+    database = make_url(target).database
+    name = os.path.splitext(os.path.basename(database))[0] if database else ''
+    return os.path.join(root, name or hashlib.sha1(target.encode('utf-8')).hexdigest()[:8])
+
+def _ticket_schema(pa: Any) -> Any:
+    '''
+    Beskrivelse:
+        Fast pyarrow-skema for tickets, så alle partitioner og deltaer
+        har samme kolonner og typer uanset indholdet af en side.
+
+    Flow:
+        1. Kolonnerne fra TICKET_SCHEMA med typer fra ARROW_TYPES.
+        2. row_hash, MEASURE_COLS (int64) og SOFT_DELETE_COL
+           (timestamp).
+
+    Args:
+        pa:
+            Modulet pyarrow (fra _pyarrow).
+
+    Returns:
+        pyarrow.Schema:
+            Skemaet.
+
+    Raises:
+        Ingen.
+    '''
+    return pa.schema(
+        [(name, pa.type_for_alias(ARROW_TYPES[kind])) for name, (_, kind) in TICKET_SCHEMA.items()]
+        + [('row_hash', pa.int64())]
+        + [(name, pa.int64()) for name in MEASURE_COLS]
+        + [(SOFT_DELETE_COL, pa.timestamp('us'))])
+
+def _write_table(table: Any, file_path: str) -> None:
+    '''
+    Beskrivelse:
+        Skriver en Parquet-fil atomart, så læsere enten ser den gamle
+        eller den nye fil.
+
+    Flow:
+        1. Opretter mappen efter behov.
+        2. Skriver table (zstd, uden pandas-metadata) til en skjult
+           midlertidig fil i samme mappe.
+        3. Flytter filen på plads med os.replace.
+
+    Args:
+        table:
+            pyarrow.Table der skrives.
+        file_path:
+            Den endelige fils sti.
+
+    Returns:
+        None.
+
+    Raises:
+        ImportError:
+            Hvis pyarrow ikke er installeret.
+        OSError:
+            Hvis filen ikke kan skrives eller flyttes.
+    '''
+    pa, pq = _pyarrow()
+    directory, name = os.path.split(file_path)
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = os.path.join(directory, f'.{name}.tmp')
+    pq.write_table(table.replace_schema_metadata(), tmp_path, compression='zstd')
+    os.replace(tmp_path, file_path)
+
+def _write_partition(path: str, df: pd.DataFrame, schema: Any) -> None:
+    '''
+    Beskrivelse:
+        Fletter df ind i én Parquet-fil (bruges til dimensionstabellerne)
+        og erstatter filen atomart.
+
+    Flow:
+        1. Læser den eksisterende fil, hvis den findes, og lægger de nye
+           rækker efter den.
+        2. Beholder seneste række pr. id og sorterer på id.
+        3. Skriver via _write_table, så læsere enten ser den gamle eller
+           den nye fil.
+
+    Args:
+        path:
+            Tabellens mappe.
+        df:
+            Nye rækker med kolonnerne i schema.
+        schema:
+            pyarrow.Schema for filen.
+
+    Returns:
+        None.
+
+    Raises:
+        OSError:
+            Hvis filen ikke kan læses eller skrives.
+    '''
+    pa, pq = _pyarrow()
+    file_path = os.path.join(path, PART_FILE)
+    table = pa.Table.from_pandas(df, schema=schema, preserve_index=False)
+    if os.path.exists(file_path):
+        table = pa.concat_tables([pq.read_table(file_path, schema=schema), table])
+    merged = table.to_pandas(types_mapper=pd.ArrowDtype)
+    merged = merged.drop_duplicates(subset=['id'], keep='last').sort_values('id', kind='stable')
+    _write_table(pa.Table.from_pandas(merged, schema=schema, preserve_index=False), file_path)
+
+def derive_measures(df: pd.DataFrame, today: datetime.date) -> pd.DataFrame:
+    '''
+    Beskrivelse:
+        Beregner days_till_start og offset_duration for åbne tickets med
+        samme regler som SqlDialect.refresh_measures_sql, så Parquet-
+        filerne har de samme afledte felter som tickets-tabellen.
+
+    Flow:
+        1. days_till_start: dage fra today til start_date, 0 hvis
+           start_date er NULL eller senest today.
+        2. offset_duration: 0 hvis end_date er NULL eller før today,
+           eller start_date er NULL; duration hvis start_date er efter
+           today; ellers dage fra today til end_date + 1.
+        3. Lukkede tickets (closed_date sat) beholder værdierne i df
+           (NULL, hvis kolonnerne mangler), da databasen kun
+           genberegner åbne tickets.
+
+    Args:
+        df:
+            Tickets med kolonnerne fra TICKET_SCHEMA.
+        today:
+            Datoen der regnes fra.
+
+    Returns:
+        pd.DataFrame:
+            df med MEASURE_COLS som nullable Int64.
+
+    Raises:
+        Ingen.
+    '''
+    day = pd.Timestamp(today)
+    start = pd.to_datetime(df['start_date'].astype(object))
+    end = pd.to_datetime(df['end_date'].astype(object))
+    duration = pd.to_numeric(df['duration'].astype(object), errors='coerce')
+    days_till_start = np.where(start > day, (start - day).dt.days, 0)
+    offset_duration = np.select(
+        [end.isna() | (end < day) | start.isna(), start > day],
+        [0, duration],
+        (end - day).dt.days + 1)
+
+    is_open = df['closed_date'].isna().to_numpy()
+    df = df.copy()
+    for name, values in (('days_till_start', days_till_start), ('offset_duration', offset_duration)):
+        previous = df[name].astype(object) if name in df else pd.Series(None, index=df.index, dtype=object)
+        df[name] = pd.array(np.where(is_open, values, previous.to_numpy()), dtype='Int64')
+    return df
+
+def write_parquet(
+    frames: Tuple[DimTables, pd.DataFrame],
+    directory: str,
+    today: Optional[datetime.date] = None) -> None:
+    '''
+    Beskrivelse:
+        Skriver dimensionstabeller og ticket_df fra prepare_sql_frames
+        til Parquet ved siden af SQL-upserten, så rapportering kan læse
+        kolonnefiler i stedet for at belaste tickets-tabellen. Tickets
+        skrives som en lille deltafil pr. side, som compact_parquet
+        senere fletter ind i partitionerne, så en side ikke koster en
+        omskrivning af hele partitioner.
+
+    Flow:
+        1. Hver dimensionstabel flettes på id ind i én fil,
+           <directory>/<tabel>/part-0.parquet (dimensionerne er små).
+        2. Tickets får de afledte felter (derive_measures med today),
+           deleted_at NULL (upserten nulstiller den i databasen) og
+           created_month (NULL_PARTITION uden created_date).
+        3. Rækkerne sorteres på created_month og skrives som én ny fil i
+           <directory>/_meta/tickets_delta/, navngivet efter
+           skrivetidspunktet, så compact_parquet kan anvende dem i
+           rækkefølge. Kolonnetyperne er faste (_ticket_schema), så alle
+           filer har samme skema, også når en kolonne kun indeholder NULL.
+
+    Args:
+        frames:
+            Dimensionstabeller og ticket_df fra prepare_sql_frames.
+        directory:
+            Mappen for måldatabasen (se parquet_dir).
+        today:
+            Dato for de afledte felter (default dags dato i TIMEZONE).
+
+    Returns:
+        None.
+
+    Raises:
+        ImportError:
+            Hvis pyarrow ikke er installeret.
+        OSError:
+            Hvis en fil ikke kan skrives.
+    '''
+    pa, _ = _pyarrow()
+    dim_tables, ticket_df = frames
+
+    for table_name, dim_df, label_col in dim_tables:
+        if dim_df.empty:
+            continue
+        schema = pa.schema([('id', pa.int64()), (label_col, pa.string())])
+        _write_partition(os.path.join(directory, table_name), dim_df[['id', label_col]], schema)
+
+    if ticket_df.empty:
+        return
+    df = derive_measures(ticket_df, today or local_now().date())
+    df[SOFT_DELETE_COL] = None
+    months = pd.to_datetime(df['created_date'], errors='coerce').dt.strftime('%Y-%m')
+    df[PARTITION_COLUMN] = months.fillna(NULL_PARTITION).to_numpy()
+    df = df.sort_values(PARTITION_COLUMN, kind='stable')
+    schema = _ticket_schema(pa).append(pa.field(PARTITION_COLUMN, pa.string()))
+    name = f'{time.time_ns():020d}-{uuid.uuid4().hex[:8]}.parquet'
+    _write_table(
+        pa.Table.from_pandas(df[schema.names], schema=schema, preserve_index=False),
+        os.path.join(directory, DELTA_DIR, name))
+    count_rows('write_parquet', len(df))
+    logger.info('%s tickets skrevet til Parquet-delta (%s måneder)', len(df), df[PARTITION_COLUMN].nunique())
+
+def _partition_path(directory: str, month: str) -> str:
+    '''
+    Beskrivelse:
+        Stien til én månedspartition af tickets (Hive-stil,
+        created_month=YYYY-MM).
+
+    Args:
+        directory:
+            Måldatabasens Parquet-mappe.
+        month:
+            Måneden som 'YYYY-MM'.
+
+    Returns:
+        str:
+            Stien til partitionens Parquet-fil.
+
+    Raises:
+        Ingen.
+    '''
+    return os.path.join(directory, TICKETS_DIR, f'{PARTITION_COLUMN}={month}', PART_FILE)
+
+def _read_month_index(directory: str) -> pd.Series:
+    '''
+    Beskrivelse:
+        Læser indekset over hvilken månedspartition, hver ticket ligger
+        i, så en ændret ticket kan fjernes fra sin gamle partition uden
+        at læse alle partitioner.
+
+    Args:
+        directory:
+            Måldatabasens Parquet-mappe.
+
+    Returns:
+        pd.Series:
+            created_month indekseret på id; tom hvis indekset endnu
+            ikke findes.
+
+    Raises:
+        ImportError:
+            Hvis pyarrow ikke er installeret.
+    '''
+    _, pq = _pyarrow()
+    path = os.path.join(directory, MONTH_INDEX_FILE)
+    if not os.path.exists(path):
+        return pd.Series(dtype=object)
+    df = pq.read_table(path).to_pandas()
+    return pd.Series(df[PARTITION_COLUMN].to_numpy(), index=df['id'].to_numpy(), dtype=object)
+
+def _write_month_index(directory: str, index: pd.Series) -> None:
+    '''
+    Beskrivelse:
+        Skriver indekset over ticketens månedspartition atomart (via
+        _write_table).
+
+    Args:
+        directory:
+            Måldatabasens Parquet-mappe.
+        index:
+            created_month indekseret på id, som fra _read_month_index.
+
+    Returns:
+        None.
+
+    Raises:
+        ImportError:
+            Hvis pyarrow ikke er installeret.
+        OSError:
+            Hvis filen ikke kan skrives.
+    '''
+    pa, _ = _pyarrow()
+    table = pa.table({
+        'id': pa.array(index.index.to_numpy(), pa.int64()),
+        PARTITION_COLUMN: pa.array(index.to_numpy(), pa.string())})
+    _write_table(table, os.path.join(directory, MONTH_INDEX_FILE))
+
+def _rewrite_partition(
+    directory: str,
+    month: str,
+    new_df: Optional[pd.DataFrame],
+    replaced_ids: Iterable[int],
+    today: Optional[datetime.date],
+    deleted: Optional[Tuple[Iterable[int], datetime.datetime]] = None) -> bool:
+    '''
+    Beskrivelse:
+        Skriver én månedspartition om ud fra den eksisterende fil og
+        nye rækker.
+
+    Flow:
+        1. Læser den eksisterende partition, hvis den findes.
+        2. Fjerner rækker med id i replaced_ids (de er erstattet af en
+           nyere version, her eller i en anden partition). Lukkede
+           tickets i new_df arver de afledte felter fra rækken, de
+           erstatter, som i databasen.
+        3. Tilføjer new_df og genberegner afledte felter for åbne
+           tickets med today (udelades med today None).
+        4. Sætter deleted_at for id'erne i deleted, som ikke allerede er
+           soft-deleted.
+        5. Skriver kun, hvis partitionen er ændret. En tom partition
+           slettes.
+
+    Args:
+        directory:
+            Mappen for måldatabasen.
+        month:
+            Partitionens created_month.
+        new_df:
+            Seneste version af de tickets, der hører til partitionen,
+            eller None.
+        replaced_ids:
+            Id'er, hvis eksisterende række skal fjernes.
+        today:
+            Dato for de afledte felter, eller None for at lade dem stå.
+        deleted:
+            Valgfrit (id'er, tidspunkt) for soft-deletes.
+
+    Returns:
+        bool:
+            True hvis partitionen blev skrevet om eller slettet.
+
+    Raises:
+        OSError:
+            Hvis filen ikke kan læses eller skrives.
+    '''
+    pa, pq = _pyarrow()
+    schema = _ticket_schema(pa)
+    path = _partition_path(directory, month)
+    if os.path.exists(path):
+        existing = pq.read_table(path, schema=schema).to_pandas(types_mapper=pd.ArrowDtype)
+    else:
+        existing = pd.DataFrame({name: pd.Series(dtype=pd.ArrowDtype(schema.field(name).type)) for name in schema.names})
+    original = existing
+
+    replaced = existing['id'].isin(list(replaced_ids))
+    if new_df is not None and not new_df.empty:
+        new_df = new_df[schema.names].reset_index(drop=True)
+        previous = existing.loc[replaced, ['id', *MEASURE_COLS]].set_index('id')
+        closed = new_df['closed_date'].notna()
+        for name in MEASURE_COLS:
+            carried = new_df['id'].map(previous[name].astype(object)) if not previous.empty else None
+            if carried is not None:
+                new_df[name] = new_df[name].astype(object).where(~closed, carried)
+        existing = pd.concat(
+            [existing[~replaced].astype(object), new_df.astype(object)], ignore_index=True)
+    else:
+        existing = existing[~replaced]
+    if today is not None and not existing.empty:
+        existing = derive_measures(existing, today)
+    if deleted is not None:
+        ids, deleted_at = deleted
+        mark = existing['id'].isin(list(ids)) & existing[SOFT_DELETE_COL].isna()
+        existing = existing.astype(object)
+        existing.loc[mark.to_numpy(), SOFT_DELETE_COL] = deleted_at
+
+    table = pa.Table.from_pandas(
+        existing.sort_values('id', kind='stable'), schema=schema, preserve_index=False)
+    if len(original) == table.num_rows and os.path.exists(path) and table.equals(
+            pa.Table.from_pandas(original, schema=schema, preserve_index=False)):
+        return False
+    if table.num_rows == 0:
+        if os.path.exists(path):
+            shutil.rmtree(os.path.dirname(path))
+            return True
+        return False
+    _write_table(table, path)
+    return True
+
+def compact_parquet(
+    directory: str,
+    today: Optional[datetime.date] = None,
+    full: bool = False) -> int:
+    '''
+    Beskrivelse:
+        Fletter deltafilerne fra write_parquet ind i de partitionerede
+        ticketfiler. Kaldes én gang pr. cyklus i stedet for pr. side, så
+        hver berørt partition højst skrives om én gang pr. cyklus.
+
+    Flow:
+        1. Læser kun id og created_month fra alle deltafiler (i
+           skriverækkefølge) og finder den seneste måned pr. id.
+        2. Slår hver tickets tidligere måned op i id -> måned-indekset
+           (_meta/tickets_months.parquet). Har created_date skiftet
+           måned, skrives også den gamle partition om, så ticketen kun
+           ligger ét sted.
+        3. For hver berørt partition (med full alle partitioner) læses
+           kun de deltafiler, der har rækker for måneden, seneste
+           version pr. id beholdes, og partitionen skrives om via
+           _rewrite_partition. Hukommelsesforbruget er dermed én
+           partition ad gangen.
+        4. Indekset opdateres, og først derefter slettes deltafilerne.
+           Afbrydes kompakteringen, giver en ny kørsel samme resultat.
+
+    Args:
+        directory:
+            Mappen for måldatabasen (se parquet_dir).
+        today:
+            Dato for de afledte felter (default dags dato i TIMEZONE).
+        full:
+            True for også at genberegne afledte felter i alle
+            partitioner (i schedulerens daglige slot, som
+            update_tickets' fulde genberegning).
+
+    Returns:
+        int:
+            Antal partitioner, der blev skrevet om eller slettet.
+
+    Raises:
+        ImportError:
+            Hvis pyarrow ikke er installeret.
+        OSError:
+            Hvis en fil ikke kan læses eller skrives.
+    '''
+    pa, pq = _pyarrow()
+    today = today or local_now().date()
+    delta_dir = os.path.join(directory, DELTA_DIR)
+    files = sorted(
+        os.path.join(delta_dir, name) for name in os.listdir(delta_dir)
+        if name.endswith('.parquet')) if os.path.isdir(delta_dir) else []
+
+    latest = pd.Series(dtype=object)
+    file_months: Dict[str, List[str]] = {}
+    moved = pd.Series(dtype=object)
+    index = _read_month_index(directory)
+    if files:
+        keys = []
+        for file_path in files:
+            df = pq.read_table(file_path, columns=['id', PARTITION_COLUMN]).to_pandas()
+            keys.append(df)
+            for month in df[PARTITION_COLUMN].unique():
+                file_months.setdefault(month, []).append(file_path)
+        keys_df = pd.concat(keys, ignore_index=True).drop_duplicates('id', keep='last')
+        latest = pd.Series(keys_df[PARTITION_COLUMN].to_numpy(), index=keys_df['id'].to_numpy(), dtype=object)
+        previous = index.reindex(latest.index)
+        moved = previous[previous.notna() & (previous != latest)]
+
+    months = set(latest) | set(moved)
+    if full:
+        tickets_dir = os.path.join(directory, TICKETS_DIR)
+        if os.path.isdir(tickets_dir):
+            months |= {
+                name.split('=', 1)[1] for name in os.listdir(tickets_dir)
+                if name.startswith(f'{PARTITION_COLUMN}=')}
+    if not months:
+        return 0
+
+    schema = _ticket_schema(pa)
+    touched = set(latest.index)
+    rewritten = 0
+    for month in sorted(months):
+        new_df = None
+        if month in file_months:
+            parts = [
+                pq.read_table(file_path, filters=[(PARTITION_COLUMN, '=', month)]).select(schema.names)
+                for file_path in file_months[month]]
+            new_df = (
+                pa.concat_tables(parts).to_pandas(types_mapper=pd.ArrowDtype)
+                .drop_duplicates('id', keep='last'))
+            new_df = new_df[new_df['id'].map(latest).eq(month).to_numpy()]
+        replaced = touched if month in file_months or month in set(moved) else ()
+        rewritten += _rewrite_partition(directory, month, new_df, replaced, today)
+
+    if files:
+        index = pd.concat([index[~index.index.isin(latest.index)], latest])
+        _write_month_index(directory, index)
+        for file_path in files:
+            os.remove(file_path)
+    logger.info(
+        'Parquet kompakteret: %s deltafiler, %s tickets, %s partitioner skrevet om (%s flyttet måned)',
+        len(files), len(latest), rewritten, len(moved))
+    return rewritten
+
+def delete_parquet(
+    directory: str,
+    ids: List[int],
+    deleted_at: Optional[datetime.datetime] = None) -> int:
+    '''
+    Beskrivelse:
+        Soft-deleter tickets i Parquet-filerne, som afstemningen gør i
+        tickets-tabellen.
+
+    Flow:
+        1. Kompakterer først ventende deltafiler (compact_parquet), så
+           en senere upsert og en sletning anvendes i rigtig rækkefølge.
+        2. Finder partitionerne for ids via id -> måned-indekset og
+           sætter deleted_at for de tickets, der ikke allerede er
+           soft-deleted.
+
+    Args:
+        directory:
+            Mappen for måldatabasen (se parquet_dir).
+        ids:
+            Ticket-id'er der soft-deletes.
+        deleted_at:
+            Tidspunkt (naiv UTC) (default nu).
+
+    Returns:
+        int:
+            Antal partitioner, der blev skrevet om.
+
+    Raises:
+        ImportError:
+            Hvis pyarrow ikke er installeret.
+        OSError:
+            Hvis en fil ikke kan læses eller skrives.
+    '''
+    if not ids:
+        return 0
+    compact_parquet(directory)
+    deleted_at = deleted_at or datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+    months = _read_month_index(directory).reindex(ids).dropna()
+    rewritten = 0
+    for month, month_ids in months.groupby(months):
+        rewritten += _rewrite_partition(
+            directory, month, None, (), None, deleted=(list(month_ids.index), deleted_at))
+    logger.info('%s tickets soft-deleted i Parquet (%s partitioner)', len(months), rewritten)
+    return rewritten
@@ -0,0 +1,348 @@
+import codecs
+import json
+import logging
+from typing import IO, Any, Dict, Iterable, Iterator, List, Optional
+
+import pandas as pd
+import requests
+
+from utils.metrics import count_bytes
+
+#######################################################################
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+
+_WHITESPACE = ' \t\n\r'
+
+class _JsonStream:
+    '''
+    Beskrivelse:
+        Minimal inkrementel JSON-læser oven på en strøm af bytes-chunks.
+        Holder kun den del af teksten i hukommelsen, som endnu ikke er
+        læst, og afkoder enkelte værdier med json.JSONDecoder.raw_decode.
+
+    Flow:
+        1. Afkoder bytes til tekst med en inkrementel UTF-8-decoder.
+        2. Fylder bufferen op, når parseren har brug for flere tegn,
+           og smider allerede læste tegn væk.
+
+    Args:
+        chunks:
+            Iterable af bytes, fx response.iter_content().
+
+    Returns:
+        Ingen. Klassen bruges internt af parse_records.
+
+    Raises:
+        ValueError:
+            Hvis strømmen ikke indeholder gyldig JSON.
+    '''
+    def __init__(self, chunks: Iterable[bytes]) -> None:
+        self._chunks: Iterator[bytes] = iter(chunks)
+        self._decoder = codecs.getincrementaldecoder('utf-8')()
+        self._json = json.JSONDecoder()
+        self._buf = ''
+        self._pos = 0
+        self._exhausted = False
+
+    def _fill(self) -> bool:
+        '''
+        Beskrivelse:
+            Læser næste chunk ind i bufferen og kasserer den del, der
+            allerede er læst.
+
+        Flow:
+            1. Er strømmen slut, returneres False.
+            2. Chunken dekodes inkrementelt, så et UTF-8-tegn delt
+               over to chunks samles korrekt; ved slut tømmes
+               dekoderen (final=True).
+            3. Bufferen starter herefter ved den aktuelle position.
+
+        Args:
+            Ingen.
+
+        Returns:
+            bool:
+                True hvis der blev læst (eller afsluttet) en chunk,
+                False hvis strømmen allerede var slut.
+
+        Raises:
+            UnicodeDecodeError:
+                Hvis strømmen ikke er gyldig UTF-8.
+        '''
+        if self._exhausted:
+            return False
+        chunk = next(self._chunks, None)
+        if chunk is None:
+            self._exhausted = True
+            text = self._decoder.decode(b'', final=True)
+        else:
+            text = self._decoder.decode(chunk)
+        self._buf = self._buf[self._pos:] + text
+        self._pos = 0
+        return True
+
+    def peek(self) -> str:
+        '''
+        Beskrivelse:
+            Returnerer næste ikke-whitespace-tegn uden at læse det.
+
+        Flow:
+            1. Springer whitespace over og fylder bufferen op efter
+               behov.
+
+        Args:
+            Ingen.
+
+        Returns:
+            str:
+                Næste tegn.
+
+        Raises:
+            ValueError:
+                Hvis strømmen slutter først.
+        '''
+        while True:
+            while self._pos < len(self._buf) and self._buf[self._pos] in _WHITESPACE:
+                self._pos += 1
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if not self._fill():
+                raise ValueError('Uventet slut på JSON-strømmen')
+
+    def expect(self, char: str) -> None:
+        '''
+        Beskrivelse:
+            Læser næste ikke-whitespace-tegn og kontrollerer, at det
+            er char (fx '{' eller ':').
+
+        Args:
+            char:
+                Det forventede tegn.
+
+        Returns:
+            None.
+
+        Raises:
+            ValueError:
+                Hvis næste tegn er et andet, eller strømmen slutter.
+        '''
+        found = self.peek()
+        if found != char:
+            raise ValueError(f'Forventede {char!r} men fandt {found!r} i JSON-strømmen')
+        self._pos += 1
+
+    def value(self) -> Any:
+        '''
+        Beskrivelse:
+            Læser og returnerer næste hele JSON-værdi (fx én record
+            eller en nøgle).
+
+        Flow:
+            1. Forsøger json.JSONDecoder.raw_decode fra den aktuelle
+               position og fylder bufferen op, indtil værdien er hel.
+            2. Slutter værdien præcis ved bufferens ende, før strømmen
+               er slut, læses endnu en chunk, da et tal kan være
+               afkortet af chunk-grænsen.
+
+        Args:
+            Ingen.
+
+        Returns:
+            Any:
+                Den dekodede værdi.
+
+        Raises:
+            json.JSONDecodeError:
+                Hvis værdien ikke er gyldig JSON.
+            ValueError:
+                Hvis strømmen slutter før værdien.
+        '''
+        self.peek()
+        while True:
+            try:
+                obj, end = self._json.raw_decode(self._buf, self._pos)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            # Et tal i slutningen af bufferen kan være afkortet af chunk-grænsen
+            if end == len(self._buf) and not self._exhausted:
+                self._fill()
+                continue
+            self._pos = end
+            return obj
+
+    def at_end(self) -> bool:
+        '''
+        Beskrivelse:
+            Afgør, om strømmen kun indeholder whitespace efter den
+            aktuelle position.
+
+        Flow:
+            1. Springer whitespace over og fylder bufferen op, indtil et
+               andet tegn findes, eller strømmen er slut.
+
+        Args:
+            Ingen.
+
+        Returns:
+            bool:
+                True hvis der ikke er flere ikke-whitespace-tegn.
+
+        Raises:
+            Ingen.
+        '''
+        try:
+            self.peek()
+        except ValueError:
+            return True
+        return False
+
+def parse_records(chunks: Iterable[bytes], key: str = 'Data') -> pd.DataFrame:
+    '''
+    Beskrivelse:
+        Parser et JSON-objekt inkrementelt fra en strøm af bytes og
+        lægger elementerne i arrayet under key direkte i kolonnebuffere,
+        hvorefter DataFrame dannes én gang. Der opbygges ingen samlet
+        tekststreng og ingen mellemliggende liste af dicts.
+
+    Flow:
+        1. Læser top-level objektet nøgle for nøgle; øvrige nøgler end
+           key afkodes og kasseres.
+        2. For hvert element i key-arrayet tilføjes værdierne til én
+           liste pr. kolonne. Nye kolonner udfyldes bagud med None, og
+           manglende felter i en række udfyldes med None.
+        3. Kontrollerer, at der kun er whitespace efter top-level
+           objektet.
+        4. Danner DataFrame fra kolonnebufferne.
+
+    Args:
+        chunks:
+            Iterable af bytes med JSON-svaret.
+        key:
+            Nøglen i top-level objektet, der indeholder rækkerne
+            (default 'Data').
+
+    Returns:
+        pd.DataFrame:
+            Én række pr. element i arrayet. Tomt DataFrame hvis arrayet
+            er tomt.
+
+    Raises:
+        ValueError:
+            Hvis strømmen ikke er gyldig JSON, eller hvis der følger
+            andet end whitespace efter top-level objektet.
+        KeyError:
+            Hvis top-level objektet ikke indeholder key.
+    '''
+    stream = _JsonStream(chunks)
+    columns: Dict[str, List[Any]] = {}
+    rows = 0
+    found = False
+
+    stream.expect('{')
+    if stream.peek() == '}':
+        raise KeyError(key)
+    while True:
+        name = stream.value()
+        stream.expect(':')
+        if name != key:
+            stream.value()
+        else:
+            found = True
+            stream.expect('[')
+            if stream.peek() == ']':
+                stream.expect(']')
+            else:
+                while True:
+                    record = stream.value()
+                    if not isinstance(record, dict):
+                        raise ValueError(f'Forventede objekt i {key!r} men fandt {type(record).__name__}')
+                    for field, value in record.items():
+                        column = columns.get(field)
+                        if column is None:
+                            column = [None] * rows
+                            columns[field] = column
+                        column.append(value)
+                    rows += 1
+                    if len(record) != len(columns):
+                        for column in columns.values():
+                            if len(column) < rows:
+                                column.append(None)
+                    if stream.peek() == ']':
+                        stream.expect(']')
+                        break
+                    stream.expect(',')
+        if stream.peek() == '}':
+            stream.expect('}')
+            break
+        stream.expect(',')
+    if not stream.at_end():
+        raise ValueError('Uventede data efter JSON-objektet')
+
+    if not found:
+        raise KeyError(key)
+    if rows == 0:
+        return pd.DataFrame()
+    return pd.DataFrame(columns)
+
+def parse_response(
+    response: requests.Response,
+    key: str = 'Data',
+    sink: Optional[IO[bytes]] = None) -> pd.DataFrame:
+    '''
+    Beskrivelse:
+        Streamer body fra et NSP-svar gennem parse_records, så svaret
+        aldrig holdes som samlet tekst eller liste af dicts.
+
+    Flow:
+        1. Læser body i chunks af CHUNK_SIZE bytes (gzip/deflate
+           dekomprimeres undervejs af requests).
+        2. Skriver hver chunk til sink, hvis angivet (fx en gzip-fil i
+           sidelageret, utils/page_store.py), så den rå body gemmes uden
+           at blive holdt samlet i hukommelsen.
+        3. Parser chunks til DataFrame via parse_records.
+        4. Tæller dekomprimerede og overførte bytes i metrics.
+        5. Lukker svaret, så forbindelsen returneres til poolen.
+
+    Args:
+        response:
+            HTTP-svar hentet med stream=True.
+        key:
+            Nøglen der indeholder rækkerne (default 'Data').
+        sink:
+            Valgfri binær fil, som den dekomprimerede body kopieres til.
+
+    Returns:
+        pd.DataFrame:
+            Rækkerne fra svaret.
+
+    Raises:
+        ValueError:
+            Hvis svaret ikke er gyldig JSON.
+        KeyError:
+            Hvis svaret ikke indeholder key.
+        requests.exceptions.RequestException:
+            Hvis forbindelsen afbrydes under læsning.
+        OSError:
+            Hvis sink ikke kan skrives.
+    '''
+    decoded = 0
+
+    def counted() -> Iterator[bytes]:
+        nonlocal decoded
+        for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+            decoded += len(chunk)
+            if sink is not None:
+                sink.write(chunk)
+            yield chunk
+
+    try:
+        return parse_records(counted(), key)
+    finally:
+        tell = getattr(response.raw, 'tell', None)
+        count_bytes(decoded, tell() if callable(tell) else None)
+        response.close()
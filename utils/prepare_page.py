@@ -0,0 +1,57 @@
+import datetime
+import logging
+from typing import Any, Dict, Optional, Tuple
+
+import pandas as pd
+
+from utils.etl_state import to_watermark
+from utils.extract_config import default_query, route_rows
+from utils.format_df import format_df
+from utils.metrics import count_rows, timed
+from utils.write_to_sql import prepare_sql_frames
+
+#######################################################################
+
+logger = logging.getLogger(__name__)
+
+def prepare_page(
+    item: Tuple[int, pd.DataFrame],
+    query: Optional[Dict[str, Any]] = None) -> Tuple[int, Optional[datetime.datetime], int, Dict[str, Any]]:
+    '''
+    Beskrivelse:
+        Transformationstrinnet for én side: finder sidens watermark,
+        formatterer den, fordeler rækkerne på måldatabaserne og danner
+        de DataFrames, der skal skrives til hver.
+
+    Flow:
+        1. Finder seneste UpdatedDate på siden via to_watermark.
+        2. Formatterer siden via format_df (én gang for hele siden).
+        3. Fordeler rækkerne på måldatabaser efter agentgruppe via
+           route_rows.
+        4. Danner dimensioner og ticket_df pr. måldatabase via
+           prepare_sql_frames.
+
+    Args:
+        item:
+            (sidenummer, rå DataFrame) fra enumerate over siderne.
+        query:
+            Forespørgslen siden er hentet med, eller None for
+            standardopsætningen.
+
+    Returns:
+        Tuple[int, Optional[datetime.datetime], int, Dict[str, Any]]:
+            Sidenummer, sidens watermark, antal rækker på siden og
+            resultatet af prepare_sql_frames pr. target.
+
+    Raises:
+        KeyError:
+            Hvis forventede kolonner mangler på siden.
+    '''
+    page, df = item
+    page_watermark = to_watermark(df['UpdatedDate'])
+    with timed('format_df'):
+        df = format_df(df)
+    count_rows('format_df', len(df))
+    routed = route_rows(df, query or default_query())
+    return page, page_watermark, len(df), {
+        target: prepare_sql_frames(target_df) for target, target_df in routed.items()}
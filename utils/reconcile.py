@@ -0,0 +1,325 @@
+import datetime
+import logging
+from typing import Any, Dict, List, Optional, Set
+
+import pandas as pd
+import sqlalchemy
+from sqlalchemy import bindparam, text
+from sqlalchemy.engine import Engine
+
+from config import PARQUET_DIR, RECONCILE_BATCH_SIZE, RECONCILE_INTERVAL, RECONCILE_PAGE_SIZE
+from utils.api_fetch import api_fetch_pages
+from utils.etl_state import get_etl_state, update_etl_state
+from utils.extract_config import GROUP_COLUMN, route_rows
+from utils.format_df import format_df, parse_dates
+from utils.metrics import count_rows, timed
+from utils.parquet_sink import compact_parquet, delete_parquet, parquet_dir, write_parquet
+from utils.sql_dialect import get_dialect
+from utils.update_tickets import refresh_committed, update_tickets
+from utils.write_to_sql import prepare_sql_frames, write_sql_frames
+
+#######################################################################
+
+logger = logging.getLogger(__name__)
+
+RECONCILE_SOURCE = 'reconcile'
+KEYSET_EPOCH = '1970-01-01T00:00:00Z'
+KEYSET_COLUMNS: List[str] = ['ReferenceNo', 'UpdatedDate', GROUP_COLUMN]
+
+def reconcile_due(engines: Dict[str, Engine], interval: int = RECONCILE_INTERVAL) -> bool:
+    '''
+    Beskrivelse:
+        Afgør om afstemningen skal køre, ud fra hvornår den sidst kørte
+        i hver måldatabase (etl_state, source RECONCILE_SOURCE).
+
+    Args:
+        engines:
+            Engine pr. target.
+        interval:
+            Minimum antal timer mellem to afstemninger, eller 0 for
+            aldrig (default RECONCILE_INTERVAL).
+
+    Returns:
+        bool:
+            True hvis afstemningen er slået til og ikke har kørt i en af
+            måldatabaserne inden for interval timer.
+
+    Raises:
+        sqlalchemy.exc.SQLAlchemyError:
+            Hvis etl_state ikke kan læses.
+    '''
+    if interval <= 0:
+        return False
+    threshold = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None) - datetime.timedelta(hours=interval)
+    for target_engine in engines.values():
+        state = get_etl_state(target_engine, RECONCILE_SOURCE)
+        if state is None or state.watermark is None or state.watermark < threshold:
+            return True
+    return False
+
+def _fetch_keyset(query: Dict[str, Any], page_size: int) -> pd.DataFrame:
+    '''
+    Beskrivelse:
+        Henter nøglesættet (ReferenceNo, UpdatedDate og agentgruppe) for
+        alle tickets, som query matcher, uden filter på UpdatedDate.
+
+    Flow:
+        1. Kopierer query med KEYSET_COLUMNS som eneste kolonner og
+           'store': False, så siderne ikke havner i sidelageret.
+        2. Henter alle sider via api_fetch_pages og samler dem.
+
+    Args:
+        query:
+            Forespørgsel fra plan_queries.
+        page_size:
+            Antal rækker pr. side.
+
+    Returns:
+        pd.DataFrame:
+            Kolonnerne id (Int64), updated (UTC) og de rå kolonner,
+            route_rows bruger. Tomt DataFrame hvis ingen.
+
+    Raises:
+        ApiError:
+            Hvis en side ikke kan hentes.
+    '''
+    keyset_query = {**query, 'columns': KEYSET_COLUMNS, 'store': False}
+    with timed('reconcile_keyset'):
+        pages = list(api_fetch_pages(KEYSET_EPOCH, page_size=page_size, query=keyset_query))
+    if not pages:
+        return pd.DataFrame(columns=['id', 'updated', GROUP_COLUMN])
+    df = pd.concat(pages, ignore_index=True)
+    df['id'] = pd.to_numeric(df['ReferenceNo'], errors='coerce').astype('Int64')
+    df['updated'] = parse_dates(df['UpdatedDate'])
+    df = df.dropna(subset=['id']).drop_duplicates(subset=['id'], keep='last')
+    count_rows('reconcile_keyset', len(df))
+    return df
+
+def _load_db_keyset(target_engine: Engine, group_ids: Optional[Set[int]], groups: Optional[List[str]]) -> pd.DataFrame:
+    '''
+    Beskrivelse:
+        Læser nøglesættet fra tickets for de agentgrupper, målet får
+        tickets fra.
+
+    Flow:
+        1. Er groups None (alle grupper), læses hele tickets.
+        2. Ellers begrænses til agent_group_id i group_ids (set i NSP)
+           eller i agent_groups med en label i groups.
+
+    Args:
+        target_engine:
+            Engine til måldatabasen.
+        group_ids:
+            Agentgruppe-id'er set i NSP's nøglesæt for målet.
+        groups:
+            Målets agentgrupper, eller None for alle.
+
+    Returns:
+        pd.DataFrame:
+            Kolonnerne id, db_updated (UTC) og deleted (bool).
+
+    Raises:
+        sqlalchemy.exc.SQLAlchemyError:
+            Hvis forespørgslen fejler.
+    '''
+    quote = get_dialect(target_engine).quote
+    query = 'SELECT id, last_updated, deleted_at FROM tickets'
+    params: Dict[str, Any] = {}
+    if groups is not None:
+        query += f'''
+            WHERE agent_group_id IN ({', '.join(str(int(group_id)) for group_id in sorted(group_ids)) or 'NULL'})
+            OR agent_group_id IN (SELECT id FROM agent_groups WHERE {quote('group')} IN :groups)'''
+        params['groups'] = groups
+    statement = text(query)
+    if groups is not None:
+        statement = statement.bindparams(bindparam('groups', expanding=True))
+    with target_engine.connect() as conn:
+        rows = conn.execute(statement, params).fetchall()
+    db_df = pd.DataFrame(rows, columns=['id', 'last_updated', 'deleted_at'])
+    return pd.DataFrame({
+        'id': pd.to_numeric(db_df['id']).astype('Int64'),
+        'db_updated': parse_dates(db_df['last_updated']),
+        'deleted': db_df['deleted_at'].notna()})
+
+def _soft_delete(target_engine: Engine, ids: List[Any]) -> int:
+    '''
+    Beskrivelse:
+        Soft-deleter tickets ved at sætte deleted_at.
+
+    Flow:
+        1. Indlæser ids i en temp-tabel med ét executemany-kald.
+        2. Sætter deleted_at for de rækker, der ikke allerede er
+           soft-deleted.
+
+    Args:
+        target_engine:
+            Engine til måldatabasen.
+        ids:
+            Ticket-id'er.
+
+    Returns:
+        int:
+            Antal ændrede rækker.
+
+    Raises:
+        sqlalchemy.exc.SQLAlchemyError:
+            Hvis en af sætningerne fejler.
+    '''
+    if not ids:
+        return 0
+    with target_engine.begin() as conn:
+        dialect = get_dialect(conn)
+        temp = dialect.create_staging(conn, 'reconcile_ids', 'tickets', ['id'])
+        dialect.insert_rows(conn, temp, ['id'], [(int(ticket_id),) for ticket_id in ids])
+        result = conn.execute(text(dialect.soft_delete_sql(temp)))
+        dialect.drop_temp(conn, temp)
+    return result.rowcount
+
+def reconcile(
+    engines: Dict[str, Engine],
+    plan: List[Dict[str, Any]],
+    page_size: int = RECONCILE_PAGE_SIZE,
+    batch_size: int = RECONCILE_BATCH_SIZE) -> Dict[str, int]:
+    '''
+    Beskrivelse:
+        Afstemmer tickets i måldatabaserne med NSP uden at hente alt
+        igen: finder tickets, der mangler, er forældede eller er slettet
+        eller flyttet ud af målets agentgrupper i NSP.
+
+    Flow:
+        1. For hver forespørgsel i plan hentes kun nøglesættet
+           (ReferenceNo, UpdatedDate og agentgruppe) for alle matchende
+           tickets, side for side med page_size rækker, og fordeles på
+           måldatabaserne via route_rows.
+        2. Pr. måldatabase sammenlignes nøglesættet med tickets via en
+           hash-join på id:
+           - mangler: i NSP, ikke i tabellen
+           - forældet: UpdatedDate i NSP er nyere end last_updated, eller
+             ticketen er soft-deleted i tabellen
+           - forsvundet: i tabellen (og ikke soft-deleted), ikke i NSP
+        3. Manglende, forældede og forsvundne id'er hentes med alle
+           kolonner via filtret ReferenceNo 'in' i batches af batch_size
+           og upsertes som i main (format_df, routing, prepare_sql_frames
+           og write_sql_frames), uden at siderne gemmes i sidelageret
+           ('store': False). Hver forespørgsel får kun id'erne for
+           sine egne måldatabaser. At forsvundne id'er også hentes,
+           bekræfter at de faktisk er væk (og ikke blot er gledet mellem
+           to sider under hentningen). Upserten nulstiller deleted_at, så
+           soft-deletede tickets, der findes i NSP igen, gendannes.
+           Fejler genhentningen undervejs, genberegnes afledte felter
+           for de allerede committede tickets (refresh_committed), før
+           fejlen hæves.
+        4. Forsvundne id'er, der heller ikke returneres i trin 3, soft-
+           deletes (deleted_at sættes). Med PARQUET_DIR skrives de
+           genhentede tickets også til Parquet, deltafilerne kompakteres,
+           og de samme tickets soft-deletes i Parquet-filerne
+           (delete_parquet).
+        5. Afledte ticketfelter genberegnes for de genhentede tickets,
+           og tidspunktet gemmes i etl_state (source RECONCILE_SOURCE) i
+           hver måldatabase.
+
+    Args:
+        engines:
+            Engine pr. target (se get_engine.get_target_engines).
+        plan:
+            Forespørgsler fra plan_queries.
+        page_size:
+            Sidestørrelse for nøglesættet (default RECONCILE_PAGE_SIZE).
+        batch_size:
+            Antal id'er pr. genhentning (default RECONCILE_BATCH_SIZE).
+
+    Returns:
+        Dict[str, int]:
+            Antal 'missing', 'stale', 'refetched', 'deleted' og
+            'restored' på tværs af måldatabaserne.
+
+    Raises:
+        ApiError:
+            Hvis et API-kald fejler.
+        sqlalchemy.exc.SQLAlchemyError:
+            Hvis læsning eller skrivning fejler.
+    '''
+    logger.info('Afstemning med NSP initieret')
+    started = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+    totals = {'missing': 0, 'stale': 0, 'refetched': 0, 'deleted': 0, 'restored': 0}
+    with timed('reconcile'):
+        keysets: Dict[str, List[pd.DataFrame]] = {target: [] for target in engines}
+        groups: Dict[str, Optional[List[str]]] = {target: [] for target in engines}
+        for query in plan:
+            routed = route_rows(_fetch_keyset(query, page_size), query)
+            for target, target_groups in query['routes'].items():
+                if target in routed:
+                    keysets[target].append(routed[target])
+                if groups[target] is not None:
+                    groups[target] = None if target_groups is None else groups[target] + target_groups
+
+        vanished: Dict[str, Set[int]] = {}
+        restore: Dict[str, Set[int]] = {}
+        fetch_ids: Dict[str, Set[int]] = {}
+        for target, target_engine in engines.items():
+            nsp_df = pd.concat(keysets[target], ignore_index=True) if keysets[target] else pd.DataFrame(
+                {'id': pd.Series(dtype='Int64'), 'updated': pd.Series(dtype='datetime64[ns, UTC]')})
+            group_ids = {
+                int(group_id) for group_id in pd.to_numeric(
+                    nsp_df.get(f'{GROUP_COLUMN}.Id', pd.Series(dtype=float)), errors='coerce').dropna()}
+            db_df = _load_db_keyset(target_engine, group_ids, groups[target])
+            diff = nsp_df[['id', 'updated']].merge(db_df, on='id', how='outer', indicator=True)
+            diff['deleted'] = diff['deleted'].eq(True)
+            missing = diff.loc[diff['_merge'] == 'left_only', 'id']
+            both = diff[diff['_merge'] == 'both']
+            stale = both.loc[
+                both['db_updated'].isna() | (both['updated'] > both['db_updated']) | both['deleted'], 'id']
+            gone = diff.loc[(diff['_merge'] == 'right_only') & ~diff['deleted'], 'id']
+            vanished[target] = {int(ticket_id) for ticket_id in gone}
+            restore[target] = {int(ticket_id) for ticket_id in both.loc[both['deleted'], 'id']}
+            fetch_ids[target] = {int(ticket_id) for ticket_id in pd.concat([missing, stale])} | vanished[target]
+            totals['missing'] += len(missing)
+            totals['stale'] += len(stale)
+            logger.info(
+                'Afstemning %s: %s i NSP, %s i tabellen, %s mangler, %s forældede, %s forsvundne',
+                target or 'standarddatabase', len(nsp_df), len(db_df), len(missing), len(stale), len(gone))
+
+        present: Dict[str, Set[int]] = {target: set() for target in engines}
+        touched_ids: Dict[str, List[Any]] = {target: [] for target in engines}
+        try:
+            for query in plan:
+                ids = sorted(set().union(*(fetch_ids[target] for target in query['routes'])))
+                for offset in range(0, len(ids), batch_size):
+                    batch = ids[offset:offset + batch_size]
+                    batch_query = {
+                        **query,
+                        'store': False,
+                        'filters': [*query['filters'], {'field': 'ReferenceNo', 'operator': 'in', 'value': batch}]}
+                    for df in api_fetch_pages(KEYSET_EPOCH, page_size=batch_size, query=batch_query):
+                        for target, target_df in route_rows(format_df(df), query).items():
+                            frames = prepare_sql_frames(target_df)
+                            try:
+                                _, page_ids = write_sql_frames(engines[target], frames)
+                            except sqlalchemy.exc.SQLAlchemyError as exc:
+                                touched_ids[target].extend(getattr(exc, 'touched_ids', []))
+                                raise
+                            touched_ids[target].extend(page_ids)
+                            if PARQUET_DIR:
+                                write_parquet(frames, parquet_dir(target))
+                            present[target].update(
+                                int(ticket_id) for ticket_id in pd.to_numeric(target_df['ReferenceNo'], errors='coerce').dropna())
+                            totals['refetched'] += len(target_df)
+        except Exception:
+            refresh_committed(engines, touched_ids)
+            raise
+
+        for target, target_engine in engines.items():
+            deleted_ids = sorted(vanished[target] - present[target])
+            totals['deleted'] += _soft_delete(target_engine, deleted_ids)
+            if PARQUET_DIR:
+                compact_parquet(parquet_dir(target))
+                delete_parquet(parquet_dir(target), deleted_ids)
+            totals['restored'] += len(restore[target] & present[target])
+            update_tickets(target_engine, touched_ids[target])
+            with target_engine.begin() as conn:
+                update_etl_state(conn, RECONCILE_SOURCE, watermark=started)
+
+    logger.info(
+        'Afstemning gennemført (%s manglende, %s forældede, %s genhentet, %s soft-deleted, %s gendannet)',
+        totals['missing'], totals['stale'], totals['refetched'], totals['deleted'], totals['restored'])
+    return totals
@@ -0,0 +1,251 @@
+import logging
+import queue
+import threading
+from typing import Any, Callable, Iterable, Iterator, List
+
+#######################################################################
+
+logger = logging.getLogger(__name__)
+
+_DONE = object()
+_POLL_SECONDS = 0.1
+
+class _StageError:
+    '''
+    Beskrivelse:
+        Bærer en undtagelse fra et trin videre ned gennem køerne, så
+        den kan skelnes fra almindelige resultater og hæves hos
+        kalderen af run_pipeline.
+
+    Args:
+        exc:
+            Undtagelsen fra source eller et trin.
+    '''
+
+    def __init__(self, exc: BaseException) -> None:
+        self.exc = exc
+
+def put_until_stopped(out_queue: queue.Queue, item: Any, stop: threading.Event) -> bool:
+    '''
+    Beskrivelse:
+        Lægger item i en begrænset kø og venter ved fuld kø, så et
+        hurtigt trin bremses af et langsomt (backpressure). Bruges af
+        run_pipeline og af vinduestrådene i api_fetch_parallel.
+
+    Flow:
+        1. Forsøger put med timeout _POLL_SECONDS.
+        2. Er køen stadig fuld, forsøges igen, indtil stop sættes.
+
+    Args:
+        out_queue:
+            Køen til næste trin.
+        item:
+            Elementet der lægges i køen.
+        stop:
+            Sættes af ejeren af køen (fx run_pipeline), når kalderen
+            stopper.
+
+    Returns:
+        bool:
+            True hvis item blev lagt i køen, False hvis stop blev sat
+            først.
+
+    Raises:
+        Ingen.
+    '''
+    while not stop.is_set():
+        try:
+            out_queue.put(item, timeout=_POLL_SECONDS)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+def _get(in_queue: queue.Queue, stop: threading.Event) -> Any:
+    '''
+    Beskrivelse:
+        Henter næste element fra et trins inputkø uden at blokere
+        længere end _POLL_SECONDS ad gangen, så tråden kan stoppe.
+
+    Flow:
+        1. Forsøger get med timeout _POLL_SECONDS.
+        2. Er køen tom, forsøges igen, indtil stop sættes.
+
+    Args:
+        in_queue:
+            Køen fra forrige trin.
+        stop:
+            Sættes af ejeren af køen (fx run_pipeline), når kalderen
+            stopper.
+
+    Returns:
+        Any:
+            Næste element, eller _DONE hvis stop blev sat først.
+
+    Raises:
+        Ingen.
+    '''
+    while not stop.is_set():
+        try:
+            return in_queue.get(timeout=_POLL_SECONDS)
+        except queue.Empty:
+            continue
+    return _DONE
+
+def _run_source(source: Iterable[Any], out_queue: queue.Queue, stop: threading.Event) -> None:
+    '''
+    Beskrivelse:
+        Første trin i pipelinen: itererer source i sin egen tråd og
+        lægger hvert element i out_queue.
+
+    Flow:
+        1. Lægger elementerne i out_queue via put_until_stopped og stopper, hvis
+           stop sættes.
+        2. Fejler iterationen, lægges undtagelsen i køen som
+           _StageError.
+        3. Lukker iteratoren (fx en generator som api_fetch_pages), så
+           dens ressourcer frigives.
+        4. Afslutter med _DONE, når source er udtømt.
+
+    Args:
+        source:
+            Iterable med input til første trin.
+        out_queue:
+            Køen til første trin i stages.
+        stop:
+            Sættes af ejeren af køen (fx run_pipeline), når kalderen
+            stopper.
+
+    Returns:
+        None.
+
+    Raises:
+        Ingen. Undtagelser sendes videre som _StageError.
+    '''
+    iterator = iter(source)
+    try:
+        for item in iterator:
+            if not put_until_stopped(out_queue, item, stop):
+                return
+    except BaseException as exc:
+        put_until_stopped(out_queue, _StageError(exc), stop)
+        return
+    finally:
+        close = getattr(iterator, 'close', None)
+        if close is not None:
+            close()
+    put_until_stopped(out_queue, _DONE, stop)
+
+def _run_stage(
+    func: Callable[[Any], Any],
+    in_queue: queue.Queue,
+    out_queue: queue.Queue,
+    stop: threading.Event) -> None:
+    '''
+    Beskrivelse:
+        Mellemtrin i pipelinen: anvender func på hvert element fra
+        in_queue i sin egen tråd og lægger resultatet i out_queue.
+
+    Flow:
+        1. Henter elementer fra in_queue via _get.
+        2. _DONE og _StageError sendes uændret videre, og tråden
+           stopper.
+        3. Fejler func, sendes undtagelsen videre som _StageError, og
+           tråden stopper.
+        4. Stopper også, hvis stop sættes.
+
+    Args:
+        func:
+            Trinnets funktion, fx prepare_page.
+        in_queue:
+            Køen fra forrige trin.
+        out_queue:
+            Køen til næste trin (eller til kalderen).
+        stop:
+            Sættes af ejeren af køen (fx run_pipeline), når kalderen
+            stopper.
+
+    Returns:
+        None.
+
+    Raises:
+        Ingen. Undtagelser sendes videre som _StageError.
+    '''
+    while True:
+        item = _get(in_queue, stop)
+        if item is _DONE or isinstance(item, _StageError):
+            put_until_stopped(out_queue, item, stop)
+            return
+        try:
+            result = func(item)
+        except BaseException as exc:
+            put_until_stopped(out_queue, _StageError(exc), stop)
+            return
+        if not put_until_stopped(out_queue, result, stop):
+            return
+
+def run_pipeline(
+    source: Iterable[Any],
+    stages: List[Callable[[Any], Any]],
+    queue_size: int) -> Iterator[Any]:
+    '''
+    Beskrivelse:
+        Kører source og hvert trin i stages i hver sin tråd, forbundet af
+        begrænsede køer, og yielder resultatet af sidste trin til
+        kalderen. Kalderen udgør dermed det sidste trin (fx skrivning til
+        SQL), mens de foregående trin arbejder videre på de næste
+        elementer. Fulde køer bremser de tidligere trin (backpressure).
+
+    Flow:
+        1. Opretter len(stages) + 1 køer med maxsize=queue_size.
+        2. Starter en tråd, der itererer source, og én tråd pr. trin,
+           som anvender trinnets funktion på hvert element i
+           rækkefølge.
+        3. Yielder resultaterne fra sidste kø i samme rækkefølge som
+           source.
+        4. En undtagelse i et trin sendes videre gennem køerne og hæves
+           hos kalderen. Stopper kalderen (fejl eller break), signaleres
+           alle tråde at stoppe, og trin-trådene afventes.
+
+    Args:
+        source:
+            Iterable med input til første trin, fx api_fetch_pages.
+        stages:
+            Funktioner der anvendes i rækkefølge på hvert element.
+        queue_size:
+            Maksimalt antal elementer, der venter mellem to trin.
+
+    Returns:
+        Iterator[Any]:
+            Resultatet af sidste trin for hvert element i source.
+
+    Raises:
+        Exception:
+            Den første undtagelse, der opstår i source eller et trin.
+    '''
+    stop = threading.Event()
+    queues: List[queue.Queue] = [queue.Queue(maxsize=max(queue_size, 1)) for _ in range(len(stages) + 1)]
+    source_thread = threading.Thread(
+        target=_run_source, args=(source, queues[0], stop), name='pipeline-source', daemon=True)
+    stage_threads = [
+        threading.Thread(
+            target=_run_stage, args=(func, queues[i], queues[i + 1], stop),
+            name=f'pipeline-{getattr(func, "__name__", i)}', daemon=True)
+        for i, func in enumerate(stages)]
+    source_thread.start()
+    for thread in stage_threads:
+        thread.start()
+    try:
+        while True:
+            item = queues[-1].get()
+            if item is _DONE:
+                return
+            if isinstance(item, _StageError):
+                raise item.exc
+            yield item
+    finally:
+        stop.set()
+        # Kildetråden kan hænge i et netværkskald; den stopper selv ved
+        # næste element og afventes derfor ikke.
+        for thread in stage_threads:
+            thread.join()
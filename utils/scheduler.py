@@ -0,0 +1,161 @@
+import datetime
+import logging
+import math
+import time
+from typing import Callable, Optional
+from zoneinfo import ZoneInfo
+
+from config import (
+    CATCHUP_INTERVAL,
+    ERROR_BACKOFF_MAX,
+    REFRESH_TIME,
+    SCRIPT_RUNTIME,
+    TIMEZONE)
+
+#######################################################################
+
+logger = logging.getLogger(__name__)
+
+def local_now() -> datetime.datetime:
+    '''
+    Beskrivelse:
+        Nuværende tidspunkt i TIMEZONE. Bruges til schedulerens ticks og
+        til dags dato i update_tickets og Parquet, så alle regner med
+        samme kalender uanset serverens og databasens tidszone.
+
+    Args:
+        Ingen.
+
+    Returns:
+        datetime.datetime:
+            Tidszonebevidst tidspunkt i TIMEZONE.
+
+    Raises:
+        Ingen.
+    '''
+    return datetime.datetime.now(ZoneInfo(TIMEZONE))
+
+class Scheduler:
+    '''
+    Beskrivelse:
+        Planlægger ETL-cyklusser på faste ticks, der ikke forskydes af
+        cyklussens varighed, og tilpasser intervallet efter seneste
+        cyklus: kortere under catch-up og eksponentielt længere ved
+        gentagne API-fejl. Afgør desuden, hvornår den daglige fulde
+        genberegning i update_tickets skal køre.
+
+    Args:
+        interval:
+            Normalt interval mellem ticks i sekunder (default SCRIPT_RUNTIME).
+        catchup_interval:
+            Interval i sekunder, mens der er backlog (default CATCHUP_INTERVAL).
+        backoff_max:
+            Øvre grænse i sekunder for intervallet ved gentagne
+            API-fejl (default ERROR_BACKOFF_MAX).
+        refresh_time:
+            Tidspunkt 'HH:MM' (lokal tid i TIMEZONE), hvorfra dagens
+            fulde genberegning er forfalden (default REFRESH_TIME).
+        clock:
+            Monoton ur-funktion (default time.monotonic).
+    '''
+
+    def __init__(
+        self,
+        interval: float = SCRIPT_RUNTIME,
+        catchup_interval: float = CATCHUP_INTERVAL,
+        backoff_max: float = ERROR_BACKOFF_MAX,
+        refresh_time: str = REFRESH_TIME,
+        clock: Callable[[], float] = time.monotonic) -> None:
+        self.interval = max(float(interval), 1.0)
+        self.catchup_interval = max(min(float(catchup_interval), self.interval), 1.0)
+        self.backoff_max = max(float(backoff_max), self.interval)
+        self.refresh_time = datetime.time.fromisoformat(refresh_time)
+        self.clock = clock
+        self.failures = 0
+        self.next_run = clock()
+
+    def next_delay(self, backlog: bool = False, api_error: bool = False) -> float:
+        '''
+        Beskrivelse:
+            Beregner tidspunktet for næste tick ud fra den seneste
+            cyklus og returnerer ventetiden dertil.
+
+        Flow:
+            1. Tæller fortløbende API-fejl; en cyklus uden ApiError
+               nulstiller tælleren.
+            2. Vælger interval:
+               - ved API-fejl: interval * 2^(fejl - 1), højst backoff_max
+               - ved backlog: catchup_interval
+               - ellers: interval
+            3. Lægger intervallet til forrige ticks planlagte tidspunkt
+               (ikke til sluttidspunktet), så ticks ikke forskydes.
+            4. Er det nye tick allerede passeret, fordi cyklussen tog
+               længere end intervallet, springes de forpassede ticks over.
+
+        Args:
+            backlog:
+                True hvis seneste cyklus stoppede hentningen, før alt
+                var hentet (FETCH_MAX_WINDOWS).
+            api_error:
+                True hvis seneste cyklus fejlede med ApiError.
+
+        Returns:
+            float:
+                Sekunder til næste tick (0 eller mere).
+
+        Raises:
+            Ingen.
+        '''
+        self.failures = self.failures + 1 if api_error else 0
+        if self.failures:
+            interval = min(self.interval * 2 ** (self.failures - 1), self.backoff_max)
+        elif backlog:
+            interval = self.catchup_interval
+        else:
+            interval = self.interval
+
+        now = self.clock()
+        self.next_run += interval
+        if self.next_run < now:
+            skipped = math.ceil((now - self.next_run) / interval)
+            logger.warning('Cyklus overskred intervallet, springer %s tick over', skipped)
+            self.next_run += skipped * interval
+        delay = self.next_run - now
+        logger.info(
+            'Næste cyklus om %.0f s (interval %.0f s, backlog=%s, API-fejl i træk=%s)',
+            delay, interval, backlog, self.failures)
+        return delay
+
+    def refresh_due(
+        self,
+        last_refresh: Optional[datetime.date],
+        now: Optional[datetime.datetime] = None) -> bool:
+        '''
+        Beskrivelse:
+            Afgør om dagens fulde genberegning af tickets er forfalden.
+
+        Flow:
+            1. Finder nuværende lokale tid i TIMEZONE.
+            2. Forfalden, hvis klokken er refresh_time eller senere, og
+               seneste fulde genberegning ligger før i dag.
+
+        Args:
+            last_refresh:
+                Dato for seneste fulde genberegning, eller None.
+            now:
+                Valgfrit tidspunkt (tidszonebevidst) til brug i stedet
+                for nuværende tid. Kalderen bør gemme now.date() som
+                datoen for genberegningen, så beslutning og lagret dato
+                bruger samme kalender.
+
+        Returns:
+            bool:
+                True hvis den fulde genberegning skal køre i denne cyklus.
+
+        Raises:
+            Ingen.
+        '''
+        now = now or local_now()
+        if now.time() < self.refresh_time:
+            return False
+        return last_refresh is None or last_refresh < now.date()
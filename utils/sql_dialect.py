@@ -0,0 +1,697 @@
+import datetime
+import logging
+import sqlite3
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+from sqlalchemy import inspect
+from sqlalchemy.engine import Connection, Engine
+
+#######################################################################
+
+logger = logging.getLogger(__name__)
+
+# sqlite3's standardadaptere for date/datetime er forældede (Python 3.12).
+# De erstattes her én gang ved import med samme lagringsformat (ISO-tekst).
+# Registreringen er procesbred og gælder alle sqlite3-forbindelser.
+sqlite3.register_adapter(datetime.date, datetime.date.isoformat)
+sqlite3.register_adapter(datetime.datetime, lambda value: value.isoformat(' '))
+
+class SqlDialect:
+    '''
+    Beskrivelse:
+        Databaseafhængig SQL for skrivestien: quoting, temp-tabeller,
+        bulk-indlæsning, set-baseret upsert, genberegning af afledte
+        ticketfelter, upsert af etl_state og skema. Basisklassen
+        implementerer INSERT ... ON CONFLICT, som deles af PostgreSQL og
+        SQLite; MssqlDialect overskriver med MERGE og T-SQL.
+    '''
+
+    name = 'generic'
+    distinct_op = 'IS DISTINCT FROM'
+    now_utc_expr = 'CURRENT_TIMESTAMP'
+    datetime_type = 'TIMESTAMP'
+    float_type = 'DOUBLE PRECISION'
+
+    def quote(self, name: str) -> str:
+        '''
+        Beskrivelse:
+            Quoter et tabel- eller kolonnenavn til brug i rå SQL.
+
+        Args:
+            name:
+                Navnet der skal quotes.
+
+        Returns:
+            str:
+                Navnet i databasens quoting (ANSI "..." her, [...] i
+                MssqlDialect).
+
+        Raises:
+            Ingen.
+        '''
+        return f'"{name}"'
+
+    def temp_name(self, name: str) -> str:
+        '''
+        Beskrivelse:
+            Navnet en temp-tabel skal have i SQL (uden præfiks her, med
+            # i MssqlDialect).
+
+        Args:
+            name:
+                Ønsket navn uden temp-præfiks.
+
+        Returns:
+            str:
+                Temp-tabellens navn.
+
+        Raises:
+            Ingen.
+        '''
+        return name
+
+    def placeholder(self, conn: Connection) -> str:
+        '''
+        Beskrivelse:
+            Driverens positionelle placeholder til exec_driver_sql, som
+            omgår SQLAlchemys parameteroversættelse.
+
+        Flow:
+            1. Læser paramstyle fra forbindelsens dialect.
+            2. qmark giver ?, format og pyformat giver %s.
+
+        Args:
+            conn:
+                Åben SQLAlchemy Connection.
+
+        Returns:
+            str:
+                Placeholderen for én parameter.
+
+        Raises:
+            ValueError:
+                Hvis driveren bruger en anden paramstyle (fx named).
+        '''
+        paramstyle = conn.dialect.paramstyle
+        if paramstyle == 'qmark':
+            return '?'
+        if paramstyle in ('format', 'pyformat'):
+            return '%s'
+        raise ValueError(f'Paramstyle understøttes ikke: {paramstyle}')
+
+    def days_between(self, start: str, end: str) -> str:
+        '''
+        Beskrivelse:
+            SQL-udtryk for antal hele dage fra start til end. Basis-
+            klassen bruger DATE - DATE (PostgreSQL); SqliteDialect
+            overskriver med julianday.
+
+        Args:
+            start:
+                SQL-udtryk for startdatoen.
+            end:
+                SQL-udtryk for slutdatoen.
+
+        Returns:
+            str:
+                SQL-udtrykket (negativt, hvis end ligger før start).
+
+        Raises:
+            Ingen.
+        '''
+        return f'({end} - {start})'
+
+    def create_staging(self, conn: Connection, name: str, source_table: str, columns: Sequence[str]) -> str:
+        '''
+        Beskrivelse:
+            Opretter en tom temp-tabel med samme kolonnetyper som
+            source_table og returnerer dens navn.
+
+        Args:
+            conn:
+                Åben SQLAlchemy Connection.
+            name:
+                Ønsket navn (uden temp-præfiks).
+            source_table:
+                Tabellen kolonnetyperne kopieres fra.
+            columns:
+                Kolonner i temp-tabellen.
+
+        Returns:
+            str:
+                Temp-tabellens navn, som det skal bruges i SQL.
+
+        Raises:
+            sqlalchemy.exc.SQLAlchemyError:
+                Hvis sætningen fejler.
+        '''
+        temp = self.temp_name(name)
+        column_list = ', '.join(self.quote(c) for c in columns)
+        conn.exec_driver_sql(f'DROP TABLE IF EXISTS {temp}')
+        conn.exec_driver_sql(
+            f'CREATE TEMPORARY TABLE {temp} AS SELECT {column_list} FROM {source_table} WHERE 1 = 0')
+        return temp
+
+    def drop_temp(self, conn: Connection, temp: str) -> None:
+        '''
+        Beskrivelse:
+            Fjerner en temp-tabel oprettet med create_staging.
+
+        Args:
+            conn:
+                Åben SQLAlchemy Connection.
+            temp:
+                Temp-tabellens navn, som create_staging returnerede.
+
+        Returns:
+            None.
+
+        Raises:
+            sqlalchemy.exc.SQLAlchemyError:
+                Hvis tabellen ikke findes, eller sætningen fejler.
+        '''
+        conn.exec_driver_sql(f'DROP TABLE {temp}')
+
+    def insert_rows(self, conn: Connection, table: str, columns: Sequence[str], params: List[Tuple[Any, ...]]) -> None:
+        '''
+        Beskrivelse:
+            Indsætter rækketupler i table (typisk en temp-tabel) med ét
+            executemany-kald direkte på driveren.
+
+        Flow:
+            1. Danner INSERT med quotede kolonnenavne og driverens
+               placeholder pr. kolonne.
+            2. Udfører sætningen med exec_driver_sql og alle tupler på
+               én gang, så driveren kan batche (fx fast_executemany i
+               pyodbc).
+
+        Args:
+            conn:
+                Åben SQLAlchemy Connection.
+            table:
+                Tabellens navn, som det skal bruges i SQL.
+            columns:
+                Kolonnerne i samme rækkefølge som værdierne i params.
+            params:
+                Én tuple pr. række.
+
+        Returns:
+            None.
+
+        Raises:
+            sqlalchemy.exc.SQLAlchemyError:
+                Hvis indsættelsen fejler.
+            ValueError:
+                Hvis driverens paramstyle ikke understøttes.
+        '''
+        column_list = ', '.join(self.quote(c) for c in columns)
+        placeholders = ', '.join([self.placeholder(conn)] * len(columns))
+        conn.exec_driver_sql(f'INSERT INTO {table} ({column_list}) VALUES ({placeholders})', params)
+
+    def merge(
+        self,
+        conn: Connection,
+        table: str,
+        staging: str,
+        columns: Sequence[str],
+        key: str,
+        hash_col: Optional[str],
+        touch_cols: Sequence[str] = (),
+        clear_cols: Sequence[str] = (),
+        version_col: Optional[str] = None,
+        frozen_cols: Sequence[str] = ()) -> List[Tuple[str, Any]]:
+        '''
+        Beskrivelse:
+            Upserter alle rækker fra staging til table i én set-baseret
+            sætning og returnerer handlingen pr. berørt nøgle.
+
+        Flow:
+            1. Finder de nøgler i staging, der allerede findes i table,
+               og om deres hash_col afviger.
+            2. INSERT ... SELECT ... ON CONFLICT (key) DO UPDATE, hvor
+               opdateringen springes over, hvis hash_col og touch_cols
+               er uændrede og clear_cols allerede er NULL. clear_cols
+               sættes til NULL ved hver opdatering. Da hash_col dækker alle andre kolonner end
+               touch_cols, skriver en opdatering med uændret hash_col i
+               praksis kun touch_cols. Er version_col angivet, opdateres
+               kun rækker, hvor kildens version_col er mindst lige så ny
+               som målets (eller målets er NULL), og rækker, hvor en af
+               frozen_cols er sat i målet, opdateres ikke. RETURNING
+               giver nøglerne for indsatte og opdaterede rækker.
+            3. Klassificerer hver returneret nøgle som 'INSERT', 'UPDATE'
+               (hash_col ændret) eller 'TOUCH' (kun touch_cols ændret)
+               ud fra trin 1.
+
+        Args:
+            conn:
+                Åben SQLAlchemy Connection i en aktiv transaktion.
+            table:
+                Måltabellen.
+            staging:
+                Temp-tabellen med kilderækkerne.
+            columns:
+                Alle kolonner, inkl. key.
+            key:
+                Nøglekolonnen der matches på (skal være unik i table).
+            hash_col:
+                Valgfri kolonne med rækkefingeraftryk.
+            touch_cols:
+                Kolonner uden for fingeraftrykket, som altid skrives,
+                når de afviger (fx last_updated). Bruges kun med hash_col.
+            clear_cols:
+                Kolonner uden for staging, som nulstilles, når en række
+                upsertes (fx deleted_at).
+            version_col:
+                Valgfri kolonne (fx last_updated), der forhindrer, at en
+                ældre version overskriver en nyere.
+            frozen_cols:
+                Kolonner uden for staging, der låser målrækken, når de er
+                sat (fx deleted_at ved genafspilning).
+
+        Returns:
+            List[Tuple[str, Any]]:
+                ('INSERT' | 'UPDATE' | 'TOUCH', nøgle) for hver berørt
+                række.
+
+        Raises:
+            sqlalchemy.exc.SQLAlchemyError:
+                Hvis sætningen fejler.
+        '''
+        k = self.quote(key)
+        column_list = ', '.join(self.quote(c) for c in columns)
+        if hash_col is not None:
+            h = self.quote(hash_col)
+            existing = dict(conn.exec_driver_sql(
+                f'SELECT s.{k}, CASE WHEN t.{h} IS NULL OR t.{h} <> s.{h} THEN 1 ELSE 0 END '
+                f'FROM {staging} s JOIN {table} t ON t.{k} = s.{k}').fetchall())
+        else:
+            existing = {row[0]: 1 for row in conn.exec_driver_sql(
+                f'SELECT s.{k} FROM {staging} s JOIN {table} t ON t.{k} = s.{k}')}
+        non_key = [self.quote(c) for c in columns if c != key]
+        if non_key:
+            action = 'DO UPDATE SET ' + ', '.join(
+                [f'{c} = excluded.{c}' for c in non_key] + [f'{self.quote(c)} = NULL' for c in clear_cols])
+            conditions = []
+            if hash_col is not None:
+                changed = [f'{table}.{h} IS NULL', f'{table}.{h} <> excluded.{h}'] + [
+                    f'{table}.{self.quote(c)} {self.distinct_op} excluded.{self.quote(c)}'
+                    for c in touch_cols] + [f'{table}.{self.quote(c)} IS NOT NULL' for c in clear_cols]
+                conditions.append(f'({" OR ".join(changed)})')
+            if version_col is not None:
+                v = self.quote(version_col)
+                conditions.append(f'({table}.{v} IS NULL OR excluded.{v} >= {table}.{v})')
+            conditions += [f'{table}.{self.quote(c)} IS NULL' for c in frozen_cols]
+            if conditions:
+                action += ' WHERE ' + ' AND '.join(conditions)
+        else:
+            action = 'DO NOTHING'
+        result = conn.exec_driver_sql(
+            f'INSERT INTO {table} ({column_list}) '
+            f'SELECT {column_list} FROM {staging} WHERE 1 = 1 '
+            f'ON CONFLICT ({k}) {action} '
+            f'RETURNING {k}')
+        actions = {0: 'TOUCH', 1: 'UPDATE', None: 'INSERT'}
+        return [(actions[existing.get(row[0])], row[0]) for row in result]
+
+    def refresh_measures_sql(self, id_table: Optional[str] = None) -> str:
+        '''
+        Beskrivelse:
+            UPDATE-sætning der genberegner days_till_start og
+            offset_duration for åbne tickets (alle, eller kun id'er i
+            id_table) og kun skriver rækker, hvor en værdi ændres. Dags
+            dato bindes som parameteren :today i stedet for at læses fra
+            databaseserverens ur, så resultatet følger schedulerens
+            kalender (TIMEZONE) ligesom derive_measures i Parquet.
+
+        Args:
+            id_table:
+                Temp-tabel med kolonnen id, eller None for alle tickets.
+
+        Returns:
+            str:
+                SQL-sætningen med bind-parameteren :today.
+
+        Raises:
+            Ingen.
+        '''
+        today = ':today'
+        days_till_start = (
+            'CASE '
+            'WHEN start_date IS NULL THEN 0 '
+            f'WHEN start_date <= {today} THEN 0 '
+            f'ELSE {self.days_between(today, "start_date")} END')
+        offset_duration = (
+            'CASE '
+            'WHEN end_date IS NULL THEN 0 '
+            f'WHEN end_date < {today} THEN 0 '
+            'WHEN start_date IS NULL THEN 0 '
+            f'WHEN start_date > {today} THEN duration '
+            f'ELSE {self.days_between(today, "end_date")} + 1 END')
+        id_filter = f' AND id IN (SELECT id FROM {id_table})' if id_table else ''
+        return (
+            f'UPDATE tickets SET days_till_start = {days_till_start}, offset_duration = {offset_duration} '
+            f'WHERE closed_date IS NULL{id_filter} '
+            f'AND (days_till_start {self.distinct_op} {days_till_start} '
+            f'OR offset_duration {self.distinct_op} {offset_duration})')
+
+    def soft_delete_sql(self, id_table: str) -> str:
+        '''
+        Beskrivelse:
+            UPDATE-sætning der soft-deleter tickets: deleted_at sættes
+            til nuværende UTC-tid for tickets med id i id_table.
+
+        Flow:
+            1. Kun tickets hvor deleted_at er NULL, ændres, så
+               tidspunktet for første sletning bevares.
+
+        Args:
+            id_table:
+                Temp-tabel med kolonnen id.
+
+        Returns:
+            str:
+                SQL-sætningen.
+
+        Raises:
+            Ingen.
+        '''
+        return (
+            f'UPDATE tickets SET deleted_at = {self.now_utc_expr} '
+            f'WHERE deleted_at IS NULL AND id IN (SELECT id FROM {id_table})')
+
+    def upsert_state_sql(self) -> str:
+        '''
+        Beskrivelse:
+            Upsert af én række i etl_state med bind-parametrene
+            :source, :watermark, :last_page, :rows_processed og
+            :cycle_duration.
+
+        Flow:
+            1. Findes source ikke, indsættes rækken.
+            2. Ellers opdateres felterne; en parameter med værdien None
+               bevarer den eksisterende værdi (COALESCE).
+            3. updated_at sættes altid til nuværende UTC-tid.
+
+        Args:
+            Ingen.
+
+        Returns:
+            str:
+                SQL-sætningen.
+
+        Raises:
+            Ingen.
+        '''
+        return f'''
+            INSERT INTO etl_state (source, watermark, last_page, rows_processed, cycle_duration, updated_at)
+            VALUES (:source, :watermark, :last_page, :rows_processed, :cycle_duration, {self.now_utc_expr})
+            ON CONFLICT (source) DO UPDATE SET
+                watermark = COALESCE(excluded.watermark, etl_state.watermark),
+                last_page = COALESCE(excluded.last_page, etl_state.last_page),
+                rows_processed = COALESCE(excluded.rows_processed, etl_state.rows_processed),
+                cycle_duration = COALESCE(excluded.cycle_duration, etl_state.cycle_duration),
+                updated_at = excluded.updated_at
+            '''
+
+    def schema_statements(self, conn: Connection) -> List[str]:
+        '''
+        Beskrivelse:
+            Idempotente DDL-sætninger for de tabeller og kolonner,
+            tjenesten bruger. Uden for MSSQL oprettes også tickets og
+            dimensionstabellerne, så skrivestien kan køre mod en tom
+            lokal database.
+
+        Args:
+            conn:
+                Åben SQLAlchemy Connection (bruges til at inspicere
+                eksisterende kolonner).
+
+        Returns:
+            List[str]:
+                Sætninger der køres i rækkefølge.
+
+        Raises:
+            sqlalchemy.exc.SQLAlchemyError:
+                Hvis inspektionen fejler.
+        '''
+        q = self.quote
+        statements = [
+            f'CREATE TABLE IF NOT EXISTS {table} (id BIGINT PRIMARY KEY, {q(label)} VARCHAR(255))'
+            for table, label in (
+                ('agent_groups', 'group'),
+                ('task_types', 'type'),
+                ('task_areas', 'area'),
+                ('task_status', 'status'),
+                ('reasons_for_rejection', 'reason'))]
+        statements.append(f'''
+            CREATE TABLE IF NOT EXISTS tickets (
+                id BIGINT PRIMARY KEY,
+                agent_group_id BIGINT,
+                task_status_id BIGINT,
+                created_date DATE,
+                closed_date DATE,
+                open_days INTEGER,
+                queue_days INTEGER,
+                priority VARCHAR(255),
+                agent VARCHAR(255),
+                {q('user')} VARCHAR(255),
+                ticket_title VARCHAR(1000),
+                start_date DATE,
+                end_date DATE,
+                duration INTEGER,
+                task_type_id BIGINT,
+                task_area_id BIGINT,
+                reason_for_rejection_id BIGINT,
+                last_updated {self.datetime_type},
+                days_till_start INTEGER,
+                offset_duration INTEGER,
+                row_hash BIGINT,
+                deleted_at {self.datetime_type})''')
+        statements.append(f'''
+            CREATE TABLE IF NOT EXISTS etl_state (
+                source VARCHAR(100) NOT NULL PRIMARY KEY,
+                watermark {self.datetime_type} NULL,
+                last_page INTEGER NULL,
+                rows_processed INTEGER NULL,
+                cycle_duration {self.float_type} NULL,
+                updated_at {self.datetime_type} NOT NULL)''')
+        if inspect(conn).has_table('tickets'):
+            columns = {column['name'] for column in inspect(conn).get_columns('tickets')}
+            if 'row_hash' not in columns:
+                statements.append('ALTER TABLE tickets ADD COLUMN row_hash BIGINT')
+            if 'deleted_at' not in columns:
+                statements.append(f'ALTER TABLE tickets ADD COLUMN deleted_at {self.datetime_type}')
+        return statements
+
+class PostgresDialect(SqlDialect):
+    '''PostgreSQL (eksperimentel, ikke testet mod en server): INSERT ... ON CONFLICT, datoaritmetik med DATE - DATE.'''
+
+    name = 'postgresql'
+    now_utc_expr = "(NOW() AT TIME ZONE 'UTC')"
+
+class SqliteDialect(SqlDialect):
+    '''SQLite (3.35+ for RETURNING): datoer som ISO-tekst, julianday til dage.'''
+
+    name = 'sqlite'
+    distinct_op = 'IS NOT'
+    datetime_type = 'DATETIME'
+    float_type = 'REAL'
+
+    def days_between(self, start: str, end: str) -> str:
+        return f'CAST(julianday({end}) - julianday({start}) AS INTEGER)'
+
+class MssqlDialect(SqlDialect):
+    '''SQL Server: #temp-tabeller, SELECT TOP 0 ... INTO og MERGE.'''
+
+    name = 'mssql'
+    now_utc_expr = 'SYSUTCDATETIME()'
+    datetime_type = 'DATETIME2'
+    float_type = 'FLOAT'
+
+    def quote(self, name: str) -> str:
+        return f'[{name}]'
+
+    def temp_name(self, name: str) -> str:
+        return f'#{name}'
+
+    def create_staging(self, conn: Connection, name: str, source_table: str, columns: Sequence[str]) -> str:
+        temp = self.temp_name(name)
+        column_list = ', '.join(self.quote(c) for c in columns)
+        conn.exec_driver_sql(
+            f"IF OBJECT_ID('tempdb..{temp}') IS NOT NULL DROP TABLE {temp}; "
+            f'SELECT TOP 0 {column_list} INTO {temp} FROM {source_table};')
+        return temp
+
+    def merge(
+        self,
+        conn: Connection,
+        table: str,
+        staging: str,
+        columns: Sequence[str],
+        key: str,
+        hash_col: Optional[str],
+        touch_cols: Sequence[str] = (),
+        clear_cols: Sequence[str] = (),
+        version_col: Optional[str] = None,
+        frozen_cols: Sequence[str] = ()) -> List[Tuple[str, Any]]:
+        '''
+        MERGE fra staging til table i én batch. Handlinger og nøgler
+        opsamles via OUTPUT i en tabelvariabel (nøglen forventes at være
+        et heltal). En opdatering, hvor hash_col er uændret (kun
+        touch_cols afviger eller clear_cols nulstilles), markeres som
+        'TOUCH' ud fra deleted.<hash_col>. version_col og frozen_cols
+        begrænser WHEN MATCHED som i SqlDialect.merge.
+        SET NOCOUNT nulstilles til sidst, da indstillingen ellers følger
+        den poolede forbindelse.
+        '''
+        col = self.quote
+        column_list = ', '.join(col(c) for c in columns)
+        update_set = ', '.join(
+            [f'target.{col(c)} = source.{col(c)}' for c in columns if c != key]
+            + [f'target.{col(c)} = NULL' for c in clear_cols])
+        source_vals = ', '.join(f'source.{col(c)}' for c in columns)
+        conditions = []
+        output_action = '$action'
+        if hash_col is not None:
+            h = col(hash_col)
+            changed = [f'target.{h} IS NULL', f'target.{h} <> source.{h}'] + [
+                f'EXISTS (SELECT target.{col(c)} EXCEPT SELECT source.{col(c)})' for c in touch_cols] + [
+                f'target.{col(c)} IS NOT NULL' for c in clear_cols]
+            conditions.append(f'({" OR ".join(changed)})')
+            output_action = (
+                f"CASE WHEN $action = 'UPDATE' AND deleted.{h} = inserted.{h} "
+                "THEN 'TOUCH' ELSE $action END")
+        if version_col is not None:
+            v = col(version_col)
+            conditions.append(f'(target.{v} IS NULL OR source.{v} >= target.{v})')
+        conditions += [f'target.{col(c)} IS NULL' for c in frozen_cols]
+        matched = f'WHEN MATCHED AND {" AND ".join(conditions)} THEN ' if conditions else 'WHEN MATCHED THEN '
+        result = conn.exec_driver_sql(
+            'SET NOCOUNT ON; '
+            'DECLARE @actions TABLE ([action] NVARCHAR(10), [key] BIGINT); '
+            f'MERGE {table} AS target '
+            f'USING {staging} AS source '
+            f'ON target.{col(key)} = source.{col(key)} '
+            f'{matched}'
+            f'UPDATE SET {update_set} '
+            'WHEN NOT MATCHED THEN '
+            f'INSERT ({column_list}) '
+            f'VALUES ({source_vals}) '
+            f'OUTPUT {output_action}, inserted.{col(key)} INTO @actions; '
+            'SELECT [action], [key] FROM @actions; '
+            'SET NOCOUNT OFF;')
+        return [(action, key_value) for action, key_value in result.fetchall()]
+
+    def refresh_measures_sql(self, id_table: Optional[str] = None) -> str:
+        id_filter = f'AND t.id IN (SELECT id FROM {id_table})' if id_table else ''
+        return f'''
+            DECLARE @today date = CAST(:today AS date);
+            WITH src AS (
+                SELECT
+                    t.days_till_start,
+                    t.offset_duration,
+                    CASE
+                        WHEN t.start_date IS NULL THEN 0
+                        WHEN t.start_date <= @today THEN 0
+                        ELSE DATEDIFF(day, @today, t.start_date)
+                    END AS new_days_till_start,
+                    CASE
+                        WHEN t.end_date IS NULL THEN 0
+                        WHEN t.end_date < @today THEN 0
+                        WHEN t.start_date IS NULL THEN 0
+                        WHEN t.start_date > @today THEN t.duration
+                        ELSE DATEDIFF(day, @today, t.end_date) + 1
+                    END AS new_offset_duration
+                FROM tickets t
+                WHERE t.closed_date IS NULL
+                {id_filter}
+            )
+            UPDATE src
+            SET
+                days_till_start = new_days_till_start,
+                offset_duration = new_offset_duration
+            WHERE EXISTS (
+                SELECT days_till_start, offset_duration
+                EXCEPT
+                SELECT new_days_till_start, new_offset_duration);
+            '''
+
+    def upsert_state_sql(self) -> str:
+        return '''
+            MERGE etl_state AS target
+            USING (SELECT
+                :source AS source,
+                CAST(:watermark AS DATETIME2) AS watermark,
+                CAST(:last_page AS INT) AS last_page,
+                CAST(:rows_processed AS INT) AS rows_processed,
+                CAST(:cycle_duration AS FLOAT) AS cycle_duration) AS source
+            ON target.source = source.source
+            WHEN MATCHED THEN
+                UPDATE SET
+                    watermark = COALESCE(source.watermark, target.watermark),
+                    last_page = COALESCE(source.last_page, target.last_page),
+                    rows_processed = COALESCE(source.rows_processed, target.rows_processed),
+                    cycle_duration = COALESCE(source.cycle_duration, target.cycle_duration),
+                    updated_at = SYSUTCDATETIME()
+            WHEN NOT MATCHED THEN
+                INSERT (source, watermark, last_page, rows_processed, cycle_duration, updated_at)
+                VALUES (source.source, source.watermark, source.last_page,
+                        source.rows_processed, source.cycle_duration, SYSUTCDATETIME());
+            '''
+
+    def schema_statements(self, conn: Connection) -> List[str]:
+        '''tickets og dimensionerne vedligeholdes uden for tjenesten på MSSQL.'''
+        return [
+            '''
+            IF COL_LENGTH('tickets', 'row_hash') IS NULL
+                ALTER TABLE tickets ADD row_hash BIGINT NULL;
+            ''',
+            '''
+            IF COL_LENGTH('tickets', 'deleted_at') IS NULL
+                ALTER TABLE tickets ADD deleted_at DATETIME2 NULL;
+            ''',
+            '''
+            IF OBJECT_ID('etl_state', 'U') IS NULL
+                CREATE TABLE etl_state (
+                    source NVARCHAR(100) NOT NULL PRIMARY KEY,
+                    watermark DATETIME2 NULL,
+                    last_page INT NULL,
+                    rows_processed INT NULL,
+                    cycle_duration FLOAT NULL,
+                    updated_at DATETIME2 NOT NULL);
+            ''']
+
+DIALECTS: Dict[str, type] = {
+    'mssql': MssqlDialect,
+    'postgresql': PostgresDialect,
+    'sqlite': SqliteDialect}
+
+_instances: Dict[str, SqlDialect] = {}
+
+def get_dialect(conn: Union[Engine, Connection]) -> SqlDialect:
+    '''
+    Beskrivelse:
+        Returnerer SqlDialect for den database, conn er forbundet til.
+
+    Flow:
+        1. Slår SQLAlchemy-dialektens navn op i DIALECTS.
+        2. Genbruger én instans pr. dialekt.
+
+    Args:
+        conn:
+            SQLAlchemy Engine eller Connection.
+
+    Returns:
+        SqlDialect:
+            Dialekten for databasen.
+
+    Raises:
+        ValueError:
+            Hvis databasen ikke understøttes.
+    '''
+    name = conn.dialect.name
+    if name not in DIALECTS:
+        raise ValueError(f'Databasen understøttes ikke: {name} (understøttet: {", ".join(DIALECTS)})')
+    if name not in _instances:
+        _instances[name] = DIALECTS[name]()
+    return _instances[name]
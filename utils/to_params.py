@@ -0,0 +1,70 @@
+import logging
+from typing import Any, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+#######################################################################
+
+logger = logging.getLogger(__name__)
+
+def native_column(values: pd.Series, as_date: bool = False) -> np.ndarray:
+    '''
+    Beskrivelse:
+        Konverterer én kolonne til et object-array med native
+        Python-værdier og None for NULL, klar til databasedriveren.
+        Bruges både af to_params og af create_ticket_df.
+
+    Flow:
+        1. datetime64-kolonner konverteres til datetime.date, hvis
+           as_date er sat, og ellers til datetime.datetime.
+        2. Øvrige kolonner konverteres via to_numpy(object, na_value=None),
+           som giver int, float, bool og str (og bevarer værdier, der
+           allerede er native, fx datetime.date fra create_ticket_df).
+
+    Args:
+        values:
+            Kolonne fra den DataFrame, der skal eksporteres.
+        as_date:
+            True for datokolonner, der skal gemmes uden klokkeslæt
+            (default False).
+
+    Returns:
+        np.ndarray:
+            object-array med samme længde som values.
+
+    Raises:
+        Ingen.
+    '''
+    if pd.api.types.is_datetime64_any_dtype(values):
+        native = values.dt.date if as_date else values.dt.to_pydatetime()
+        return np.where(values.notna(), native, None)
+    return values.to_numpy(dtype=object, na_value=None)
+
+def to_params(df: pd.DataFrame) -> List[Tuple[Any, ...]]:
+    '''
+    Beskrivelse:
+        Eksporterer df som den parametersekvens, pyodbc's
+        fast_executemany forventer: én tuple pr. række med værdierne i
+        kolonnernes rækkefølge. Konverteringen sker kolonne for kolonne,
+        uden Series- eller dict-objekter pr. række.
+
+    Flow:
+        1. Konverterer hver kolonne én gang til native Python-værdier
+           via native_column.
+        2. Samler kolonnerne til rækketupler med zip.
+
+    Args:
+        df:
+            DataFrame hvis kolonnerækkefølge svarer til placeholders i
+            INSERT-sætningen.
+
+    Returns:
+        List[Tuple[Any, ...]]:
+            Én tuple pr. række i df.
+
+    Raises:
+        Ingen.
+    '''
+    columns = [native_column(df[col]) for col in df.columns]
+    return list(zip(*columns))
@@ -1,35 +1,122 @@
+import datetime
 import logging
+from typing import Any, Dict, List, Optional, Union
 
 import sqlalchemy
-from sqlalchemy.engine import Engine
+from sqlalchemy.engine import Connection, Engine
 from sqlalchemy import text
 
+from utils.etl_state import get_etl_state, update_etl_state
+from utils.scheduler import local_now
+from utils.sql_dialect import SqlDialect, get_dialect
+
 #######################################################################
 
 logger = logging.getLogger(__name__)
 
-def update_tickets(engine: Engine) -> None:
+REFRESH_SOURCE = 'update_tickets'
+
+def _load_touched_ids(conn: Connection, dialect: SqlDialect, ids: List[Any]) -> str:
     '''
     Beskrivelse:
-        Opdaterer afledte felter på åbne tickets i databasen ved at
-        beregne days_till_start og offset_duration for alle rækker
-        i tickets-tabellen, hvor closed_date er NULL.
+        Indlæser id'er i temp-tabellen touched_tickets, så de kan
+        bruges som filter i UPDATE-sætningen.
 
     Flow:
-        1. Sætter en variabel @today til dagens dato (GETDATE()).
-        2. Opdaterer kolonnen days_till_start for alle åbne tickets:
-           - antal dage fra i dag til start_date
-           - sættes til 0 hvis start_date er NULL eller er i dag/fortid.
-        3. Opdaterer kolonnen offset_duration for alle åbne tickets:
-           - sættes til 0 hvis end_date er NULL, før i dag, eller
-             hvis start_date er NULL.
-           - hvis start_date er efter i dag: offset_duration = duration.
-           - ellers: offset_duration = DATEDIFF(day, @today, end_date) + 1.
+        1. Opretter temp-tabellen med samme id-type som tickets.
+        2. Indsætter id'erne med ét executemany-kald.
+
+    Args:
+        conn:
+            Åben SQLAlchemy Connection i en aktiv transaktion.
+        dialect:
+            Databasens SqlDialect.
+        ids:
+            Id'er på de tickets, der skal genberegnes.
+
+    Returns:
+        str:
+            Temp-tabellens navn (fx #touched_tickets på MSSQL).
+
+    Raises:
+        sqlalchemy.exc.SQLAlchemyError:
+            Hvis en af SQL-sætningerne fejler.
+    '''
+    temp = dialect.create_staging(conn, 'touched_tickets', 'tickets', ['id'])
+    dialect.insert_rows(conn, temp, ['id'], [(ticket_id,) for ticket_id in ids])
+    return temp
+
+def get_last_refresh(conn: Union[Engine, Connection]) -> Optional[datetime.date]:
+    '''
+    Beskrivelse:
+        Læser datoen for seneste fulde genberegning fra etl_state.
+
+    Flow:
+        1. Slår source REFRESH_SOURCE op via get_etl_state.
+        2. Returnerer watermark som dato.
+
+    Args:
+        conn:
+            SQLAlchemy Engine eller åben Connection.
+
+    Returns:
+        Optional[datetime.date]:
+            Dato for seneste fulde genberegning, eller None hvis der
+            ikke er lavet nogen endnu.
+
+    Raises:
+        sqlalchemy.exc.SQLAlchemyError:
+            Hvis forespørgslen fejler.
+    '''
+    state = get_etl_state(conn, REFRESH_SOURCE)
+    if state is None or state.watermark is None:
+        return None
+    return state.watermark.date()
+
+def update_tickets(
+    engine: Engine,
+    ids: Optional[List[Any]] = None,
+    today: Optional[datetime.date] = None) -> None:
+    '''
+    Beskrivelse:
+        Opdaterer afledte felter (days_till_start og offset_duration) på
+        åbne tickets i databasen. Felterne afhænger kun af dags dato og
+        ticketens egne datoer, så de genberegnes fuldt én gang pr. dag
+        (i schedulerens daglige slot) og ellers kun for de tickets, som
+        cyklussen har skrevet.
+
+    Flow:
+        1. Er ids None, laves fuld genberegning: alle tickets hvor
+           closed_date er NULL. today (schedulerens lokale dato i
+           TIMEZONE) gemmes som seneste fulde genberegning i etl_state
+           (source 'update_tickets') i samme transaktion, så
+           Scheduler.refresh_due sammenligner med samme kalender, som
+           den selv bruger.
+        2. Ellers genberegnes kun tickets i ids (via temp-tabellen
+           touched_tickets).
+           Er ids tom, gøres intet.
+        3. I begge tilfælde beregnes:
+           - days_till_start: antal dage fra i dag til start_date,
+             0 hvis start_date er NULL eller er i dag/fortid.
+           - offset_duration: 0 hvis end_date er NULL, før i dag, eller
+             hvis start_date er NULL; duration hvis start_date er efter
+             i dag; ellers antal dage fra i dag til end_date + 1.
+           Kun rækker hvor en af værdierne faktisk ændres, skrives.
+           SQL'en leveres af databasens SqlDialect, og today bindes som
+           parameter, så databaseserverens ur og tidszone ikke spiller
+           ind.
 
     Args:
         engine:
             En SQLAlchemy Engine-instans med forbindelse til
             databasen, hvor tickets-tabellen findes.
+        ids:
+            Id'er på tickets skrevet i denne cyklus, eller None for
+            fuld genberegning.
+        today:
+            Dags dato for beregningen (og den dato der gemmes for en
+            fuld genberegning), typisk local_now().date() fra
+            schedulerens beslutning (default dags dato i TIMEZONE).
 
     Returns:
         None. Effekten er udelukkende opdateringer i databasen
@@ -41,29 +128,56 @@ def update_tickets(engine: Engine) -> None:
             forbindelsesproblemer eller låsefejl i databasen.
     '''
     logger.info('Opdaterer tickets')
-    update_query = '''
-    DECLARE @today date = CAST(GETDATE() AS date);
-    UPDATE t
-    SET
-        days_till_start = CASE
-            WHEN t.start_date IS NULL THEN 0
-            WHEN t.start_date <= @today THEN 0
-            ELSE DATEDIFF(day, @today, t.start_date)
-        END,
-        offset_duration = CASE
-            WHEN t.end_date IS NULL THEN 0
-            WHEN t.end_date < @today THEN 0
-            WHEN t.start_date IS NULL THEN 0
-            WHEN t.start_date > @today THEN t.duration
-            ELSE DATEDIFF(day, @today, t.end_date) + 1
-        END
-    FROM tickets t
-    WHERE t.closed_date IS NULL;
-    '''
     try:
         with engine.begin() as conn:
-            conn.execute(text(update_query))
-            logger.info('tickets opdateret')
+            dialect = get_dialect(conn)
+            today = today or local_now().date()
+            if ids is None:
+                result = conn.execute(text(dialect.refresh_measures_sql()), {'today': today})
+                update_etl_state(
+                    conn, REFRESH_SOURCE,
+                    watermark=datetime.datetime.combine(today, datetime.time()))
+                logger.info('tickets opdateret (fuld genberegning, %s rækker ændret)', result.rowcount)
+            elif ids:
+                touched = _load_touched_ids(conn, dialect, ids)
+                result = conn.execute(text(dialect.refresh_measures_sql(touched)), {'today': today})
+                dialect.drop_temp(conn, touched)
+                logger.info(
+                    'tickets opdateret (%s berørte, %s rækker ændret)',
+                    len(ids), result.rowcount)
+            else:
+                logger.info('Ingen berørte tickets at opdatere')
     except sqlalchemy.exc.SQLAlchemyError as exc:
         logger.error('Fejl ved opdatering af tickets: %s', exc, exc_info=True)
-        raise
\ No newline at end of file
+        raise
+
+def refresh_committed(engines: Dict[str, Engine], touched_ids: Dict[str, List[Any]]) -> None:
+    '''
+    Beskrivelse:
+        Opdaterer afledte felter for de tickets, der nåede at blive
+        committet, før en cyklus fejlede. Bruges i en except-blok, så
+        de allerede skrevne tickets ikke står med forældede værdier,
+        indtil de ændres igen eller næste fulde genberegning kører.
+
+    Flow:
+        1. Kalder update_tickets med id'erne for hver måldatabase.
+        2. En fejl her logges og sluges, så kalderen kan hæve den
+           oprindelige fejl.
+
+    Args:
+        engines:
+            Engine pr. target.
+        touched_ids:
+            Id'er på committede tickets pr. target.
+
+    Returns:
+        None.
+
+    Raises:
+        Ingen.
+    '''
+    for target, target_engine in engines.items():
+        try:
+            update_tickets(target_engine, touched_ids.get(target, []))
+        except sqlalchemy.exc.SQLAlchemyError:
+            logger.error('Committede tickets kunne ikke opdateres efter fejl (%s)', target or 'standarddatabase')
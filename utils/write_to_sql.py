@@ -1,118 +1,344 @@
 import logging
-from typing import Tuple, List
+import time
+from typing import Any, Dict, Tuple, List, Optional
 
 import pandas as pd
 import sqlalchemy
-from sqlalchemy import text
 from sqlalchemy.engine import Engine
 
+from config import WRITE_CHUNK_SIZE, WRITE_RETRIES, WRITE_RETRY_DELAY
+
+from utils.bulk_merge import bulk_merge
 from utils.create_dim_df import create_dim_df
-from utils.create_ticket_df import create_ticket_df
+from utils.create_ticket_df import TOUCH_COLS, create_ticket_df
+from utils.dim_cache import (
+    changed_dim_rows,
+    invalidate_dim_cache,
+    is_dim_cache_loaded,
+    load_dim_cache,
+    update_dim_cache)
+from utils.etl_state import update_etl_state
+from utils.metrics import count_rows, observe, timed
 
 #######################################################################
 
 logger = logging.getLogger(__name__)
 
-def write_to_sql(engine: Engine, df: pd.DataFrame) -> None:
+DimTables = List[Tuple[str, pd.DataFrame, str]]
+
+# Sættes af afstemningen (utils/reconcile.py) og nulstilles, når NSP
+# leverer ticketen igen
+SOFT_DELETE_COL = 'deleted_at'
+
+# En ældre version af en ticket (fx fra sidelageret) må ikke overskrive
+# en nyere i tabellen
+VERSION_COL = 'last_updated'
+
+def _is_transient(exc: sqlalchemy.exc.SQLAlchemyError) -> bool:
     '''
     Beskrivelse:
-        Skriver dimensionstabeller og tickets til SQL-databasen via upserts
-        baseret på et allerede formatteret DataFrame.
+        Afgør, om en databasefejl kan forventes at gå over, så chunken
+        bør forsøges igen.
 
     Flow:
-        1. Danner fem dimensionstabeller ud fra det rå DataFrame:
+        1. OperationalError (fx afbrudt forbindelse, timeout, deadlock
+           eller låst database) er forbigående.
+        2. Øvrige DBAPIError er kun forbigående, hvis SQLAlchemy har
+           markeret forbindelsen som ugyldig (connection_invalidated).
+        3. Alt andet (fx IntegrityError, ProgrammingError eller fejl i
+           selve SQL'en) vil fejle igen og er ikke forbigående.
+
+    Args:
+        exc:
+            Fejlen fra skrivningen.
+
+    Returns:
+        bool:
+            True hvis chunken bør forsøges igen.
+
+    Raises:
+        Ingen.
+    '''
+    if isinstance(exc, sqlalchemy.exc.OperationalError):
+        return True
+    return isinstance(exc, sqlalchemy.exc.DBAPIError) and exc.connection_invalidated
+
+def _write_chunk(
+    engine: Engine,
+    chunk_df: pd.DataFrame,
+    state: Optional[Dict[str, Any]],
+    restore_deleted: bool = True) -> Tuple[Dict[str, int], List[Any]]:
+    '''
+    Beskrivelse:
+        Upserter én chunk af ticket_df i sin egen transaktion og flytter
+        checkpointet i etl_state i samme transaktion. Fejler chunken
+        med en forbigående fejl, forsøges den igen op til WRITE_RETRIES
+        gange.
+
+    Flow:
+        1. Åbner en transaktion, upserter chunken via bulk_merge og
+           opdaterer etl_state med state. Rækker med en ældre
+           last_updated end tabellens springes over (VERSION_COL). Med
+           restore_deleted nulstilles deleted_at; ellers lades
+           soft-deletede tickets urørt.
+        2. Ved SQLAlchemyError rulles kun denne chunk tilbage. Er
+           fejlen forbigående (_is_transient), ventes WRITE_RETRY_DELAY
+           sekunder gange forsøgsnummeret, hvorefter chunken forsøges
+           igen.
+        3. Øvrige fejl hæves straks, ligesom fejlen når alle forsøg er
+           brugt.
+
+    Args:
+        engine:
+            SQLAlchemy Engine-instans med forbindelse til databasen.
+        chunk_df:
+            Udsnit af ticket_df.
+        state:
+            Nøgleord til update_etl_state, eller None.
+        restore_deleted:
+            True hvis soft-deletede tickets gendannes (default True).
+
+    Returns:
+        Tuple[Dict[str, int], List[Any]]:
+            Resultatet af bulk_merge for chunken.
+
+    Raises:
+        sqlalchemy.exc.SQLAlchemyError:
+            Hvis chunken fejler med en fejl, der ikke er forbigående,
+            eller fejler i alle forsøg.
+    '''
+    attempt = 0
+    while True:
+        try:
+            with engine.begin() as conn:
+                result = bulk_merge(
+                    conn, 'tickets', chunk_df,
+                    hash_col='row_hash', touch_cols=TOUCH_COLS,
+                    clear_cols=[SOFT_DELETE_COL] if restore_deleted else [],
+                    version_col=VERSION_COL,
+                    frozen_cols=[] if restore_deleted else [SOFT_DELETE_COL])
+                if state is not None:
+                    update_etl_state(conn, **state)
+            return result
+        except sqlalchemy.exc.SQLAlchemyError as exc:
+            attempt += 1
+            if attempt > WRITE_RETRIES or not _is_transient(exc):
+                raise
+            delay = WRITE_RETRY_DELAY * attempt
+            logger.warning(
+                'Fejl ved skrivning af chunk (forsøg %s af %s), prøver igen om %.0f s: %s',
+                attempt, WRITE_RETRIES + 1, delay, exc)
+            time.sleep(delay)
+
+def prepare_sql_frames(df: pd.DataFrame) -> Tuple[DimTables, pd.DataFrame]:
+    '''
+    Beskrivelse:
+        Danner de DataFrames, der skrives til SQL, ud fra et formatteret
+        DataFrame. Rører ikke databasen og kan derfor køre i et andet
+        trin end skrivningen (se run_pipeline).
+
+    Flow:
+        1. Danner fem dimensionstabeller via create_dim_df:
            - agent_groups
            - task_types
            - task_areas
            - task_status
            - reasons_for_rejection
         2. Danner et normaliseret ticket_df (facts) via create_ticket_df.
-        3. Upserter hver række i dimensionstabellerne med MERGE:
-           - Matcher på id
-           - Opdaterer label-kolonnen ved match
-           - Indsætter ny række ved ikke-match
-        4. Upserter hver række i ticket_df til tickets-tabellen med MERGE:
+        3. Registrerer varighed og antal rækker for begge trin i metrics.
+
+    Args:
+        df:
+            Rå DataFrame med ticket-data (samme som efter format_df).
+
+    Returns:
+        Tuple[DimTables, pd.DataFrame]:
+            Liste af (tabelnavn, dim_df, label-kolonne) for hver
+            dimension samt ticket_df.
+
+    Raises:
+        KeyError:
+            Hvis forventede kolonner mangler i df.
+    '''
+    with timed('create_dim_df'):
+        dim_tables: DimTables = [
+            ('agent_groups', create_dim_df(df, 'AgentGroup.Id', 'AgentGroup', 'id', 'group'), 'group'),
+            ('task_types', create_dim_df(df, 'u_Opgavetype.Id', 'u_Opgavetype', 'id', 'type'), 'type'),
+            ('task_areas', create_dim_df(df, 'u_Omrder.Id', 'u_Omrder', 'id', 'area'), 'area'),
+            ('task_status', create_dim_df(df, 'BaseEntityStatus.Id', 'BaseEntityStatus', 'id', 'status'), 'status'),
+            ('reasons_for_rejection', create_dim_df(
+                df, 'u_Afvisningsrsag.Id', 'u_Afvisningsrsag', 'id', 'reason'), 'reason')]
+    with timed('create_ticket_df'):
+        ticket_df = create_ticket_df(df)
+    count_rows('create_ticket_df', len(ticket_df))
+    return dim_tables, ticket_df
+
+def write_sql_frames(
+    engine: Engine,
+    frames: Tuple[DimTables, pd.DataFrame],
+    state: Optional[Dict[str, Any]] = None,
+    chunk_size: int = WRITE_CHUNK_SIZE,
+    restore_deleted: bool = True) -> Tuple[Dict[str, int], List[Any]]:
+    '''
+    Beskrivelse:
+        Skriver dimensionstabeller og tickets fra prepare_sql_frames til
+        SQL-databasen via upserts. Tickets skrives i chunks, der hver
+        committes for sig, så en stor backfill ikke holder låse på
+        tickets under hele kørslen, og så en fejl ikke ruller allerede
+        skrevne chunks tilbage.
+
+    Flow:
+        1. Sammenligner dimensionstabellerne med dimensionscachen og
+           upserter kun nye eller ændrede rækker, med ét bulk_merge pr.
+           tabel i én transaktion. Er intet ændret, skrives der ikke til
+           tabellen. Cachen opdateres, når transaktionen er committet.
+        2. Upserter ticket_df til tickets-tabellen i chunks af
+           chunk_size rækker via _write_chunk. Hver chunk indlæses i en
+           staging-tabel med ét executemany-kald, hvorefter én
+           set-baseret MERGE:
            - Matcher på id
-           - Opdaterer alle øvrige kolonner ved match
+           - Opdaterer alle øvrige kolonner ved match, hvis row_hash
+             er ændret
+           - Skriver ellers kun last_updated (TOUCH_COLS), hvis den er
+             ændret, så kolonnen følger NSP (tælles som uændret)
+           - Springer rækker over, hvis last_updated er ældre end
+             tabellens, så en ældre version ikke overskriver en nyere
+           - Nulstiller deleted_at, så en soft-deleted ticket, der
+             leveres af NSP igen, straks er aktiv. Med restore_deleted
+             False (genafspilning) lades soft-deletede tickets i stedet
+             urørt
            - Indsætter ny række ved ikke-match
+        3. Hver chunk committes sammen med et checkpoint i etl_state
+           (state, hvor rows_processed tælles op med de rækker, der er
+           skrevet indtil nu), og antal rækker og rækker/s logges.
+           Varighed og antal rækker registreres i metrics pr.
+           dimensionstabel og pr. ticket-chunk ('upsert_tickets').
+           Fejler en chunk efter alle genforsøg, bevares de tidligere
+           chunks, og fejlen hæves med id'erne for de indsatte og
+           opdaterede tickets i de committede chunks som
+           exc.touched_ids, så kalderen kan opdatere deres afledte
+           felter (refresh_committed). Da watermark først flyttes, når
+           cyklussen er gennemført, hentes de samme tickets igen i næste
+           cyklus, hvor de allerede skrevne springes over via row_hash.
 
     Args:
         engine:
             SQLAlchemy Engine-instans med forbindelse til databasen.
-        df:
-            Rå DataFrame med ticket-data (samme som efter format_df),
-            der indeholder alle nødvendige kolonner til både dimensioner
-            og tickets.
+        frames:
+            Dimensionstabeller og ticket_df fra prepare_sql_frames.
+        state:
+            Valgfrie nøgleord til update_etl_state (fx last_page og
+            rows_processed), der skrives i samme transaktion som hver
+            chunk. rows_processed angiver antal rækker skrevet før denne
+            kørsel.
+        chunk_size:
+            Antal tickets pr. transaktion (default WRITE_CHUNK_SIZE).
+        restore_deleted:
+            False for at lade soft-deletede tickets urørt, fx ved
+            genafspilning af gemte sider (default True).
 
     Returns:
-        None. Effekten er udelukkende opdateringer/indsættelser
-        i databasen.
+        Tuple[Dict[str, int], List[Any]]:
+            Antal tickets der blev indsat ('inserted'), opdateret
+            ('updated') og sprunget over som uændrede ('skipped'),
+            samt id'erne for de indsatte og opdaterede tickets.
 
     Raises:
         sqlalchemy.exc.SQLAlchemyError:
-            Hvis en databasefejl opstår under transaktionen, fx
-            ved låseproblemer eller forbindelsesfejl.
+            Hvis dimensionerne ikke kan skrives (dimensionscachen
+            invalideres i så fald), eller hvis en ticket-chunk fejler i
+            alle forsøg. I sidste tilfælde har undtagelsen attributten
+            touched_ids.
     '''
     logger.info('Skriver til SQL')
-    agent_groups_df = create_dim_df(df, 'AgentGroup.Id', 'AgentGroup', 'id', 'group')
-    task_types_df = create_dim_df(df, 'u_Opgavetype.Id', 'u_Opgavetype', 'id', 'type')
-    task_areas_df = create_dim_df(df, 'u_Omrder.Id', 'u_Omrder', 'id', 'area')
-    task_status_df = create_dim_df(df, 'BaseEntityStatus.Id', 'BaseEntityStatus', 'id', 'status')
-    reasons_for_rejection_df = create_dim_df(df, 'u_Afvisningsrsag.Id', 'u_Afvisningsrsag', 'id', 'reason')
-    ticket_df = create_ticket_df(df)
-
-    dim_tables: List[Tuple[str, pd.DataFrame, str]] = [
-        ('agent_groups', agent_groups_df, 'group'),
-        ('task_types', task_types_df, 'type'),
-        ('task_areas', task_areas_df, 'area'),
-        ('task_status', task_status_df, 'status'),
-        ('reasons_for_rejection', reasons_for_rejection_df, 'reason')]
-
+    dim_tables, ticket_df = frames
+    written: DimTables = []
     try:
+        if not is_dim_cache_loaded(engine):
+            load_dim_cache(engine)
         with engine.begin() as conn:
             for table_name, dim_df, label_col in dim_tables:
-                for _, row in dim_df.iterrows():
-                    conn.execute(
-                        text(
-                            f'''
-                            MERGE {table_name} AS target
-                            USING (SELECT :id AS id, :label AS label) AS source
-                            ON target.id = source.id
-                            WHEN MATCHED THEN
-                                UPDATE SET [{label_col}] = source.label
-                            WHEN NOT MATCHED THEN
-                                INSERT (id, [{label_col}])
-                                VALUES (source.id, source.label);
-                            '''),
-                        {'id': row['id'], 'label': row[label_col]})
-                logger.info('%s upserted (%s rows)', table_name, len(dim_df))
-
-            all_cols = list(ticket_df.columns)
-            non_id_cols = [c for c in all_cols if c != 'id']
-
-            def col(column_name: str) -> str:
-                return f'[{column_name}]'
-
-            source_select = ', '.join([f':{c} AS {col(c)}' for c in all_cols])
-            update_set = ', '.join([f'target.{col(c)} = source.{col(c)}' for c in non_id_cols])
-            insert_cols = ', '.join([col(c) for c in all_cols])
-            insert_vals = ', '.join([f'source.{col(c)}' for c in all_cols])
-
-            merge_sql = text(
-                'MERGE tickets AS target '
-                f'USING (SELECT {source_select}) AS source '
-                'ON target.id = source.id '
-                'WHEN MATCHED THEN '
-                f'UPDATE SET {update_set} '
-                'WHEN NOT MATCHED THEN '
-                f'INSERT ({insert_cols}) '
-                f'VALUES ({insert_vals});')
-
-            for _, row in ticket_df.iterrows():
-                params = row.to_dict()
-                conn.execute(merge_sql, params)
-
-            logger.info('tickets upserted (%s rows)', len(ticket_df))
+                changed_df = changed_dim_rows(engine, table_name, dim_df, label_col)
+                if changed_df.empty:
+                    logger.debug('%s uændret', table_name)
+                    continue
+                with timed(f'upsert_{table_name}'):
+                    bulk_merge(conn, table_name, changed_df)
+                count_rows(f'upsert_{table_name}', len(changed_df))
+                written.append((table_name, changed_df, label_col))
+                logger.info('%s upserted (%s rows)', table_name, len(changed_df))
     except sqlalchemy.exc.SQLAlchemyError as exc:
-        logger.error('Fejl ved skrivning til SQL: %s', exc, exc_info=True)
-        raise
\ No newline at end of file
+        logger.error('Fejl ved skrivning af dimensioner til SQL: %s', exc, exc_info=True)
+        invalidate_dim_cache(engine)
+        raise
+    update_dim_cache(engine, written)
+
+    counts = {'inserted': 0, 'updated': 0, 'skipped': 0}
+    touched_ids: List[Any] = []
+    base_rows = (state or {}).get('rows_processed') or 0
+    chunk_size = max(chunk_size, 1)
+    for offset in range(0, len(ticket_df), chunk_size):
+        chunk_df = ticket_df.iloc[offset:offset + chunk_size]
+        chunk_state = None
+        if state is not None:
+            chunk_state = {**state, 'rows_processed': base_rows + offset + len(chunk_df)}
+        started = time.perf_counter()
+        try:
+            chunk_counts, chunk_ids = _write_chunk(engine, chunk_df, chunk_state, restore_deleted)
+        except sqlalchemy.exc.SQLAlchemyError as exc:
+            logger.error(
+                'Fejl ved skrivning af tickets %s-%s af %s; %s rækker er allerede committet: %s',
+                offset + 1, offset + len(chunk_df), len(ticket_df), offset, exc, exc_info=True)
+            exc.touched_ids = touched_ids
+            raise
+        elapsed = time.perf_counter() - started
+        observe('upsert_tickets', elapsed)
+        count_rows('upsert_tickets', len(chunk_df))
+        for action, count in chunk_counts.items():
+            counts[action] += count
+        touched_ids.extend(chunk_ids)
+        logger.info(
+            'tickets %s-%s af %s skrevet på %.2f s (%.0f rækker/s)',
+            offset + 1, offset + len(chunk_df), len(ticket_df),
+            elapsed, len(chunk_df) / elapsed if elapsed > 0 else 0.0)
+
+    logger.info(
+        'tickets upserted (%s indsat, %s opdateret, %s uændret)',
+        counts['inserted'], counts['updated'], counts['skipped'])
+    return counts, touched_ids
+
+def write_to_sql(
+    engine: Engine,
+    df: pd.DataFrame,
+    state: Optional[Dict[str, Any]] = None,
+    chunk_size: int = WRITE_CHUNK_SIZE) -> Tuple[Dict[str, int], List[Any]]:
+    '''
+    Beskrivelse:
+        Danner og skriver dimensionstabeller og tickets for et
+        formatteret DataFrame i ét kald.
+
+    Flow:
+        1. Danner DataFrames via prepare_sql_frames.
+        2. Skriver dem via write_sql_frames.
+
+    Args:
+        engine:
+            SQLAlchemy Engine-instans med forbindelse til databasen.
+        df:
+            Rå DataFrame med ticket-data (samme som efter format_df).
+        state:
+            Valgfrie nøgleord til update_etl_state, se write_sql_frames.
+        chunk_size:
+            Antal tickets pr. transaktion (default WRITE_CHUNK_SIZE).
+
+    Returns:
+        Tuple[Dict[str, int], List[Any]]:
+            Se write_sql_frames.
+
+    Raises:
+        KeyError:
+            Hvis forventede kolonner mangler i df.
+        sqlalchemy.exc.SQLAlchemyError:
+            Se write_sql_frames.
+    '''
+    return write_sql_frames(engine, prepare_sql_frames(df), state, chunk_size)